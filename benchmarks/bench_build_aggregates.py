@@ -0,0 +1,121 @@
+"""
+So sánh build_aggregates (sort theo nhóm) với bản groupby + lambda cũ trên dữ liệu
+giả lập cỡ thật: 10 năm x 11 ngày x 24 giờ x 5 param.
+
+Chạy từ thư mục gốc repo:
+    python benchmarks/bench_build_aggregates.py
+"""
+
+import sys
+import time
+from functools import reduce
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from core.analysis import build_aggregates  # noqa: E402
+
+PARAMETERS = ["T2M", "RH2M", "PRECTOTCORR", "ALLSKY_SFC_SW_DWN", "WS2M"]
+
+
+def build_aggregates_legacy(raw_df: pd.DataFrame, parameters):
+    """Bản cũ: groupby().agg với 2 lambda percentile cho mỗi param rồi merge."""
+    groups = raw_df.groupby(["month", "day", "hour"])
+    agg_frames = []
+    for p in parameters:
+        agg = (
+            groups[p]
+            .agg(
+                [
+                    ("hist_mean", "mean"),
+                    ("hist_std", "std"),
+                    ("hist_median", "median"),
+                    (
+                        "hist_q05",
+                        lambda x: (
+                            np.nanpercentile(x.dropna(), 5)
+                            if len(x.dropna()) > 0
+                            else np.nan
+                        ),
+                    ),
+                    (
+                        "hist_q95",
+                        lambda x: (
+                            np.nanpercentile(x.dropna(), 95)
+                            if len(x.dropna()) > 0
+                            else np.nan
+                        ),
+                    ),
+                    ("hist_count", "count"),
+                ]
+            )
+            .reset_index()
+        )
+        agg = agg.rename(columns={c: f"{p}_{c}" for c in agg.columns if "hist" in c})
+        agg_frames.append(agg)
+    return reduce(
+        lambda left, right: left.merge(right, on=["month", "day", "hour"], how="outer"),
+        agg_frames,
+    )
+
+
+def make_raw_df(years: int = 10, window: int = 5, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    frames = []
+    for year in range(2015, 2015 + years):
+        center = pd.Timestamp(year=year, month=10, day=5)
+        index = pd.date_range(
+            center - pd.Timedelta(days=window),
+            center + pd.Timedelta(days=window, hours=23),
+            freq="h",
+        )
+        data = {p: rng.normal(10, 3, len(index)) for p in PARAMETERS}
+        frames.append(pd.DataFrame(data, index=index))
+    raw_df = pd.concat(frames)
+    # vài giá trị thiếu để kiểm tra xử lý NaN
+    raw_df.iloc[::97, 0] = np.nan
+    raw_df["year"] = raw_df.index.year
+    raw_df["month"] = raw_df.index.month
+    raw_df["day"] = raw_df.index.day
+    raw_df["hour"] = raw_df.index.hour
+    return raw_df
+
+
+def best_of(fn, repeat: int = 5) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    raw_df = make_raw_df()
+    legacy = build_aggregates_legacy(raw_df, PARAMETERS)
+    fast = build_aggregates(raw_df, PARAMETERS)
+
+    assert list(legacy.columns) == list(fast.columns), "column mismatch"
+    assert len(legacy) == len(fast), "row mismatch"
+    for column in legacy.columns:
+        np.testing.assert_allclose(
+            legacy[column].to_numpy(dtype=float),
+            fast[column].to_numpy(dtype=float),
+            rtol=1e-9,
+            atol=1e-9,
+            err_msg=column,
+        )
+
+    t_legacy = best_of(lambda: build_aggregates_legacy(raw_df, PARAMETERS))
+    t_fast = best_of(lambda: build_aggregates(raw_df, PARAMETERS))
+    print(f"rows={len(raw_df)} groups={len(fast)} params={len(PARAMETERS)}")
+    print(f"legacy groupby+lambda: {t_legacy * 1000:8.1f} ms")
+    print(f"sort-based kernel:     {t_fast * 1000:8.1f} ms")
+    print(f"speedup:               {t_legacy / t_fast:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
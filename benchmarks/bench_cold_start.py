@@ -0,0 +1,91 @@
+"""
+Đo thời gian cold import `main` (như 1 worker uvicorn mới khởi động) trong các
+process Python riêng, và fail nếu vượt budget hoặc nếu các thư viện nặng bị import
+ngay từ đầu thay vì khi dùng lần đầu.
+
+Chạy từ thư mục gốc repo:
+    python benchmarks/bench_cold_start.py
+    COLD_START_BUDGET=1.5 COLD_START_RUNS=7 python benchmarks/bench_cold_start.py
+"""
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# giây, so với trung vị các lần chạy
+COLD_START_BUDGET = float(os.getenv("COLD_START_BUDGET", 2.0))
+COLD_START_RUNS = int(os.getenv("COLD_START_RUNS", 5))
+
+# không được có trong sys.modules sau khi import main
+LAZY_MODULES = [
+    "lightgbm",
+    "xgboost",
+    "sklearn",
+    "scipy",
+    "plotly",
+    "matplotlib",
+    "seaborn",
+    "geocoder",
+    "opencage",
+]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(json.dumps({"elapsed": elapsed, "modules": sorted(sys.modules)}))
+"""
+
+
+def measure_once() -> dict:
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    # lần đầu có thể phải compile .pyc, không tính
+    measure_once()
+    runs = [measure_once() for _ in range(COLD_START_RUNS)]
+    timings = [run["elapsed"] for run in runs]
+    loaded = sorted(
+        {
+            name
+            for name in LAZY_MODULES
+            for module in runs[-1]["modules"]
+            if module == name or module.startswith(name + ".")
+        }
+    )
+
+    median = statistics.median(timings)
+    print(f"runs={len(timings)} budget={COLD_START_BUDGET:.2f} s")
+    print(f"import main (min):    {min(timings) * 1000:8.1f} ms")
+    print(f"import main (median): {median * 1000:8.1f} ms")
+    print(f"eager heavy modules:  {', '.join(loaded) or '-'}")
+
+    failures = []
+    if median > COLD_START_BUDGET:
+        failures.append(
+            f"cold import {median:.2f} s exceeds budget {COLD_START_BUDGET:.2f} s"
+        )
+    if loaded:
+        failures.append(f"imported eagerly: {', '.join(loaded)}")
+    if failures:
+        print("FAIL: " + "; ".join(failures))
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
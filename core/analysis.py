@@ -1,131 +1,139 @@
 import json
-from typing import List, Dict
+import threading
+from pathlib import Path
+from typing import TYPE_CHECKING, List, Dict, NamedTuple, Optional, Tuple
 from datetime import datetime
 
 import numpy as np
 import pandas as pd
-import seaborn as sns
-import plotly.graph_objects as go
-import matplotlib.pyplot as plt
-import lightgbm as lgb
 
+# lightgbm/plotly import khi dùng lần đầu để import app (cold start) nhanh
+if TYPE_CHECKING:
+    import lightgbm as lgb
 
-with open("core/thresholds.json", "r", encoding="utf-8") as f:
+from core.registry import model_registry
+from core.scheduler import training_scheduler
+from core.singleflight import SingleFlight
+
+with open(Path(__file__).with_name("thresholds.json"), "r", encoding="utf-8") as f:
     PARAMETER = json.load(f)
 
 
-def compute_ci_multitarget(
-    raw_df: pd.DataFrame,
-    parameters: List[str],
-    target_dt: datetime,
-    ci_levels: List[float] = [0.3, 0.6, 0.9],
-) -> pd.DataFrame:
-    hours = range(24)
-    pred_dt_index = [
-        target_dt.replace(hour=h, minute=0, second=0, microsecond=0) for h in hours
+class ThresholdBins(NamedTuple):
+    """Các ngưỡng của 1 param đã biên dịch thành mảng biên, sắp xếp theo lower."""
+
+    lowers: np.ndarray
+    uppers: np.ndarray
+    # order[i] = vị trí trong list thresholds gốc của bin thứ i
+    order: np.ndarray
+    thresholds: List[Dict]
+
+
+def compile_thresholds(thresholds: List[Dict]) -> ThresholdBins:
+    """
+    Đổi list ngưỡng [{lower, upper, ...}] (có thể là chuỗi "inf"/"-inf") thành mảng
+    biên. Các ngưỡng không được chồng nhau (chỉ chung biên), khi đó giá trị nằm
+    đúng biên thuộc ngưỡng thấp hơn, như khi duyệt tuần tự list ngưỡng.
+    """
+    lowers = np.array([float(t["lower"]) for t in thresholds], dtype=np.float64)
+    uppers = np.array([float(t["upper"]) for t in thresholds], dtype=np.float64)
+    order = np.argsort(lowers, kind="stable")
+    lowers, uppers = lowers[order], uppers[order]
+    if np.any(uppers < lowers) or np.any(lowers[1:] < uppers[:-1]):
+        raise ValueError("Thresholds must be non-overlapping intervals")
+    return ThresholdBins(lowers, uppers, order, thresholds)
+
+
+# biên dịch 1 lần cho mọi param trong thresholds.json
+THRESHOLD_BINS = {p: compile_thresholds(v["thresholds"]) for p, v in PARAMETER.items()}
+
+
+def classify_values(values, bins: ThresholdBins) -> np.ndarray:
+    """Chỉ số ngưỡng (trong list gốc) của từng giá trị, -1 nếu không thuộc ngưỡng nào."""
+    values = np.asarray(values, dtype=np.float64)
+    # bin đầu tiên có upper >= val, rồi kiểm tra val >= lower (NaN/khoảng trống -> -1)
+    idx = np.searchsorted(bins.uppers, values, side="left")
+    valid = idx < len(bins.uppers)
+    idx = np.minimum(idx, len(bins.uppers) - 1)
+    valid &= values >= bins.lowers[idx]
+    return np.where(valid, bins.order[idx], -1)
+
+
+def threshold_segments(values, bins: ThresholdBins) -> List[Tuple[int, int, Dict]]:
+    """
+    Gom các điểm liên tiếp cùng ngưỡng thành đoạn (start, end, threshold) theo chỉ số;
+    end là điểm bắt đầu đoạn kế tiếp (hoặc điểm cuối) để các đoạn nối liền nhau.
+    Các điểm không thuộc ngưỡng nào không tạo đoạn.
+    """
+    cls = classify_values(values, bins)
+    if len(cls) == 0:
+        return []
+    # run-length: vị trí đổi ngưỡng
+    change = np.flatnonzero(cls[1:] != cls[:-1]) + 1
+    starts = np.r_[0, change]
+    ends = np.r_[change, len(cls) - 1]
+    return [
+        (int(start), int(end), bins.thresholds[cls[start]])
+        for start, end in zip(starts, ends)
+        if cls[start] >= 0
     ]
-    ci_dict = {"datetime": pred_dt_index}
-
-    for parameter in parameters:
-        for h in hours:
-            values = raw_df[raw_df["hour"] == h][parameter].dropna()
-            if len(values) == 0:
-                values = pd.Series([0])
-            for ci in ci_levels:
-                lower = np.percentile(values, 50 - ci * 50)
-                upper = np.percentile(values, 50 + ci * 50)
-                ci_dict.setdefault(f"{parameter}_low_{int(ci * 100)}", []).append(lower)
-                ci_dict.setdefault(f"{parameter}_high_{int(ci * 100)}", []).append(
-                    upper
-                )
-        mean_vals = [raw_df[raw_df["hour"] == h][parameter].mean() for h in hours]
-        ci_dict[parameter] = mean_vals
 
-    return pd.DataFrame(ci_dict)
 
+# bảng màu "Set2" (seaborn) cho các dải CI, hard-code để không cần seaborn khi vẽ
+CI_BAND_COLORS = [
+    (102, 194, 165),
+    (252, 141, 98),
+    (141, 160, 203),
+    (231, 138, 195),
+    (166, 216, 84),
+    (255, 217, 47),
+    (229, 196, 148),
+    (179, 179, 179),
+]
 
-def classify_threshold(val: float, thresholds: List[Dict]):
-    for threshold in thresholds:
-        if float(threshold["lower"]) <= val <= float(threshold["upper"]):
-            return threshold
+MONTH_TICKTEXT = [
+    "Jan",
+    "Feb",
+    "Mar",
+    "Apr",
+    "May",
+    "Jun",
+    "Jul",
+    "Aug",
+    "Sep",
+    "Oct",
+    "Nov",
+    "Dec",
+]
 
-    return None
 
+def _band_fillcolor(idx: int) -> str:
+    r, g, b = CI_BAND_COLORS[idx % len(CI_BAND_COLORS)]
+    return f"rgba({r}, {g}, {b}, 0.3)"
 
-def plotly_fanmap_one_day(
-    pred_df: pd.DataFrame, parameter: str, ci_levels: List[float] = [30, 60, 90]
-):
-    sns.set_style("whitegrid")
-    colors = sns.color_palette("Set2", len(ci_levels))
-    x = pred_df["datetime"].astype(str).tolist()
-    x_dt = pred_df["datetime"]  # giữ dạng datetime
-    traces = []
 
-    # CI segments
-    for idx, ci in enumerate(sorted(ci_levels, reverse=True)):
-        low = pred_df[f"{parameter}_low_{ci}"].tolist()
-        high = pred_df[f"{parameter}_high_{ci}"].tolist()
-        traces.append(
-            go.Scatter(
-                x=x + x[::-1],
-                y=low + high[::-1],
-                fill="toself",
-                fillcolor=f"rgba({int(colors[idx][0] * 255)}, {int(colors[idx][1] * 255)}, {int(colors[idx][2] * 255)}, 0.3)",
-                line=dict(color="rgba(255,255,255,0)"),
-                hoverinfo="skip",
-                name=f"{ci}%",
-            )
-        )
+def _hovertemplate(parameter: str) -> str:
+    info = PARAMETER[parameter]
+    return f"%{{x}}<br>{info['name']}: %{{y:.2f}} {info['unit']} <extra></extra>"
 
-    # Mean line
-    mean_vals = pred_df[parameter].tolist()
-    traces.append(
-        go.Scatter(
-            x=x,
-            y=mean_vals,
-            mode="lines+markers",
-            line=dict(color="black", width=2),
-            name="Mean",
-            hovertemplate=f"%{{x}}<br>{PARAMETER[parameter]['name']}: %{{y:.2f}} {PARAMETER[parameter]['unit']} <extra></extra>",
-        )
-    )
 
-    fig = go.Figure(data=traces)
-    thresholds = PARAMETER[parameter]["thresholds"]
+# ---------- Figure skeleton: phần không phụ thuộc dữ liệu, dựng 1 lần cho mỗi param ----------
+_FIGURE_SKELETONS: Dict[Tuple[str, str], Dict] = {}
+_skeleton_lock = threading.Lock()
 
-    # Gom các đoạn liên tiếp cùng loại gió
-    segments = []
-    current_class = None
-    x0 = None
-
-    for i, val in enumerate(mean_vals):
-        cls = classify_threshold(val, thresholds)
-        if cls != current_class:
-            if current_class is not None:
-                segments.append((x0, x_dt[i], current_class))
-            current_class = cls
-            x0 = x_dt[i]
-    if current_class is not None:
-        segments.append((x0, x_dt.iloc[-1], current_class))
-
-    # Vẽ các vrect gom nhóm theo Beaufort
-    for x0, x1, threshold in segments:
-        if x0 == x1:
-            x1 += 0.05
-        fig.add_vrect(
-            x0=x0,
-            x1=x1,
-            fillcolor=threshold["color"],
-            opacity=0.3,  # tăng độ đậm
-            layer="below",
-            line_width=0,
-            annotation_text=threshold["label"],
-            annotation_position="top left",
-            annotation=dict(font_size=12, font_color="black", font_weight="bold"),
-        )
 
+def _build_figure_skeleton(parameter: str, kind: str) -> Dict:
+    """
+    Dựng qua plotly 1 lần: layout (template, trục, lưới), các trace legend của
+    ngưỡng, và shape/annotation mẫu của vrect cho từng ngưỡng (+ vline tháng hiện
+    tại cho "monthly"), rồi giữ ở dạng dict để mỗi request chỉ ghép dữ liệu vào.
+    """
+    import plotly.graph_objects as go
+
+    info = PARAMETER[parameter]
+    fig = go.Figure()
     # Thêm legend (trace ẩn cho mỗi loại gió)
-    for threshold in thresholds:
+    for threshold in info["thresholds"]:
         fig.add_trace(
             go.Scatter(
                 x=[None],
@@ -135,331 +143,320 @@ def plotly_fanmap_one_day(
                 name=threshold["label"],
             )
         )
-
-    # --- Local maxima / minima ---
-    y = np.array(mean_vals)
-    maxima = np.r_[False, (y[1:-1] > y[:-2]) & (y[1:-1] > y[2:]), False]
-    minima = np.r_[False, (y[1:-1] < y[:-2]) & (y[1:-1] < y[2:]), False]
-
-    fig.add_trace(
-        go.Scatter(
-            x=np.array(x)[maxima],
-            y=y[maxima],
-            mode="markers",
-            marker=dict(color="red", size=10, symbol="circle"),
-            name="Max",
-            hovertemplate=f"%{{x}}<br>{PARAMETER[parameter]['name']}: %{{y:.2f}} {PARAMETER[parameter]['unit']} <extra></extra>",
-        )
-    )
-
-    fig.add_trace(
-        go.Scatter(
-            x=np.array(x)[minima],
-            y=y[minima],
-            mode="markers",
-            marker=dict(color="blue", size=10, symbol="circle"),
-            name="Min",
-            hovertemplate=f"%{{x}}<br>{PARAMETER[parameter]['name']}: %{{y:.2f}} {PARAMETER[parameter]['unit']} <extra></extra>",
-        )
-    )
-
-    # Layout
     fig.update_layout(
-        title=f"{PARAMETER[parameter]['name']} on {x[0].split()[0]}",
         xaxis_title="Time",
-        yaxis_title=f"{PARAMETER[parameter]['name']} ({PARAMETER[parameter]['unit']})",
+        yaxis_title=f"{info['name']} ({info['unit']})",
         template="simple_white",
     )
-
+    if kind == "monthly":
+        fig.update_xaxes(
+            tickmode="array", tickvals=list(range(1, 13)), ticktext=MONTH_TICKTEXT
+        )
     # Hiển thị lưới
     fig.update_yaxes(showgrid=True, gridwidth=0.5, gridcolor="lightgray")
 
-    return fig
+    # vrect mẫu cho mỗi ngưỡng, x0/x1 được thay theo dữ liệu
+    for threshold in info["thresholds"]:
+        fig.add_vrect(
+            x0=0,
+            x1=1,
+            fillcolor=threshold["color"],
+            opacity=0.3,  # tăng độ đậm
+            layer="below",
+            line_width=0,
+            annotation_text=threshold["label"],
+            annotation_position="top left",
+            annotation=dict(font_size=12, font_color="black", font_weight="bold"),
+        )
+    if kind == "monthly":
+        fig.add_vline(
+            x=0,
+            line_width=2,
+            line_dash="dash",  # kiểu nét đứt
+            line_color="darkred",
+            annotation_text="Current month",
+            annotation_position="top",
+            annotation=dict(font_size=12, font_color="black", font_weight="bold"),
+        )
+
+    fig_dict = fig.to_dict()
+    layout = fig_dict["layout"]
+    return {
+        "legend": fig_dict["data"],
+        "shapes": layout.pop("shapes"),
+        "annotations": layout.pop("annotations"),
+        "layout": layout,
+        "hovertemplate": _hovertemplate(parameter),
+    }
 
 
-def plotly_one_day(
-    pred_df: pd.DataFrame, parameter: str, ci_levels: List[float] = [30, 60, 90]
-):
-    fig = plotly_fanmap_one_day(pred_df, parameter, ci_levels)
-    return fig.to_dict()
+def figure_skeleton(parameter: str, kind: str = "fanmap") -> Dict:
+    """Skeleton đã dựng sẵn (dùng chung giữa các request, không được sửa tại chỗ)."""
+    key = (parameter, kind)
+    skeleton = _FIGURE_SKELETONS.get(key)
+    if skeleton is None:
+        with _skeleton_lock:
+            skeleton = _FIGURE_SKELETONS.get(key)
+            if skeleton is None:
+                skeleton = _build_figure_skeleton(parameter, kind)
+                _FIGURE_SKELETONS[key] = skeleton
+    return skeleton
 
 
-def plotly_fanmap_many_days(
-    pred_df: pd.DataFrame, parameter: str, ci_levels: List[float] = [30, 60, 90]
-):
-    sns.set_style("whitegrid")
-    colors = sns.color_palette("Set2", len(ci_levels))
-    x = pred_df["datetime"].astype(str).tolist()
-    x_dt = pred_df["datetime"]  # giữ dạng datetime
-    traces = []
+def build_figure_skeletons():
+    """Dựng sẵn skeleton cho mọi param trong thresholds.json (gọi lúc app khởi động)."""
+    for parameter in PARAMETER:
+        for kind in ("fanmap", "monthly"):
+            figure_skeleton(parameter, kind)
+
+
+def _figure_dict(
+    pred_df: pd.DataFrame,
+    parameter: str,
+    x: List,
+    ci_levels: List[float],
+    title: str,
+    kind: str = "fanmap",
+    mean_hovertemplate: Optional[str] = None,
+) -> Dict:
+    """Ghép dữ liệu vào skeleton, trả về dict cùng cấu trúc với go.Figure.to_dict()."""
+    skeleton = figure_skeleton(parameter, kind)
+    thresholds = PARAMETER[parameter]["thresholds"]
+    data = []
 
     # CI segments
     for idx, ci in enumerate(sorted(ci_levels, reverse=True)):
         low = pred_df[f"{parameter}_low_{ci}"].tolist()
         high = pred_df[f"{parameter}_high_{ci}"].tolist()
-        traces.append(
-            go.Scatter(
-                x=x + x[::-1],
-                y=low + high[::-1],
-                fill="toself",
-                fillcolor=f"rgba({int(colors[idx][0] * 255)}, {int(colors[idx][1] * 255)}, {int(colors[idx][2] * 255)}, 0.3)",
-                line=dict(color="rgba(255,255,255,0)"),
-                hoverinfo="skip",
-                name=f"{ci}%",
-            )
+        data.append(
+            {
+                "fill": "toself",
+                "fillcolor": _band_fillcolor(idx),
+                "hoverinfo": "skip",
+                "line": {"color": "rgba(255,255,255,0)"},
+                "name": f"{ci}%",
+                "x": x + x[::-1],
+                "y": low + high[::-1],
+                "type": "scatter",
+            }
         )
 
     # Mean line
     mean_vals = pred_df[parameter].tolist()
-    traces.append(
-        go.Scatter(
-            x=x,
-            y=mean_vals,
-            mode="lines+markers",
-            line=dict(color="black", width=2),
-            name="Mean",
-            hovertemplate=f"%{{x}}<br>{PARAMETER[parameter]['name']}: %{{y:.2f}} {PARAMETER[parameter]['unit']} <extra></extra>",
-        )
+    data.append(
+        {
+            "hovertemplate": mean_hovertemplate or skeleton["hovertemplate"],
+            "line": {"color": "black", "width": 2},
+            "mode": "lines+markers",
+            "name": "Mean",
+            "x": x,
+            "y": mean_vals,
+            "type": "scatter",
+        }
     )
-
-    fig = go.Figure(data=traces)
-    thresholds = PARAMETER[parameter]["thresholds"]
-
-    # Gom các đoạn liên tiếp cùng loại gió
-    segments = []
-    current_class = None
-    x0 = None
-
-    for i, val in enumerate(mean_vals):
-        cls = classify_threshold(val, thresholds)
-        if cls != current_class:
-            if current_class is not None:
-                segments.append((x0, x_dt[i], current_class))
-            current_class = cls
-            x0 = x_dt[i]
-    if current_class is not None:
-        segments.append((x0, x_dt.iloc[-1], current_class))
-
-    # Vẽ các vrect gom nhóm theo Beaufort
-    for x0, x1, threshold in segments:
-        if x0 == x1:
-            x1 += 0.05
-        fig.add_vrect(
-            x0=x0,
-            x1=x1,
-            fillcolor=threshold["color"],
-            opacity=0.3,  # tăng độ đậm
-            layer="below",
-            line_width=0,
-            annotation_text=threshold["label"],
-            annotation_position="top left",
-            annotation=dict(font_size=12, font_color="black", font_weight="bold"),
-        )
-
-    # Thêm legend (trace ẩn cho mỗi loại gió)
-    for threshold in thresholds:
-        fig.add_trace(
-            go.Scatter(
-                x=[None],
-                y=[None],
-                mode="markers",
-                marker=dict(size=10, color=threshold["color"]),
-                name=threshold["label"],
-            )
-        )
+    data.extend(skeleton["legend"])
 
     # --- Local maxima / minima ---
-    y = np.array(mean_vals)
+    y = np.array(mean_vals, dtype=np.float64)
     maxima = np.r_[False, (y[1:-1] > y[:-2]) & (y[1:-1] > y[2:]), False]
     minima = np.r_[False, (y[1:-1] < y[:-2]) & (y[1:-1] < y[2:]), False]
-
-    fig.add_trace(
-        go.Scatter(
-            x=np.array(x)[maxima],
-            y=y[maxima],
-            mode="markers",
-            marker=dict(color="red", size=10, symbol="circle"),
-            name="Max",
-            hovertemplate=f"%{{x}}<br>{PARAMETER[parameter]['name']}: %{{y:.2f}} {PARAMETER[parameter]['unit']} <extra></extra>",
+    for name, color, mask in (("Max", "red", maxima), ("Min", "blue", minima)):
+        data.append(
+            {
+                "hovertemplate": skeleton["hovertemplate"],
+                "marker": {"color": color, "size": 10, "symbol": "circle"},
+                "mode": "markers",
+                "name": name,
+                "x": [x[i] for i in np.flatnonzero(mask)],
+                "y": y[mask].tolist(),
+                "type": "scatter",
+            }
         )
-    )
 
-    fig.add_trace(
-        go.Scatter(
-            x=np.array(x)[minima],
-            y=y[minima],
-            mode="markers",
-            marker=dict(color="blue", size=10, symbol="circle"),
-            name="Min",
-            hovertemplate=f"%{{x}}<br>{PARAMETER[parameter]['name']}: %{{y:.2f}} {PARAMETER[parameter]['unit']} <extra></extra>",
-        )
-    )
-
-    # Layout
-    fig.update_layout(
-        title=f"{PARAMETER[parameter]['name']} from {x[0].split()[0]} to {x[-2].split()[0]}",
-        xaxis_title="Time",
-        yaxis_title=f"{PARAMETER[parameter]['name']} ({PARAMETER[parameter]['unit']})",
-        template="simple_white",
-    )
+    # Vẽ các vrect gom nhóm theo ngưỡng: copy shape/annotation mẫu, thay toạ độ
+    shapes = []
+    annotations = []
+    for start, end, threshold in threshold_segments(
+        mean_vals, THRESHOLD_BINS[parameter]
+    ):
+        x0, x1 = x[start], x[end]
+        if x0 == x1 and isinstance(x1, (int, float)):
+            x1 += 0.05
+        k = thresholds.index(threshold)
+        shapes.append({**skeleton["shapes"][k], "x0": x0, "x1": x1})
+        annotations.append({**skeleton["annotations"][k], "x": x0})
+    if kind == "monthly":
+        current_month = datetime.now().month
+        vline = skeleton["shapes"][len(thresholds)]
+        shapes.append({**vline, "x0": current_month, "x1": current_month})
+        note = skeleton["annotations"][len(thresholds)]
+        annotations.append({**note, "x": current_month})
+
+    layout = {
+        **skeleton["layout"],
+        "title": {"text": title},
+        "shapes": shapes,
+        "annotations": annotations,
+    }
+    return {"data": data, "layout": layout}
 
-    # Hiển thị lưới
-    fig.update_yaxes(showgrid=True, gridwidth=0.5, gridcolor="lightgray")
 
-    return fig
+def plotly_one_day(
+    pred_df: pd.DataFrame, parameter: str, ci_levels: List[float] = [30, 60, 90]
+):
+    x = pred_df["datetime"].astype(str).tolist()
+    title = f"{PARAMETER[parameter]['name']} on {x[0].split()[0]}"
+    return _figure_dict(pred_df, parameter, x, ci_levels, title)
 
 
 def plotly_many_days(
     pred_df: pd.DataFrame, parameter: str, ci_levels: List[float] = [30, 60, 90]
 ):
-    fig = plotly_fanmap_many_days(pred_df, parameter, ci_levels)
-    return fig.to_dict()
-
-
-def create_monthly_avg_df(raw_df: pd.DataFrame, parameters: List[str]):
-    avg_df = raw_df.groupby(["month"])[parameters].mean().reset_index()
-    return avg_df
-
-
-def plotly_monthly_overview(pred_df: pd.DataFrame, parameter: str):
-    sns.set_style("whitegrid")
-    x = pred_df["month"].tolist()
-    x_dt = pred_df["month"]  # giữ dạng datetime
-    traces = []
-
-    # Mean line
-    mean_vals = pred_df[parameter].tolist()
-    traces.append(
-        go.Scatter(
-            x=x,
-            y=mean_vals,
-            mode="lines+markers",
-            line=dict(color="black", width=2),
-            name="Mean",
-            hovertemplate=f"Time: %{{x}}<br>{parameter}: %{{y:.2f}}<extra></extra>",
-        )
-    )
-
-    fig = go.Figure(data=traces)
+    x = pred_df["datetime"].astype(str).tolist()
+    # dòng cuối là +1h của giờ cuối (compute_ci_from_pred_df), tính từ đó để vẫn
+    # đúng khi bảng đã downsample
+    last_day = (pred_df["datetime"].iloc[-1] - pd.Timedelta(hours=1)).date()
+    title = f"{PARAMETER[parameter]['name']} from {x[0].split()[0]} to {last_day}"
+    return _figure_dict(pred_df, parameter, x, ci_levels, title)
+
+
+# ---------- Output dạng data: chỉ mảng CI + đoạn ngưỡng, style nằm ở figure_template ----------
+def ci_series(
+    ci_df: pd.DataFrame,
+    parameter: str,
+    ci_levels: List[float] = [30, 60, 90],
+) -> Dict:
+    """
+    Dữ liệu của 1 figure dưới dạng mảng NumPy (encode bằng orjson ở response), trục x
+    gửi riêng 1 lần cho mọi param: mean, các dải CI, chỉ số cực đại/cực tiểu địa phương và các đoạn ngưỡng
+    (start/end là chỉ số điểm, class là vị trí trong thresholds của figure_template).
+    """
     thresholds = PARAMETER[parameter]["thresholds"]
-
-    # Gom các đoạn liên tiếp cùng loại gió
-    segments = []
-    current_class = None
-    x0 = None
-
-    for i, val in enumerate(mean_vals):
-        cls = classify_threshold(val, thresholds)
-        if cls != current_class:
-            if current_class is not None:
-                segments.append((x0, x_dt[i], current_class))
-            current_class = cls
-            x0 = x_dt[i]
-    if current_class is not None:
-        segments.append((x0, x_dt.iloc[-1], current_class))
-
-    # Vẽ các vrect gom nhóm theo Beaufort
-    for x0, x1, wc in segments:
-        if x0 == x1:
-            x1 += 0.05
-        fig.add_vrect(
-            x0=x0,
-            x1=x1,
-            fillcolor=wc["color"],
-            opacity=0.3,  # tăng độ đậm
-            layer="below",
-            line_width=0,
-            annotation_text=wc["label"],
-            annotation_position="top left",
-            annotation=dict(font_size=12, font_color="black", font_weight="bold"),
-        )
-
-    # Thêm legend (trace ẩn cho mỗi loại gió)
-    for wc in thresholds:
-        fig.add_trace(
-            go.Scatter(
-                x=[None],
-                y=[None],
-                mode="markers",
-                marker=dict(size=10, color=wc["color"]),
-                name=wc["label"],
-            )
-        )
-
-    # --- Local maxima / minima ---
-    y = np.array(mean_vals)
+    y = ci_df[parameter].to_numpy(dtype=np.float64)
     maxima = np.r_[False, (y[1:-1] > y[:-2]) & (y[1:-1] > y[2:]), False]
     minima = np.r_[False, (y[1:-1] < y[:-2]) & (y[1:-1] < y[2:]), False]
+    # 3 chữ số thập phân là đủ để vẽ, payload gọn hơn nhiều so với float64 đầy đủ
+    bands = {
+        str(ci): {
+            "low": ci_df[f"{parameter}_low_{ci}"].to_numpy(dtype=np.float64).round(3),
+            "high": ci_df[f"{parameter}_high_{ci}"].to_numpy(dtype=np.float64).round(3),
+        }
+        for ci in ci_levels
+        if f"{parameter}_low_{ci}" in ci_df.columns
+    }
+    return {
+        "mean": y.round(3),
+        "bands": bands,
+        "max": np.flatnonzero(maxima),
+        "min": np.flatnonzero(minima),
+        "segments": [
+            {
+                "start": start,
+                "end": end,
+                "class": thresholds.index(threshold),
+                "label": threshold["label"],
+            }
+            for start, end, threshold in threshold_segments(
+                y, THRESHOLD_BINS[parameter]
+            )
+        ],
+    }
 
-    fig.add_trace(
-        go.Scatter(
-            x=np.array(x)[maxima],
-            y=y[maxima],
-            mode="markers",
-            marker=dict(color="red", size=10, symbol="circle"),
-            name="Max",
-            hovertemplate=f"%{{x}}<br>{PARAMETER[parameter]['name']}: %{{y:.2f}} {PARAMETER[parameter]['unit']} <extra></extra>",
-        )
-    )
 
-    fig.add_trace(
-        go.Scatter(
-            x=np.array(x)[minima],
-            y=y[minima],
-            mode="markers",
-            marker=dict(color="blue", size=10, symbol="circle"),
-            name="Min",
-            hovertemplate=f"%{{x}}<br>{PARAMETER[parameter]['name']}: %{{y:.2f}} {PARAMETER[parameter]['unit']} <extra></extra>",
-        )
-    )
+def figure_template(parameter: str, ci_levels: List[float] = [30, 60, 90]) -> Dict:
+    """
+    Phần style tĩnh của các figure plotly_* cho 1 param, để client tự dựng figure
+    từ output của ci_series: màu các dải CI, line mean, marker max/min, ngưỡng và layout.
+    """
+    info = PARAMETER[parameter]
+    hovertemplate = _hovertemplate(parameter)
+    return {
+        "name": info["name"],
+        "unit": info["unit"],
+        # thứ tự vẽ: dải rộng nhất trước
+        "bands": [
+            {
+                "ci": str(ci),
+                "name": f"{ci}%",
+                "fillcolor": _band_fillcolor(idx),
+                "line": {"color": "rgba(255,255,255,0)"},
+            }
+            for idx, ci in enumerate(sorted(ci_levels, reverse=True))
+        ],
+        "mean": {
+            "name": "Mean",
+            "mode": "lines+markers",
+            "line": {"color": "black", "width": 2},
+            "hovertemplate": hovertemplate,
+        },
+        "max": {
+            "name": "Max",
+            "mode": "markers",
+            "marker": {"color": "red", "size": 10, "symbol": "circle"},
+            "hovertemplate": hovertemplate,
+        },
+        "min": {
+            "name": "Min",
+            "mode": "markers",
+            "marker": {"color": "blue", "size": 10, "symbol": "circle"},
+            "hovertemplate": hovertemplate,
+        },
+        "thresholds": info["thresholds"],
+        "segment": {
+            "opacity": 0.3,
+            "layer": "below",
+            "line_width": 0,
+            "annotation_position": "top left",
+            "annotation": {
+                "font_size": 12,
+                "font_color": "black",
+                "font_weight": "bold",
+            },
+        },
+        "titles": {
+            "one_day": f"{info['name']} on {{date}}",
+            "many_days": f"{info['name']} from {{start}} to {{end}}",
+            "monthly": f"{info['name']} per day on {{year}}",
+        },
+        "layout": {
+            "xaxis_title": "Time",
+            "yaxis_title": f"{info['name']} ({info['unit']})",
+            "template": "simple_white",
+        },
+        "yaxes": {"showgrid": True, "gridwidth": 0.5, "gridcolor": "lightgray"},
+    }
 
-    # Layout
-    fig.update_layout(
-        title=f"{PARAMETER[parameter]['name']} per day on {datetime.now().year}",
-        xaxis_title="Time",
-        yaxis_title=f"{PARAMETER[parameter]['name']} ({PARAMETER[parameter]['unit']})",
-        template="simple_white",
-    )
 
-    # Hiển thị lưới
-    fig.update_xaxes(
-        tickmode="array",
-        tickvals=list(range(1, 13)),
-        ticktext=[
-            "Jan",
-            "Feb",
-            "Mar",
-            "Apr",
-            "May",
-            "Jun",
-            "Jul",
-            "Aug",
-            "Sep",
-            "Oct",
-            "Nov",
-            "Dec",
-        ],
-    )
-    fig.update_yaxes(showgrid=True, gridwidth=0.5, gridcolor="lightgray")
+def create_monthly_avg_df(raw_df: pd.DataFrame, parameters: List[str]):
+    avg_df = raw_df.groupby(["month"])[parameters].mean().reset_index()
+    return avg_df
 
-    current_month = datetime.now().month
 
-    fig.add_vline(
-        x=current_month,
-        line_width=2,
-        line_dash="dash",  # kiểu nét đứt
-        line_color="darkred",
-        annotation_text=f"Current month",
-        annotation_position="top",
-        annotation=dict(font_size=12, font_color="black", font_weight="bold"),
+def plotly_monthly(pred_df: pd.DataFrame, parameter: str):
+    x = pred_df["month"].tolist()
+    title = f"{PARAMETER[parameter]['name']} per day on {datetime.now().year}"
+    return _figure_dict(
+        pred_df,
+        parameter,
+        x,
+        [],
+        title,
+        kind="monthly",
+        mean_hovertemplate=f"Time: %{{x}}<br>{parameter}: %{{y:.2f}}<extra></extra>",
     )
 
-    return fig
+
+CALENDAR_COLUMNS = {"year", "month", "day", "hour"}
 
 
 # ---------- Utility: ensure raw_df có các cột cần thiết ----------
 def normalize_raw_df(raw_df: pd.DataFrame) -> pd.DataFrame:
     """Đảm bảo index là datetime, thêm year/month/day/hour cols."""
+    # frame từ data_fetcher.decode_power_hourly đã có sẵn các cột -> không copy
+    if isinstance(raw_df.index, pd.DatetimeIndex) and CALENDAR_COLUMNS.issubset(
+        raw_df.columns
+    ):
+        return raw_df
     if raw_df.index.name != "index" and not isinstance(raw_df.index, pd.DatetimeIndex):
         raw_df.index = pd.to_datetime(raw_df.index)
     raw_df = raw_df.copy()
@@ -471,75 +468,109 @@ def normalize_raw_df(raw_df: pd.DataFrame) -> pd.DataFrame:
 
 
 # ---------- Build group-aggregates features ----------
-def build_aggregates(raw_df: pd.DataFrame, parameters: List):
+AGG_KEYS = ["month", "day", "hour"]
+
+
+def _group_quantiles(
+    group: np.ndarray, values: np.ndarray, n_groups: int, percentiles: List[float]
+):
+    """
+    Percentile (nội suy tuyến tính như np.percentile, bỏ qua NaN) của từng cột
+    values (n, k) trong từng nhóm, cho mọi percentile trong 1 lượt.
+    Trả về (out (n_groups, k, len(percentiles)), counts (n_groups, k));
+    nhóm không có giá trị -> NaN.
+    """
+    n, k = values.shape
+    sizes = np.bincount(group, minlength=n_groups)
+    width = max(int(sizes.max()) if n else 0, 1)
+    # xếp các dòng vào khối (nhóm, vị trí trong nhóm, cột), chỗ trống là NaN
+    order = np.argsort(group, kind="stable")
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+    slot = np.arange(n) - starts[group[order]]
+    cube = np.full((n_groups, width, k), np.nan)
+    cube[group[order], slot] = values[order]
+    cube.sort(axis=1)  # NaN xuống cuối nhóm
+    counts = (~np.isnan(cube)).sum(axis=1)
+
+    q = np.asarray(percentiles, dtype=np.float64) / 100.0
+    pos = (counts[:, None, :] - 1) * q[None, :, None]  # (n_groups, L, k)
+    lo = np.floor(np.maximum(pos, 0)).astype(np.int64)
+    hi = np.minimum(lo + 1, np.maximum(counts[:, None, :] - 1, 0))
+    v_lo = np.take_along_axis(cube, lo, axis=1)
+    v_hi = np.take_along_axis(cube, hi, axis=1)
+    out = v_lo + (v_hi - v_lo) * (pos - lo)
+    out[np.broadcast_to(counts[:, None, :] == 0, out.shape)] = np.nan
+    return out.transpose(0, 2, 1), counts
+
+
+def _group_sum(group: np.ndarray, weights: np.ndarray, n_groups: int) -> np.ndarray:
+    """Tổng theo nhóm cho từng cột của weights (n, k) -> (n_groups, k)."""
+    return np.stack(
+        [
+            np.bincount(group, weights=weights[:, j], minlength=n_groups)
+            for j in range(weights.shape[1])
+        ],
+        axis=1,
+    )
+
+
+def build_aggregates(
+    raw_df: pd.DataFrame, parameters: List, keys: List[str] = AGG_KEYS
+):
     """
     Tạo bảng aggregates theo (month, day, hour) từ lịch sử:
     trả về DataFrame keyed by (month, day, hour) với các feature stats cho mỗi param.
+    Tính mean/std/median/q05/q95/count cho mọi param trong 1 lượt bằng sort theo nhóm
+    (_group_quantiles, không dùng groupby + lambda).
     """
-    groups = raw_df.groupby(["month", "day", "hour"])
-    agg_frames = []
-    for p in parameters:
-        agg = (
-            groups[p]
-            .agg(
-                [
-                    ("hist_mean", "mean"),
-                    ("hist_std", "std"),
-                    ("hist_median", "median"),
-                    (
-                        "hist_q05",
-                        lambda x: (
-                            np.nanpercentile(x.dropna(), 5)
-                            if len(x.dropna()) > 0
-                            else np.nan
-                        ),
-                    ),
-                    (
-                        "hist_q95",
-                        lambda x: (
-                            np.nanpercentile(x.dropna(), 95)
-                            if len(x.dropna()) > 0
-                            else np.nan
-                        ),
-                    ),
-                    ("hist_count", "count"),
-                ]
-            )
-            .reset_index()
-        )
-        # rename columns to include parameter prefix
-        agg = agg.rename(
-            columns={
-                "hist_mean": f"{p}_hist_mean",
-                "hist_std": f"{p}_hist_std",
-                "hist_median": f"{p}_hist_median",
-                "hist_q05": f"{p}_hist_q05",
-                "hist_q95": f"{p}_hist_q95",
-                "hist_count": f"{p}_hist_count",
-            }
-        )
-        agg_frames.append(agg)
-    # merge all param aggregates on month,day,hour
-    from functools import reduce
+    # mã hoá (month, day, hour) thành 1 số nguyên -> id nhóm đã sắp xếp như groupby
+    key_values = [raw_df[k].to_numpy(dtype=np.int64) for k in keys]
+    dims = tuple(int(v.max()) + 1 if len(v) else 1 for v in key_values)
+    codes = np.ravel_multi_index(key_values, dims) if len(raw_df) else np.array([])
+    uniq, group = np.unique(codes, return_inverse=True)
+    n_groups = len(uniq)
+
+    values = raw_df[parameters].to_numpy(dtype=np.float64).reshape(len(raw_df), -1)
+    valid = ~np.isnan(values)
+    # median/q05/q95 của mọi param trong 1 lượt
+    quantiles, counts = _group_quantiles(group, values, n_groups, [50, 5, 95])
+    sums = _group_sum(group, np.where(valid, values, 0.0), n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+        dev = np.where(valid, values - means[group], 0.0)
+        stds = np.sqrt(_group_sum(group, dev**2, n_groups) / (counts - 1))
+    stds[counts <= 1] = np.nan
+
+    out = {
+        k: v.astype(raw_df[k].dtype)
+        for k, v in zip(keys, np.unravel_index(uniq.astype(np.int64), dims))
+    }
+    for j, p in enumerate(parameters):
+        out[f"{p}_hist_mean"] = means[:, j]
+        out[f"{p}_hist_std"] = stds[:, j]
+        out[f"{p}_hist_median"] = quantiles[:, j, 0]
+        out[f"{p}_hist_q05"] = quantiles[:, j, 1]
+        out[f"{p}_hist_q95"] = quantiles[:, j, 2]
+        out[f"{p}_hist_count"] = counts[:, j]
 
-    agg_all = reduce(
-        lambda left, right: left.merge(right, on=["month", "day", "hour"], how="outer"),
-        agg_frames,
-    )
-    return agg_all
+    return pd.DataFrame(out)
 
 
 # ---------- Build features for training (merge aggregates back) ----------
 def build_training_table(
-    raw_df: pd.DataFrame, parameters: List[str], agg_all: pd.DataFrame
+    raw_df: pd.DataFrame,
+    parameters: List[str],
+    agg_all: pd.DataFrame,
+    keys: List[str] = AGG_KEYS,
 ):
     """
     Trả về X (features) và y_dict (targets per param)
     X: mỗi row là 1 timestamp trong raw_df, features bao gồm hour cyclical, doy cyclical, và agg fields.
+    keys: các cột để ghép aggregates, cùng keys đã dùng cho build_aggregates.
     """
     df = raw_df.reset_index().rename(columns={"index": "datetime"}).copy()
     # merge agg features
-    df = df.merge(agg_all, on=["month", "day", "hour"], how="left")
+    df = df.merge(agg_all, on=keys, how="left")
     # time cyclical
     df["hour_sin"] = np.sin(2 * np.pi * df["hour"] / 24)
     df["hour_cos"] = np.cos(2 * np.pi * df["hour"] / 24)
@@ -579,6 +610,258 @@ def build_training_table(
     return X, y_dict, feature_cols
 
 
+class AggregateIndex:
+    """
+    Bảng aggregates (output của build_aggregates) đánh index theo `keys`
+    (mặc định (month, day, hour)): tra 1 dòng O(1) bằng dict, fallback về dòng
+    đầu tiên cùng các key còn lại khi bỏ "day" nếu không có đúng ngày, None nếu
+    cũng không có.
+    """
+
+    def __init__(self, agg_all: pd.DataFrame, keys: List[str] = AGG_KEYS):
+        self.agg_all = agg_all
+        self._fallback = [j for j, k in enumerate(keys) if k != "day"]
+        self._exact = {}
+        self._coarse = {}
+        columns = [agg_all[k].to_numpy().tolist() for k in keys]
+        for i, key in enumerate(zip(*columns)):
+            self._exact.setdefault(key, i)
+            self._coarse.setdefault(tuple(key[j] for j in self._fallback), i)
+
+    def lookup(self, *key) -> Optional[int]:
+        i = self._exact.get(key)
+        if i is None:
+            # fallback: use same month-hour aggregated (ignore day)
+            i = self._coarse.get(tuple(key[j] for j in self._fallback))
+        return i
+
+    def rows(self, columns: List[str], keys) -> np.ndarray:
+        """Ma trận (len(keys), len(columns)) các giá trị aggregate, NaN nếu không có."""
+        out = np.full((len(keys), len(columns)), np.nan)
+        present = [j for j, c in enumerate(columns) if c in self.agg_all.columns]
+        if not present:
+            return out
+        matrix = self.agg_all[[columns[j] for j in present]].to_numpy(dtype=np.float64)
+        for r, key in enumerate(keys):
+            i = self.lookup(*key)
+            if i is not None:
+                out[r, present] = matrix[i]
+        return out
+
+
+def build_prediction_features(
+    agg_index: AggregateIndex,
+    feature_cols: List[str],
+    pred_index: pd.DatetimeIndex,
+    prefix: tuple = (),
+) -> np.ndarray:
+    """
+    Ma trận feature (len(pred_index), len(feature_cols)) cho các giờ cần dự báo,
+    cùng thứ tự cột với build_training_table.
+    prefix: giá trị các key đứng trước (month, day, hour), vd (cell,) khi gộp nhiều ô.
+    """
+    keys = (
+        (*prefix, m, d, h)
+        for m, d, h in zip(
+            pred_index.month.tolist(),
+            pred_index.day.tolist(),
+            pred_index.hour.tolist(),
+        )
+    )
+    X_pred = agg_index.rows(feature_cols, list(keys))
+
+    # add cyclical time features
+    hour = pred_index.hour.to_numpy(dtype=np.float64)
+    doy = pred_index.dayofyear.to_numpy(dtype=np.float64)
+    time_features = {
+        "hour": hour,
+        "hour_sin": np.sin(2 * np.pi * hour / 24),
+        "hour_cos": np.cos(2 * np.pi * hour / 24),
+        "doy": doy,
+        "doy_sin": np.sin(2 * np.pi * doy / 365.25),
+        "doy_cos": np.cos(2 * np.pi * doy / 365.25),
+    }
+    for j, c in enumerate(feature_cols):
+        if c in time_features:
+            X_pred[:, j] = time_features[c]
+    X_pred[np.isnan(X_pred)] = 0.0
+    return X_pred
+
+
+TRAINING_ENGINES = ("lightgbm", "multiquantile")
+# "climatology": không train, lấy percentile thực nghiệm của lịch sử (forecast_climatology)
+# "bootstrap": ensemble XGBoost resample, train trên process pool (core.model)
+FORECAST_ENGINES = TRAINING_ENGINES + ("climatology", "bootstrap")
+
+LGB_QUANTILE_PARAMS = {
+    "objective": "quantile",
+    "learning_rate": 0.05,
+    "num_leaves": 31,
+    "min_data_in_leaf": 10,
+    "verbose": -1,
+    # kết quả không phụ thuộc số thread / thứ tự chạy song song
+    "deterministic": True,
+    "force_row_wise": True,
+    "seed": 0,
+}
+
+# engine multiquantile: số vòng boost của các quantile offset so với median
+MULTIQUANTILE_OFFSET_ROUNDS = 0.25
+
+
+def _load_or_train(
+    key: Optional[str],
+    p: str,
+    q: float,
+    parameters_lgb: Dict,
+    hyperparameters: Dict,
+    make_dataset,
+    num_boost_round: int,
+    num_threads: int,
+) -> "lgb.Booster":
+    import lightgbm as lgb
+
+    # model đã train cho cùng dữ liệu + hyperparameters -> load từ registry
+    hyperparameters = {**parameters_lgb, **hyperparameters}
+    model = None
+    if key is not None:
+        model = model_registry.load(key, p, q, hyperparameters)
+    if model is None:
+        model = lgb.train(
+            {**parameters_lgb, "num_threads": num_threads},
+            make_dataset(),
+            num_boost_round=num_boost_round,
+        )
+        if key is not None:
+            model_registry.save(key, p, q, hyperparameters, model)
+    return model
+
+
+def _train_quantile_model(
+    X_values: np.ndarray,
+    y_train: np.ndarray,
+    p: str,
+    q: float,
+    num_boost_round: int,
+    hyperparameters: Dict,
+    key: Optional[str],
+    num_threads: int = 1,
+) -> "lgb.Booster":
+    """Engine "lightgbm": 1 booster độc lập (và 1 Dataset riêng) cho mỗi quantile."""
+    import lightgbm as lgb
+
+    return _load_or_train(
+        key,
+        p,
+        q,
+        {**LGB_QUANTILE_PARAMS, "alpha": q},
+        hyperparameters,
+        lambda: lgb.Dataset(
+            X_values, y_train, params=LGB_QUANTILE_PARAMS, free_raw_data=False
+        ),
+        num_boost_round,
+        num_threads,
+    )
+
+
+def _base_quantile(quantiles: List[float]) -> float:
+    return min(quantiles, key=lambda q: abs(q - 0.5))
+
+
+def _train_multiquantile_models(
+    reference: "lgb.Dataset",
+    X_values: np.ndarray,
+    y_train: np.ndarray,
+    p: str,
+    quantiles: List[float],
+    num_boost_round: int,
+    hyperparameters: Dict,
+    key: Optional[str],
+    num_threads: int = 1,
+) -> Dict[float, "lgb.Booster"]:
+    """
+    Engine "multiquantile": mọi param dùng chung bin của `reference` (chỉ bin 1 lần),
+    mỗi param có Dataset riêng để train song song được. Train đủ vòng cho quantile
+    gần median nhất, các quantile còn lại chỉ học offset (quantile của residual
+    so với median) với ít vòng hơn.
+    """
+    import lightgbm as lgb
+
+    base_q = _base_quantile(quantiles)
+    hyperparameters = {**hyperparameters, "engine": "multiquantile"}
+    dataset = []
+
+    def labelled(label):
+        if not dataset:
+            dataset.append(
+                lgb.Dataset(
+                    X_values,
+                    label,
+                    reference=reference,
+                    params=LGB_QUANTILE_PARAMS,
+                    free_raw_data=False,
+                ).construct()
+            )
+        dataset[0].set_label(label)
+        return dataset[0]
+
+    base = _load_or_train(
+        key,
+        p,
+        base_q,
+        {**LGB_QUANTILE_PARAMS, "alpha": base_q},
+        hyperparameters,
+        lambda: labelled(y_train),
+        num_boost_round,
+        num_threads,
+    )
+    models = {base_q: base}
+
+    offset_rounds = max(1, int(round(num_boost_round * MULTIQUANTILE_OFFSET_ROUNDS)))
+    residual = []
+
+    def residual_dataset():
+        if not residual:
+            residual.append(y_train - base.predict(X_values, num_threads=num_threads))
+        return labelled(residual[0])
+
+    for q in quantiles:
+        if q == base_q:
+            continue
+        models[q] = _load_or_train(
+            key,
+            p,
+            q,
+            {**LGB_QUANTILE_PARAMS, "alpha": q},
+            {**hyperparameters, "base_quantile": base_q},
+            residual_dataset,
+            offset_rounds,
+            num_threads,
+        )
+    return models
+
+
+def _predict_multiquantile(
+    models: Dict[float, "lgb.Booster"], X_values: np.ndarray, quantiles: List[float]
+) -> Dict[float, np.ndarray]:
+    base_q = _base_quantile(quantiles)
+    base = models[base_q].predict(X_values, num_threads=1)
+    ordered = sorted(quantiles)
+    stacked = np.vstack(
+        [
+            base if q == base_q else base + models[q].predict(X_values, num_threads=1)
+            for q in ordered
+        ]
+    )
+    # sắp xếp theo trục quantile để các quantile không bao giờ cắt nhau
+    stacked = np.sort(stacked, axis=0)
+    return {q: stacked[ordered.index(q)] for q in quantiles}
+
+
+# các request đồng thời train cùng dữ liệu + tham số chỉ train 1 lần
+_training_flight = SingleFlight()
+
+
 # ---------- Forecast: train quantile models per param and predict 24h for target_dt ----------
 def forecast_lightgbm_multitarget(
     raw_df: pd.DataFrame,
@@ -587,102 +870,236 @@ def forecast_lightgbm_multitarget(
     quantiles: List[float] = [0.05, 0.2, 0.35, 0.5, 0.65, 0.8, 0.95],
     transform_precip: bool = True,
     num_boost_round: int = 200,
+    key: Optional[str] = None,
+    engine: str = "lightgbm",
+    end_dt: Optional[datetime] = None,
 ):
     """
     Input:
         - raw_df: historical DataFrame (datetime index) covering +/-window days across many past years
         - parameters: list of parameter names to model
         - target_dt: date (datetime) for which we predict 24 hours (hour 0..23)
+        - end_dt: nếu có, train 1 lần trên raw_df (phần hợp các window, vd từ
+          data_fetcher.fetch_hourly_range) và dự báo mọi giờ từ ngày target_dt tới hết
+          ngày end_dt trong 1 lần predict; feature day-of-year phân biệt các ngày
+        - key: định danh dữ liệu train (vd data_fetcher.training_key); các lời gọi
+          đồng thời cùng key và tham số dùng chung 1 lần train, kết quả không được sửa tại chỗ.
+          Model đã train được lưu/đọc lại từ core.registry.model_registry theo key này.
+        - engine: "lightgbm" (1 booster độc lập cho mỗi quantile), "multiquantile"
+          (dùng chung 1 Dataset đã bin, train median rồi các offset quantile trên residual)
+          "climatology" (forecast_climatology, không train, models rỗng) hoặc
+          "bootstrap" (core.model.forecast_bootstrap, models rỗng)
     Output:
-        - pred_df: DataFrame with datetime(24h) and predicted quantiles for each param.
+        - pred_df: DataFrame with datetime(24h, hoặc N x 24h nếu có end_dt) and predicted quantiles for each param.
         - models: dict of trained models {param: {quantile: model}}
     """
-    raw_df = normalize_raw_df(raw_df)
-    agg_all = build_aggregates(raw_df, parameters)
-    X, y_dict, feature_cols = build_training_table(raw_df, parameters, agg_all)
+    if engine not in FORECAST_ENGINES:
+        raise ValueError(
+            f"Unknown engine {engine!r}, expected one of {FORECAST_ENGINES}"
+        )
+    if engine == "climatology":
+        return (
+            forecast_climatology(raw_df, parameters, target_dt, quantiles, end_dt),
+            {},
+        )
+    if engine == "bootstrap":
+        # import tại chỗ: core.model import ngược lại module này
+        from core.model import forecast_bootstrap
+
+        return (
+            forecast_bootstrap(raw_df, parameters, target_dt, quantiles, end_dt),
+            {},
+        )
+    if key is None:
+        return _forecast_lightgbm_multitarget(
+            raw_df,
+            parameters,
+            target_dt,
+            quantiles,
+            transform_precip,
+            num_boost_round,
+            None,
+            engine,
+            end_dt,
+        )
+    flight_key = (
+        key,
+        tuple(parameters),
+        target_dt,
+        end_dt,
+        tuple(quantiles),
+        transform_precip,
+        num_boost_round,
+        engine,
+    )
+    return _training_flight.do(
+        flight_key,
+        _forecast_lightgbm_multitarget,
+        raw_df,
+        parameters,
+        target_dt,
+        quantiles,
+        transform_precip,
+        num_boost_round,
+        key,
+        engine,
+        end_dt,
+    )
+
+
+def _prediction_index(
+    target_dt: datetime, end_dt: Optional[datetime]
+) -> pd.DatetimeIndex:
+    start = target_dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    if end_dt is None:
+        end = start
+    else:
+        end = max(start, end_dt.replace(hour=0, minute=0, second=0, microsecond=0))
+    return pd.date_range(start, end.replace(hour=23), freq="h")
+
+
+def _forecast_lightgbm_multitarget(
+    raw_df: pd.DataFrame,
+    parameters: List[str],
+    target_dt: datetime,
+    quantiles: List[float],
+    transform_precip: bool,
+    num_boost_round: int,
+    key: Optional[str],
+    engine: str,
+    end_dt: Optional[datetime],
+):
+    pred_index = _prediction_index(target_dt, end_dt)
+    preds_per_param, models = _fit_predict_quantiles(
+        normalize_raw_df(raw_df),
+        parameters,
+        pred_index,
+        quantiles,
+        transform_precip,
+        num_boost_round,
+        key,
+        engine,
+    )
+    return _pred_frame(pred_index, parameters, preds_per_param), models
 
-    models = {p: {} for p in parameters}
-    preds_per_param = {}
 
+def _fit_predict_quantiles(
+    raw_df: pd.DataFrame,
+    parameters: List[str],
+    pred_index: pd.DatetimeIndex,
+    quantiles: List[float],
+    transform_precip: bool,
+    num_boost_round: int,
+    key: Optional[str],
+    engine: str,
+    keys: List[str] = AGG_KEYS,
+    prefixes: List[tuple] = [()],
+):
+    """
+    Train các model quantile trên raw_df (đã normalize) rồi predict pred_index
+    cho từng prefix của key (xem build_prediction_features), nối liền theo thứ tự
+    prefixes. Trả về ({param: {quantile: array}}, models).
+    """
+    agg_all = build_aggregates(raw_df, parameters, keys)
+    X, y_dict, feature_cols = build_training_table(raw_df, parameters, agg_all, keys)
+
+    # chuẩn bị target cho từng param
+    y_train_dict = {}
+    is_precip_dict = {}
     for p in parameters:
         # prepare target vector
         y = y_dict[p]
         # optional transform for precipitation since it's skewed
         is_precip = (p.upper() == "PRECTOTCORR") and transform_precip
         if is_precip:
-            y_train = np.log1p(np.maximum(y, 0.0))  # log1p on non-negative
+            y_train_dict[p] = np.log1p(np.maximum(y, 0.0))  # log1p on non-negative
         else:
-            y_train = y
+            y_train_dict[p] = y
+        is_precip_dict[p] = is_precip
+
+    def hyperparameters(p):
+        return {
+            "num_boost_round": num_boost_round,
+            "transform_precip": is_precip_dict[p],
+            "features": feature_cols,
+        }
+
+    # train song song trên training_scheduler (dùng chung core budget của process)
+    if engine == "multiquantile":
+        import lightgbm as lgb
+
+        # bin feature 1 lần, các param dùng lại bin này
+        reference = lgb.Dataset(
+            X.values,
+            np.zeros(len(X)),
+            params=LGB_QUANTILE_PARAMS,
+            free_raw_data=False,
+        ).construct()
+        results = training_scheduler.map(
+            _train_multiquantile_models,
+            [
+                (
+                    reference,
+                    X.values,
+                    y_train_dict[p],
+                    p,
+                    quantiles,
+                    num_boost_round,
+                    hyperparameters(p),
+                    key,
+                )
+                for p in parameters
+            ],
+        )
+        models = dict(zip(parameters, results))
+    else:
+        # 1 task cho mỗi cặp (param, quantile)
+        tasks = [
+            (X.values, y_train_dict[p], p, q, num_boost_round, hyperparameters(p), key)
+            for p in parameters
+            for q in quantiles
+        ]
+        results = iter(training_scheduler.map(_train_quantile_model, tasks))
+        models = {p: {q: next(results) for q in quantiles} for p in parameters}
+
+    # ma trận feature (24h, hoặc N x 24h, cho mỗi prefix) dựng 1 lần, dùng chung cho mọi param
+    agg_index = AggregateIndex(agg_all, keys)
+    X_pred = np.vstack(
+        [
+            build_prediction_features(agg_index, feature_cols, pred_index, prefix)
+            for prefix in prefixes
+        ]
+    )
 
-        # train one model per quantile
-        for q in quantiles:
-            parameters_lgb = {
-                "objective": "quantile",
-                "alpha": q,
-                "learning_rate": 0.05,
-                "num_leaves": 31,
-                "min_data_in_leaf": 10,
-                "verbose": -1,
-            }
-            dtrain = lgb.Dataset(X.values, y_train, free_raw_data=False)
-            model = lgb.train(parameters_lgb, dtrain, num_boost_round=num_boost_round)
-            models[p][q] = model
-
-        # build prediction features for 24 hours of target_dt
-        hours = list(range(24))
-        rows = []
-        for h in hours:
-            dt = target_dt.replace(hour=h, minute=0, second=0, microsecond=0)
-            m = dt.month
-            d = dt.day
-            hh = dt.hour
-            # lookup aggregated stats row (month, day, hour)
-            row_agg = agg_all[
-                (agg_all["month"] == m)
-                & (agg_all["day"] == d)
-                & (agg_all["hour"] == hh)
-            ]
-            if row_agg.shape[0] == 0:
-                # fallback: use same month-hour aggregated (ignore day)
-                row_agg = agg_all[(agg_all["month"] == m) & (agg_all["hour"] == hh)]
-            if row_agg.shape[0] == 0:
-                # fallback: zeros
-                base = {c: 0.0 for c in feature_cols}
-            else:
-                # take first match
-                row = row_agg.iloc[0].to_dict()
-                base = {}
-                for c in feature_cols:
-                    base[c] = row.get(c, 0.0)
-            # add cyclical time features
-            base["hour"] = hh
-            base["hour_sin"] = np.sin(2 * np.pi * hh / 24)
-            base["hour_cos"] = np.cos(2 * np.pi * hh / 24)
-            base["doy"] = dt.timetuple().tm_yday
-            base["doy_sin"] = np.sin(2 * np.pi * base["doy"] / 365.25)
-            base["doy_cos"] = np.cos(2 * np.pi * base["doy"] / 365.25)
-            rows.append(base)
-        X_pred = pd.DataFrame(rows, index=[target_dt.replace(hour=h) for h in hours])[
-            feature_cols
-        ].fillna(0.0)
+    preds_per_param = {}
+    for p in parameters:
+        is_precip = is_precip_dict[p]
 
         # predict quantiles and inverse transform if needed
+        if engine == "multiquantile":
+            raw_preds = _predict_multiquantile(models[p], X_pred, quantiles)
+        else:
+            raw_preds = {
+                q: models[p][q].predict(X_pred, num_threads=1) for q in quantiles
+            }
         preds_q = {}
         for q in quantiles:
-            model = models[p][q]
-            yhat = model.predict(X_pred.values)
+            yhat = raw_preds[q]
             if is_precip:
                 yhat = np.expm1(yhat)  # inverse of log1p
                 yhat = np.maximum(yhat, 0.0)
             preds_q[q] = yhat
         preds_per_param[p] = preds_q
+    return preds_per_param, models
 
+
+def _pred_frame(
+    pred_index: pd.DatetimeIndex,
+    parameters: List[str],
+    preds_per_param: Dict[str, Dict[float, np.ndarray]],
+) -> pd.DataFrame:
     # assemble pred_df: datetime + for each param: q05..q95 and median and mean (median from q50)
-    hours = list(range(24))
-    dt_index = [
-        target_dt.replace(hour=h, minute=0, second=0, microsecond=0) for h in hours
-    ]
-    pred_dict = {"datetime": dt_index}
+    pred_dict = {"datetime": list(pred_index.to_pydatetime())}
     for p in parameters:
         qmap = preds_per_param[p]
         for q, arr in qmap.items():
@@ -695,8 +1112,263 @@ def forecast_lightgbm_multitarget(
             # approximate median with mean of q35 and q65 if 0.5 absent
             pred_dict[p] = 0.5 * (qmap[0.35] + qmap[0.65])
 
-    pred_df = pd.DataFrame(pred_dict)
-    return pred_df, models
+    return pd.DataFrame(pred_dict)
+
+
+# ---------- Forecast vùng: mọi ô lưới POWER trong đa giác, train gộp 1 lần ----------
+REGION_ENGINES = ("lightgbm", "multiquantile", "climatology")
+
+
+def forecast_region_multitarget(
+    cell_dfs: List[pd.DataFrame],
+    weights: np.ndarray,
+    parameters: List[str],
+    target_dt: datetime,
+    quantiles: List[float] = [0.05, 0.2, 0.35, 0.5, 0.65, 0.8, 0.95],
+    transform_precip: bool = True,
+    num_boost_round: int = 200,
+    key: Optional[str] = None,
+    engine: str = "lightgbm",
+    end_dt: Optional[datetime] = None,
+):
+    """
+    Input:
+        - cell_dfs: raw_df của từng ô lưới (vd data_fetcher.fetch_hourly_cells)
+        - weights: trọng số diện tích của từng ô, tổng = 1 (grid.cell_area_weights)
+        - các tham số còn lại như forecast_lightgbm_multitarget; key định danh dữ liệu
+          gộp (vd data_fetcher.region_training_key)
+    Với engine LightGBM, dữ liệu mọi ô được gộp thành 1 bảng có cột "cell": aggregates
+    tính theo (cell, month, day, hour) nên feature vẫn riêng cho từng ô, nhưng chỉ
+    train 1 bộ model và predict mọi ô trong 1 lần. "climatology" cũng tính mọi ô
+    trong 1 lượt, nhóm theo (cell, ngày, giờ).
+    Output:
+        - region_df: cùng schema với forecast_lightgbm_multitarget, mỗi cột là trung bình
+          có trọng số diện tích của các ô (trung bình quantile theo từng mức)
+        - cell_preds: list pred_df của từng ô, cùng thứ tự cell_dfs
+    """
+    if engine not in REGION_ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}, expected one of {REGION_ENGINES}")
+    args = (
+        cell_dfs,
+        weights,
+        parameters,
+        target_dt,
+        quantiles,
+        transform_precip,
+        num_boost_round,
+        key,
+        engine,
+        end_dt,
+    )
+    if key is None:
+        return _forecast_region_multitarget(*args)
+    flight_key = (
+        "region",
+        key,
+        tuple(parameters),
+        target_dt,
+        end_dt,
+        tuple(quantiles),
+        transform_precip,
+        num_boost_round,
+        engine,
+    )
+    return _training_flight.do(flight_key, _forecast_region_multitarget, *args)
+
+
+def _forecast_region_multitarget(
+    cell_dfs: List[pd.DataFrame],
+    weights: np.ndarray,
+    parameters: List[str],
+    target_dt: datetime,
+    quantiles: List[float],
+    transform_precip: bool,
+    num_boost_round: int,
+    key: Optional[str],
+    engine: str,
+    end_dt: Optional[datetime],
+):
+    pred_index = _prediction_index(target_dt, end_dt)
+    pooled = pd.concat(
+        [normalize_raw_df(df).assign(cell=i) for i, df in enumerate(cell_dfs)]
+    )
+    n = len(pred_index)
+    if engine == "climatology":
+        out = _climatology_quantiles(
+            pooled,
+            parameters,
+            pred_index,
+            [q * 100 for q in quantiles] + [50],
+            window=5,
+            n_cells=len(cell_dfs),
+        )
+        cell_preds = [
+            _climatology_frame(
+                pred_index, parameters, quantiles, out[i * n : (i + 1) * n]
+            )
+            for i in range(len(cell_dfs))
+        ]
+    else:
+        preds_per_param, _ = _fit_predict_quantiles(
+            pooled,
+            parameters,
+            pred_index,
+            quantiles,
+            transform_precip,
+            num_boost_round,
+            key,
+            engine,
+            keys=["cell"] + AGG_KEYS,
+            prefixes=[(i,) for i in range(len(cell_dfs))],
+        )
+        # kết quả nối liền theo ô -> cắt lại từng đoạn len(pred_index)
+        cell_preds = [
+            _pred_frame(
+                pred_index,
+                parameters,
+                {
+                    p: {q: arr[i * n : (i + 1) * n] for q, arr in qmap.items()}
+                    for p, qmap in preds_per_param.items()
+                },
+            )
+            for i in range(len(cell_dfs))
+        ]
+
+    columns = cell_preds[0].columns.drop("datetime")
+    stacked = np.stack([df[columns].to_numpy(dtype=np.float64) for df in cell_preds])
+    region_df = pd.DataFrame(
+        np.tensordot(np.asarray(weights, dtype=np.float64), stacked, axes=1),
+        columns=columns,
+    )
+    region_df.insert(0, "datetime", cell_preds[0]["datetime"])
+    return region_df, cell_preds
+
+
+def grid_array(
+    cell_preds: List[pd.DataFrame], column: str, shape: Tuple[int, int]
+) -> np.ndarray:
+    """
+    Ghép cột `column` của pred_df từng ô (thứ tự hàng-cột như grid.cells_in_bbox)
+    thành mảng (n_hours, n_lat, n_lon).
+    """
+    values = np.stack([df[column].to_numpy(dtype=np.float64) for df in cell_preds])
+    return values.reshape(*shape, -1).transpose(2, 0, 1)
+
+
+# ngày bắt đầu của mỗi tháng trong năm nhuận, để 29/2 cũng có day-of-year riêng
+_LEAP_MONTH_OFFSETS = np.array(
+    [0, 0, 31, 60, 91, 121, 152, 182, 213, 244, 274, 305, 335], dtype=np.int64
+)
+
+
+def _day_of_year(month: np.ndarray, day: np.ndarray) -> np.ndarray:
+    return _LEAP_MONTH_OFFSETS[month] + day
+
+
+# ---------- Forecast: percentile thực nghiệm theo giờ, không train ----------
+def forecast_climatology(
+    raw_df: pd.DataFrame,
+    parameters: List[str],
+    target_dt: datetime,
+    quantiles: List[float] = [0.05, 0.2, 0.35, 0.5, 0.65, 0.8, 0.95],
+    end_dt: Optional[datetime] = None,
+    window: int = 5,
+) -> pd.DataFrame:
+    """
+    Dự báo bằng climatology thực nghiệm: với mỗi ngày cần dự báo, gom các dòng
+    lịch sử cách ngày đó (theo day-of-year, qua mọi năm) không quá `window` ngày,
+    rồi lấy percentile theo từng giờ. Mọi (ngày, giờ, param, quantile) tính trong
+    1 lượt bằng _group_quantiles.
+    Output cùng schema với forecast_lightgbm_multitarget (datetime, {param}_qNN,
+    {param} = median) nên dùng thẳng được với compute_ci_from_pred_df.
+    """
+    pred_index = _prediction_index(target_dt, end_dt)
+    # thêm percentile 50 cho cột median
+    percentiles = [q * 100 for q in quantiles] + [50]
+    out = _climatology_quantiles(
+        normalize_raw_df(raw_df), parameters, pred_index, percentiles, window
+    )
+    return _climatology_frame(pred_index, parameters, quantiles, out)
+
+
+def _climatology_quantiles(
+    raw_df: pd.DataFrame,
+    parameters: List[str],
+    pred_index: pd.DatetimeIndex,
+    percentiles: List[float],
+    window: int,
+    n_cells: int = 1,
+) -> np.ndarray:
+    """
+    Percentile climatology cho mọi giờ của pred_index, shape
+    (n_cells * len(pred_index), len(parameters), len(percentiles)).
+    Nếu n_cells > 1, raw_df gộp nhiều ô với cột "cell" (0..n_cells-1) và kết quả
+    nối liền theo ô; mọi ô tính chung 1 lượt.
+    """
+    pred_days = pred_index[::24]
+    raw_doy = _day_of_year(
+        raw_df["month"].to_numpy(dtype=np.int64), raw_df["day"].to_numpy(dtype=np.int64)
+    )
+    day_doy = _day_of_year(
+        np.asarray(pred_days.month, dtype=np.int64),
+        np.asarray(pred_days.day, dtype=np.int64),
+    )
+    order = np.argsort(raw_doy, kind="stable")
+    sorted_doy = raw_doy[order]
+
+    hours = raw_df["hour"].to_numpy(dtype=np.int64)
+    cells = raw_df["cell"].to_numpy(dtype=np.int64) if n_cells > 1 else 0
+    group = cells * 24 + hours
+    values = raw_df[parameters].to_numpy(dtype=np.float64).reshape(len(raw_df), -1)
+
+    # từng ngày dự báo 1: chỉ các dòng trong window của ngày đó, nhóm (ô, giờ),
+    # nên bộ nhớ không tăng theo số dòng x số ngày
+    out = np.empty((n_cells, len(pred_days), 24, values.shape[1], len(percentiles)))
+    for d, doy in enumerate(day_doy):
+        rows = order[_window_slice(sorted_doy, doy, window)]
+        quantiles, _ = _group_quantiles(
+            group[rows] if n_cells > 1 else hours[rows],
+            values[rows],
+            n_cells * 24,
+            percentiles,
+        )
+        out[:, d] = quantiles.reshape(n_cells, 24, *quantiles.shape[1:])
+    return out.reshape(-1, values.shape[1], len(percentiles))
+
+
+def _window_slice(sorted_doy: np.ndarray, doy: int, window: int) -> np.ndarray:
+    """
+    Vị trí (trong sorted_doy) các dòng cách doy không quá window ngày, tính vòng
+    theo năm 366 ngày.
+    """
+    bounds = [(doy - window, doy + window)]
+    if doy - window < 1 + window:
+        bounds.append((doy - window + 366, doy + window + 366))
+    if doy + window > 366 - window:
+        bounds.append((doy - window - 366, doy + window - 366))
+    parts = [
+        np.arange(
+            np.searchsorted(sorted_doy, lo, side="left"),
+            np.searchsorted(sorted_doy, hi, side="right"),
+        )
+        for lo, hi in bounds
+    ]
+    return np.unique(np.concatenate(parts))
+
+
+def _climatology_frame(
+    pred_index: pd.DatetimeIndex,
+    parameters: List[str],
+    quantiles: List[float],
+    out: np.ndarray,
+) -> pd.DataFrame:
+    """pred_df từ output của _climatology_quantiles (percentile cuối là median)."""
+    pred_dict = {"datetime": list(pred_index.to_pydatetime())}
+    for j, p in enumerate(parameters):
+        for i, q in enumerate(quantiles):
+            pred_dict[f"{p}_q{int(q*100):02d}"] = out[:, j, i]
+        pred_dict[p] = out[:, j, -1]
+    return pd.DataFrame(pred_dict)
 
 
 def compute_ci_from_pred_df(
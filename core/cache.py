@@ -0,0 +1,268 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+DEFAULT_CACHE_DIR = os.getenv("POWER_CACHE_DIR", ".cache/power")
+DEFAULT_CACHE_MAX_BYTES = int(os.getenv("POWER_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+# khi vượt max_bytes, evict xuống còn tỉ lệ này của max_bytes
+EVICT_TARGET = 0.9
+
+
+@contextmanager
+def _file_lock(path: Path):
+    """Lock độc quyền giữa các process (flock, msvcrt trên Windows)."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a+b") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class DiskCache:
+    """
+    Cache file trên đĩa, mỗi key là 1 file, giới hạn tổng dung lượng theo LRU.
+    Thứ tự LRU là mtime của file, tổng dung lượng nằm trong file `.size` của thư
+    mục cache và chỉ được sửa khi giữ file lock, nên giới hạn đúng cho mọi
+    process dùng chung thư mục (worker uvicorn, forecast pool) và sau restart.
+    """
+
+    def __init__(
+        self,
+        directory: str = DEFAULT_CACHE_DIR,
+        max_bytes: int = DEFAULT_CACHE_MAX_BYTES,
+    ):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key: str, suffix: str) -> Path:
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return self.directory / digest[:2] / f"{digest}{suffix}"
+
+    @contextmanager
+    def _locked(self):
+        with self._lock, _file_lock(self.directory / ".lock"):
+            yield
+
+    def _scan(self) -> List[Tuple[float, Path, int]]:
+        """(mtime, path, size) của mọi entry, cũ nhất trước."""
+        files = []
+        if self.directory.exists():
+            for path in self.directory.rglob("*"):
+                if path.name.startswith(".") or path.name.endswith(".tmp"):
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                if path.is_file():
+                    files.append((stat.st_mtime, path, stat.st_size))
+        files.sort()
+        return files
+
+    def _read_total(self) -> int:
+        try:
+            return int((self.directory / ".size").read_text())
+        except (FileNotFoundError, ValueError):
+            # chưa có sổ dung lượng (cache cũ) -> đếm lại từ đĩa
+            return sum(size for _, _, size in self._scan())
+
+    def _write_total(self, total: int):
+        (self.directory / ".size").write_text(str(max(0, total)))
+
+    def _evict(self, total: int) -> int:
+        """Gọi khi giữ lock; trả về tổng dung lượng sau khi evict."""
+        if total <= self.max_bytes:
+            return total
+        # quét lại đĩa (sửa luôn sai lệch của sổ), xoá file cũ nhất tới khi còn
+        # EVICT_TARGET * max_bytes để không phải quét lại ở mỗi lần ghi
+        files = self._scan()
+        total = sum(size for _, _, size in files)
+        target = self.max_bytes * EVICT_TARGET
+        while total > target and len(files) > 1:
+            _, path, size = files.pop(0)
+            total -= size
+            self.evictions += 1
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+        return total
+
+    def get_path(self, key: str, suffix: str = "") -> Optional[Path]:
+        """Trả về path của entry nếu có (tính là hit), ngược lại None (miss)."""
+        path = self._path(key, suffix)
+        if path.exists():
+            self.hits += 1
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return path
+        self.misses += 1
+        return None
+
+    def put_bytes(self, key: str, data: bytes, suffix: str = "") -> Path:
+        path = self._path(key, suffix)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # ghi ra file tạm rồi rename để reader không bao giờ thấy file dở dang
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(data)
+        with self._locked():
+            # đọc sổ trước khi thay file: sổ thiếu thì quét đĩa, không được
+            # đếm file mới 2 lần
+            total = self._read_total()
+            try:
+                old_size = path.stat().st_size
+            except FileNotFoundError:
+                old_size = 0
+            os.replace(tmp, path)
+            total += len(data) - old_size
+            self._write_total(self._evict(total))
+        return path
+
+    def get_bytes(self, key: str, suffix: str = "") -> Optional[bytes]:
+        path = self.get_path(key, suffix)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except FileNotFoundError:
+            # bị evict bởi thread/process khác giữa lúc check và lúc đọc
+            return None
+
+    def get_frame(self, key: str) -> Optional[pd.DataFrame]:
+        path = self.get_path(key, ".parquet")
+        if path is None:
+            return None
+        try:
+            return pd.read_parquet(path)
+        except (FileNotFoundError, OSError):
+            return None
+
+    def put_frame(self, key: str, df: pd.DataFrame) -> Path:
+        data = df.to_parquet(index=True)
+        return self.put_bytes(key, data, ".parquet")
+
+    def stats(self) -> Dict[str, int]:
+        with self._locked():
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._scan()),
+                "bytes": self._read_total(),
+                "max_bytes": self.max_bytes,
+            }
+
+    def clear(self):
+        with self._locked():
+            for _, path, _ in self._scan():
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            self._write_total(0)
+
+
+class MemoryCache:
+    """
+    LRU trong RAM có TTL, giới hạn theo số entry và/hoặc tổng kích thước
+    (kích thước 1 entry tính bằng `sizeof`). Entry hết hạn bị bỏ khi đọc tới.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        max_items: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+        sizeof: Optional[Callable[[Any], int]] = None,
+    ):
+        self.ttl = ttl
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: 0)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries: OrderedDict = OrderedDict()  # key -> (expires, size, value)
+        self._total_bytes = 0
+
+    def _pop(self, key: Hashable):
+        _, size, _ = self._entries.pop(key)
+        self._total_bytes -= size
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.time():
+                self._pop(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[2]
+
+    def put(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0:
+            return
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            if self.max_bytes is not None and size > self.max_bytes:
+                return
+            self._entries[key] = (time.time() + ttl, size, value)
+            self._total_bytes += size
+            while self._entries and (
+                (self.max_items is not None and len(self._entries) > self.max_items)
+                or (self.max_bytes is not None and self._total_bytes > self.max_bytes)
+            ):
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
@@ -0,0 +1,123 @@
+import os
+import asyncio
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional
+
+import pandas as pd
+
+from core.analysis import create_monthly_avg_df
+from core.cache import DiskCache
+from core.data_fetcher import _get_monthly_years, _is_final, monthly_year_range
+from core.grid import GridCell
+from core.http_client import http_client
+from core.singleflight import AsyncSingleFlight
+
+
+CLIMATOLOGY_DIR = os.getenv("CLIMATOLOGY_DIR", ".cache/climatology")
+CLIMATOLOGY_MAX_BYTES = int(os.getenv("CLIMATOLOGY_MAX_BYTES", 64 * 1024 * 1024))
+CLIMATOLOGY_MEMORY_ITEMS = int(os.getenv("CLIMATOLOGY_MEMORY_ITEMS", 1024))
+
+# tăng khi đổi cách tính bảng climatology
+CLIMATOLOGY_VERSION = 1
+
+
+class MonthlyClimatologyStore:
+    """
+    Bảng climatology 12 tháng (trung bình từng tháng qua nhiều năm, output của
+    analysis.create_monthly_avg_df) cho từng ô lưới. Tính 1 lần từ 1 request POWER
+    monthly cho cả khoảng năm rồi lưu parquet trên đĩa + LRU trong RAM. Key gồm
+    khoảng năm nên bảng chỉ được tính lại khi sang năm mới.
+    """
+
+    def __init__(
+        self,
+        store: Optional[DiskCache] = None,
+        memory_items: int = CLIMATOLOGY_MEMORY_ITEMS,
+    ):
+        self.store = store or DiskCache(CLIMATOLOGY_DIR, CLIMATOLOGY_MAX_BYTES)
+        self.memory_items = memory_items
+        self._memory: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = AsyncSingleFlight()
+
+    def key(
+        self, cell: GridCell, start_year: str, end_year: str, parameters: List[str]
+    ) -> str:
+        params = ",".join(sorted(parameters))
+        return (
+            f"monthly-clim:v{CLIMATOLOGY_VERSION}:{cell.key}"
+            f":{start_year}:{end_year}:{params}"
+        )
+
+    def _remember(self, key: str, df: pd.DataFrame):
+        with self._lock:
+            self._memory[key] = df
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    async def _load(
+        self,
+        cell: GridCell,
+        start_year: str,
+        end_year: str,
+        parameters: List[str],
+        key: str,
+    ) -> pd.DataFrame:
+        df = await asyncio.to_thread(self.store.get_frame, key)
+        if df is None:
+            raw_df = await _get_monthly_years(cell, start_year, end_year, parameters)
+            df = create_monthly_avg_df(raw_df, parameters)
+            # đầu năm POWER có thể chưa chốt số liệu tháng 12 -> chỉ giữ trong RAM
+            if _is_final(datetime(int(end_year), 12, 31)):
+                await asyncio.to_thread(self.store.put_frame, key, df)
+        self._remember(key, df)
+        return df
+
+    async def _get(
+        self,
+        cell: GridCell,
+        parameters: List[str],
+        target_date: datetime,
+        years_back: int,
+    ) -> pd.DataFrame:
+        start_year, end_year = monthly_year_range(target_date, 0, years_back)
+        key = self.key(cell, start_year, end_year, parameters)
+        with self._lock:
+            df = self._memory.get(key)
+            if df is not None:
+                self._memory.move_to_end(key)
+                return df
+        return await self._flight.do(
+            key, self._load, cell, start_year, end_year, parameters, key
+        )
+
+    async def get_async(
+        self,
+        cell: GridCell,
+        parameters: List[str],
+        target_date: datetime,
+        years_back: int = 10,
+    ) -> pd.DataFrame:
+        """
+        Bảng (month, param...) của years_back năm trước target_date.
+        Kết quả dùng chung giữa các request, không được sửa tại chỗ.
+        """
+        return await http_client.run_async(
+            self._get(cell, parameters, target_date, years_back)
+        )
+
+    def get(
+        self,
+        cell: GridCell,
+        parameters: List[str],
+        target_date: datetime,
+        years_back: int = 10,
+    ) -> pd.DataFrame:
+        return http_client.run(self._get(cell, parameters, target_date, years_back))
+
+
+# store dùng chung cho toàn app
+monthly_climatology = MonthlyClimatologyStore()
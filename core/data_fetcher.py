@@ -1,10 +1,56 @@
 import asyncio
-from typing import Any, Dict, List
+import hashlib
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 from datetime import timedelta, datetime
 
 import aiohttp
+import numpy as np
 import pandas as pd
 
+from core.cache import DiskCache
+from core.grid import GridCell, snap_to_grid
+from core.http_client import http_client
+from core.singleflight import AsyncSingleFlight
+
+
+# cache dùng chung cho mọi request; dữ liệu lịch sử của POWER không đổi
+power_cache = DiskCache()
+
+# các request đồng thời cùng window chỉ tạo 1 lần fetch tới POWER
+_window_flight = AsyncSingleFlight()
+
+# tăng khi đổi định dạng frame hourly lưu trong cache
+HOURLY_FORMAT_VERSION = 2
+
+# POWER cần vài ngày để chốt số liệu, window kết thúc gần hơn mức này thì không cache
+FINAL_DATA_LAG = timedelta(days=7)
+
+
+def _is_final(end: datetime) -> bool:
+    return end < datetime.now() - FINAL_DATA_LAG
+
+
+def _hourly_cache_key(
+    cell: GridCell,
+    start_date: str,
+    end_date: str,
+    parameters: List[str],
+) -> str:
+    return (
+        f"hourly:v{HOURLY_FORMAT_VERSION}:{cell.key}:{start_date}:{end_date}"
+        f":{','.join(sorted(parameters))}"
+    )
+
+
+def _monthly_cache_key(
+    cell: GridCell,
+    start_year: str,
+    end_year: str,
+    parameters: List[str],
+) -> str:
+    params = ",".join(sorted(parameters))
+    return f"monthly:{cell.key}:{start_year}:{end_year}:{params}"
+
 
 async def fetch_hourly_data_from_power_dav(
     session: aiohttp.ClientSession,
@@ -22,7 +68,7 @@ async def fetch_hourly_data_from_power_dav(
         f"&format=JSON&community=RE"
     )
 
-    async with session.get(url) as response:
+    async with http_client.limit("power"), session.get(url) as response:
         response.raise_for_status()
         data: Dict[str, Any] = await response.json()
 
@@ -32,44 +78,233 @@ async def fetch_hourly_data_from_power_dav(
         return data["properties"]["parameter"]
 
 
-async def get_hourly_data_async(
+def decode_power_hourly(
+    result: Dict[str, Dict[str, float]], parameters: List[str]
+) -> pd.DataFrame:
+    """
+    Giải mã payload hourly của POWER ({param: {"YYYYMMDDHH": value}}) trong 1 lượt:
+    giá trị -> mảng float32 liên tục, key -> datetime index tính bằng số học
+    (không parse chuỗi), kèm sẵn các cột year/month/day/hour mà
+    normalize_raw_df cần.
+    """
+    keys = list(result[parameters[0]])
+    n = len(keys)
+    codes = np.fromiter(map(int, keys), dtype=np.int64, count=n)
+    year = codes // 1_000_000
+    month = codes // 10_000 % 100
+    day = codes // 100 % 100
+    hour = codes % 100
+
+    index = (
+        (year - 1970).astype("datetime64[Y]").astype("datetime64[M]")
+        + (month - 1).astype("timedelta64[M]")
+    ).astype("datetime64[D]")
+    index = index + (day - 1).astype("timedelta64[D]") + hour.astype("timedelta64[h]")
+
+    columns = {}
+    for parameter in parameters:
+        values = result[parameter]
+        if len(values) == n and list(values) == keys:
+            columns[parameter] = np.fromiter(values.values(), dtype=np.float32, count=n)
+        else:
+            # thứ tự key khác nhau giữa các param (hiếm) -> căn theo key
+            columns[parameter] = np.array(
+                [values.get(k, np.nan) for k in keys], dtype=np.float32
+            )
+    columns["year"] = year.astype(np.int32)
+    columns["month"] = month.astype(np.int32)
+    columns["day"] = day.astype(np.int32)
+    columns["hour"] = hour.astype(np.int32)
+
+    index = pd.DatetimeIndex(index.astype("datetime64[ns]"))
+    return pd.DataFrame(columns, index=index)
+
+
+async def fetch_hourly_window(
+    session: aiohttp.ClientSession,
+    cell: GridCell,
+    start: datetime,
+    end: datetime,
+    parameters: List[str],
+) -> pd.DataFrame:
+    """Lấy 1 khoảng ngày liên tục, ưu tiên đọc từ cache trên đĩa."""
+    start_date = start.strftime("%Y%m%d")
+    end_date = end.strftime("%Y%m%d")
+    key = _hourly_cache_key(cell, start_date, end_date, parameters)
+    return await _window_flight.do(
+        key, _load_hourly_window, session, cell, start, end, parameters, key
+    )
+
+
+async def _load_hourly_window(
+    session: aiohttp.ClientSession,
+    cell: GridCell,
+    start: datetime,
+    end: datetime,
+    parameters: List[str],
+    key: str,
+) -> pd.DataFrame:
+    start_date = start.strftime("%Y%m%d")
+    end_date = end.strftime("%Y%m%d")
+
+    # đọc/ghi parquet trong thread để không chặn loop dùng chung của http_client
+    df = await asyncio.to_thread(power_cache.get_frame, key)
+    if df is not None:
+        return df
+
+    result = await fetch_hourly_data_from_power_dav(
+        session, cell.latitude, cell.longitude, start_date, end_date, parameters
+    )
+    df = decode_power_hourly(result, parameters)
+
+    if _is_final(end):
+        await asyncio.to_thread(power_cache.put_frame, key, df)
+    return df
+
+
+def _shift_year(date: datetime, year: int) -> datetime:
+    # 29/02 không tồn tại ở năm không nhuận -> lùi về 28/02
+    if date.month == 2 and date.day == 29:
+        date = date.replace(day=28)
+    return date.replace(year=year)
+
+
+def _training_days(
     target_date: datetime,
+    end_date: Optional[datetime],
+    window: int,
+    years_back: int,
+) -> str:
+    days = f"{target_date:%Y%m%d}"
+    if end_date is not None:
+        days = f"{days}-{end_date:%Y%m%d}"
+    # window gần nhất chưa chốt số liệu -> dữ liệu train đổi theo ngày fetch,
+    # key gắn ngày hiện tại để model train trên đó không bị dùng lại mãi
+    data_end = plan_hourly_ranges(
+        target_date, end_date or target_date, window, years_back
+    )[-1][1]
+    if not _is_final(data_end):
+        days = f"{days}@{datetime.now():%Y%m%d}"
+    return days
+
+
+def training_key(
+    cell: GridCell,
+    target_date: datetime,
+    window: int = 5,
+    years_back: int = 10,
+    end_date: Optional[datetime] = None,
+) -> str:
+    """
+    Định danh bộ dữ liệu train mà fetch_hourly_data trả về cho (ô lưới, ngày),
+    hoặc fetch_hourly_range cho (ô lưới, khoảng ngày) nếu có end_date. Dữ liệu
+    chưa chốt (xem FINAL_DATA_LAG) thì key kèm ngày fetch.
+    """
+    days = _training_days(target_date, end_date, window, years_back)
+    return f"{cell.key}:{days}:{window}:{years_back}"
+
+
+def region_training_key(
+    cells: Sequence[GridCell],
+    target_date: datetime,
+    window: int = 5,
+    years_back: int = 10,
+    end_date: Optional[datetime] = None,
+) -> str:
+    """Như training_key nhưng cho bộ dữ liệu gộp của nhiều ô (fetch_hourly_cells)."""
+    cell_keys = ",".join(cell.key for cell in cells)
+    digest = hashlib.sha1(cell_keys.encode("utf-8")).hexdigest()[:12]
+    days = _training_days(target_date, end_date, window, years_back)
+    return f"region{len(cells)}_{digest}:{days}:{window}:{years_back}"
+
+
+def plan_hourly_ranges(
+    start_date: datetime,
+    end_date: datetime,
+    window: int = 5,
+    years_back: int = 10,
+) -> List[Tuple[datetime, datetime]]:
+    """
+    Tính tập khoảng ngày liên tục (theo từng năm quá khứ) nhỏ nhất phủ hết các
+    window +/-`window` ngày của mọi ngày trong [start_date, end_date].
+    Trả về list (start, end) đã sắp xếp, 2 đầu đều tính cả ngày.
+    """
+    start_date = start_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    end_date = end_date.replace(hour=0, minute=0, second=0, microsecond=0)
+    intervals = []
+    for i in range(1, years_back + 1):
+        # dịch cả khoảng lùi i năm; các ngày liên tiếp vẫn liên tiếp
+        lo = _shift_year(start_date, start_date.year - i) - timedelta(days=window)
+        hi = _shift_year(end_date, end_date.year - i) + timedelta(days=window)
+        intervals.append((lo, hi))
+    intervals.sort()
+
+    # gộp các khoảng chồng lấn hoặc nằm sát nhau
+    merged: List[Tuple[datetime, datetime]] = []
+    for lo, hi in intervals:
+        if merged and lo <= merged[-1][1] + timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+async def _get_hourly_range(
+    start_date: datetime,
+    end_date: datetime,
     latitude: float,
     longitude: float,
     parameters: List[str],
-    window: int = 5,
-    years_back: int = 10,
+    window: int,
+    years_back: int,
 ) -> pd.DataFrame:
-    dfs: List[pd.DataFrame] = []
-
-    async with aiohttp.ClientSession() as session:
-        sessions = []
-        for i in range(1, years_back + 1):
-            past_year = target_date.year - i
-            start_date = (
-                target_date.replace(year=past_year) - timedelta(days=window)
-            ).strftime("%Y%m%d")
-            end_date = (
-                target_date.replace(year=past_year) + timedelta(days=window)
-            ).strftime("%Y%m%d")
-            sessions.append(
-                fetch_hourly_data_from_power_dav(
-                    session, latitude, longitude, start_date, end_date, parameters
-                )
-            )
+    # các toạ độ gần nhau cùng rơi vào 1 ô lưới POWER -> dùng chung fetch/cache
+    cell = snap_to_grid(latitude, longitude)
 
-        results = await asyncio.gather(*sessions)
+    # mỗi window là 1 file trong power_cache, window trùng nhau giữa các request
+    # (ngày kề nhau, năm khác nhau) dùng chung file
+    ranges = plan_hourly_ranges(start_date, end_date, window, years_back)
+    session = await http_client.session()
+    sessions = [
+        fetch_hourly_window(session, cell, lo, hi, parameters) for lo, hi in ranges
+    ]
+    dfs = await asyncio.gather(*sessions)
+    return pd.concat(dfs, axis=0)
 
-    for i, result in enumerate(results, 1):
-        past_year = target_date.year - i
-        df = pd.DataFrame(
-            {parameter: pd.Series(result[parameter]) for parameter in parameters}
+
+async def get_hourly_range_async(
+    start_date: datetime,
+    end_date: datetime,
+    latitude: float,
+    longitude: float,
+    parameters: List[str],
+    window: int = 5,
+    years_back: int = 10,
+) -> pd.DataFrame:
+    return await http_client.run_async(
+        _get_hourly_range(
+            start_date, end_date, latitude, longitude, parameters, window, years_back
         )
-        df.index = pd.to_datetime(df.index, format="%Y%m%d%H")
-        dfs.append(df)
+    )
+
 
-    full_df = pd.concat(dfs, axis=0)
-    return full_df
+async def get_hourly_data_async(
+    target_date: datetime,
+    latitude: float,
+    longitude: float,
+    parameters: List[str],
+    window: int = 5,
+    years_back: int = 10,
+) -> pd.DataFrame:
+    return await get_hourly_range_async(
+        target_date,
+        target_date,
+        latitude,
+        longitude,
+        parameters,
+        window=window,
+        years_back=years_back,
+    )
 
 
 def fetch_hourly_data(
@@ -81,18 +316,81 @@ def fetch_hourly_data(
     years_back: int = 10,
 ) -> pd.DataFrame:
 
-    return asyncio.run(
-        get_hourly_data_async(
+    return http_client.run(
+        _get_hourly_range(
+            target_date,
             target_date,
             latitude,
             longitude,
             parameters,
-            window=window,
-            years_back=years_back,
+            window,
+            years_back,
+        )
+    )
+
+
+def fetch_hourly_range(
+    start_date: datetime,
+    end_date: datetime,
+    latitude: float,
+    longitude: float,
+    parameters: List[str],
+    window: int = 5,
+    years_back: int = 10,
+) -> pd.DataFrame:
+    """Fetch 1 lần toàn bộ dữ liệu cần cho dự báo nhiều ngày liên tiếp."""
+    return http_client.run(
+        _get_hourly_range(
+            start_date,
+            end_date,
+            latitude,
+            longitude,
+            parameters,
+            window,
+            years_back,
+        )
+    )
+
+
+async def _get_hourly_cells(
+    start_date: datetime,
+    end_date: datetime,
+    cells: Sequence[GridCell],
+    parameters: List[str],
+    window: int,
+    years_back: int,
+) -> List[pd.DataFrame]:
+    # mọi window của mọi ô chạy cùng lúc, chung semaphore "power" của http_client
+    return await asyncio.gather(
+        *(
+            _get_hourly_range(
+                start_date,
+                end_date,
+                cell.latitude,
+                cell.longitude,
+                parameters,
+                window,
+                years_back,
+            )
+            for cell in cells
         )
     )
 
 
+def fetch_hourly_cells(
+    start_date: datetime,
+    end_date: datetime,
+    cells: Sequence[GridCell],
+    parameters: List[str],
+    window: int = 5,
+    years_back: int = 10,
+) -> List[pd.DataFrame]:
+    """Như fetch_hourly_range cho nhiều ô lưới, fetch đồng thời; 1 frame mỗi ô."""
+    return http_client.run(
+        _get_hourly_cells(start_date, end_date, cells, parameters, window, years_back)
+    )
+
+
 async def fetch_monthly_data_from_power_dav(
     session: aiohttp.ClientSession,
     latitude: float,
@@ -108,12 +406,95 @@ async def fetch_monthly_data_from_power_dav(
         f"&parameters={','.join(parameters)}"
         f"&format=JSON&community=RE"
     )
-    async with session.get(url) as response:
+    async with http_client.limit("power"), session.get(url) as response:
         response.raise_for_status()
         js = await response.json()
         return js["properties"]["parameter"]
 
 
+async def fetch_monthly_window(
+    session: aiohttp.ClientSession,
+    cell: GridCell,
+    start_year: str,
+    end_year: str,
+    parameters: List[str],
+) -> pd.DataFrame:
+    """Lấy dữ liệu tháng cho khoảng năm, ưu tiên đọc từ cache trên đĩa."""
+    key = _monthly_cache_key(cell, start_year, end_year, parameters)
+    return await _window_flight.do(
+        key, _load_monthly_window, session, cell, start_year, end_year, parameters, key
+    )
+
+
+async def _load_monthly_window(
+    session: aiohttp.ClientSession,
+    cell: GridCell,
+    start_year: str,
+    end_year: str,
+    parameters: List[str],
+    key: str,
+) -> pd.DataFrame:
+    # đọc/ghi parquet trong thread để không chặn loop dùng chung của http_client
+    df = await asyncio.to_thread(power_cache.get_frame, key)
+    if df is not None:
+        return df
+
+    result = await fetch_monthly_data_from_power_dav(
+        session, cell.latitude, cell.longitude, start_year, end_year, parameters
+    )
+    # bỏ các key tháng "13" (giá trị trung bình năm) của POWER
+    df = pd.DataFrame(
+        {
+            parameter: pd.Series(
+                {k: v for k, v in result[parameter].items() if not k.endswith("13")}
+            )
+            for parameter in parameters
+        }
+    )
+    df.index = pd.to_datetime(df.index, format="%Y%m")
+
+    if _is_final(datetime(int(end_year), 12, 31)):
+        await asyncio.to_thread(power_cache.put_frame, key, df)
+    return df
+
+
+def monthly_year_range(
+    target_date: datetime, window: int = 0, years_back: int = 10
+) -> Tuple[str, str]:
+    """Khoảng năm (start, end) phủ +/-window ngày quanh target_date của years_back năm trước."""
+    first = _shift_year(target_date, target_date.year - years_back)
+    last = _shift_year(target_date, target_date.year - 1)
+    start_year = (first - timedelta(days=window)).strftime("%Y")
+    end_year = (last + timedelta(days=window)).strftime("%Y")
+    return start_year, end_year
+
+
+async def _get_monthly_years(
+    cell: GridCell, start_year: str, end_year: str, parameters: List[str]
+) -> pd.DataFrame:
+    """Dữ liệu tháng của cả khoảng năm trong 1 request POWER, có cột year/month."""
+    session = await http_client.session()
+    df = await fetch_monthly_window(session, cell, start_year, end_year, parameters)
+    df = df.copy()
+    df["year"] = df.index.year
+    df["month"] = df.index.month
+    return df.reset_index(drop=True)
+
+
+async def _get_monthly_data(
+    target_date: datetime,
+    latitude: float,
+    longitude: float,
+    parameters: List[str],
+    window: int,
+    years_back: int,
+) -> pd.DataFrame:
+    # POWER monthly nhận khoảng năm -> 1 request cho mọi năm thay vì 1 request/năm
+    cell = snap_to_grid(latitude, longitude)
+    start_year, end_year = monthly_year_range(target_date, window, years_back)
+    return await _get_monthly_years(cell, start_year, end_year, parameters)
+
+
 async def get_monthly_data_async(
     target_date: datetime,
     latitude: float,
@@ -121,38 +502,12 @@ async def get_monthly_data_async(
     parameters: List[str],
     window: int = 0,
     years_back: int = 10,
-):
-    dfs = []
-    async with aiohttp.ClientSession() as session:
-        sessions = []
-        for i in range(1, years_back + 1):
-            past_year = target_date.year - i
-            start_year = (
-                target_date.replace(year=past_year) - timedelta(days=window)
-            ).strftime("%Y")
-            end_year = (
-                target_date.replace(year=past_year) + timedelta(days=window)
-            ).strftime("%Y")
-            sessions.append(
-                fetch_monthly_data_from_power_dav(
-                    session, latitude, longitude, start_year, end_year, parameters
-                )
-            )
-        results = await asyncio.gather(*sessions)
-
-    # convert to dataframe list
-    for i, result in enumerate(results, 1):
-        past_year = target_date.year - i
-        for p in parameters:
-            del result[p][f"{past_year}13"]
-        df = pd.DataFrame({parameter: pd.Series(result[p]) for parameter in parameters})
-        df.index = pd.to_datetime(df.index, format="%Y%m")
-        df["year"] = past_year
-        df["month"] = df.index.month
-        dfs.append(df)
-
-    full_df = pd.concat(dfs, axis=0)
-    return full_df.reset_index(drop=True)
+) -> pd.DataFrame:
+    return await http_client.run_async(
+        _get_monthly_data(
+            target_date, latitude, longitude, parameters, window, years_back
+        )
+    )
 
 
 def fetch_monthly_data(
@@ -164,13 +519,8 @@ def fetch_monthly_data(
     years_back: int = 10,
 ) -> pd.DataFrame:
 
-    return asyncio.run(
-        get_monthly_data_async(
-            target_date,
-            latitude,
-            longitude,
-            parameters,
-            window=window,
-            years_back=years_back,
+    return http_client.run(
+        _get_monthly_data(
+            target_date, latitude, longitude, parameters, window, years_back
         )
     )
@@ -0,0 +1,73 @@
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+def local_extrema(y) -> np.ndarray:
+    """Chỉ số các cực đại/cực tiểu địa phương (chặt), như Max/Min trên figure."""
+    y = np.asarray(y, dtype=np.float64)
+    if len(y) < 3:
+        return np.array([], dtype=np.int64)
+    mid, left, right = y[1:-1], y[:-2], y[2:]
+    mask = ((mid > left) & (mid > right)) | ((mid < left) & (mid < right))
+    return np.flatnonzero(mask) + 1
+
+
+def lttb_indices(y, n_out: int, x=None) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: chọn n_out điểm giữ hình dạng chuỗi (luôn giữ
+    điểm đầu/cuối). Mỗi bucket chọn điểm tạo tam giác lớn nhất với điểm đã chọn
+    ở bucket trước và trung bình bucket sau. Trả về chỉ số tăng dần.
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if n_out >= n or n <= 2:
+        return np.arange(n)
+    n_out = max(n_out, 3)
+    x = np.arange(n, dtype=np.float64) if x is None else np.asarray(x, np.float64)
+
+    # n_out - 2 bucket cho các điểm 1..n-2
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    prev = 0
+    for b in range(n_out - 2):
+        start, end = edges[b], edges[b + 1]
+        # trung bình bucket kế tiếp (bucket cuối -> điểm cuối)
+        next_end = edges[b + 2] if b + 2 < len(edges) else n
+        next_start = end if b + 2 < len(edges) else n - 1
+        avg_x = x[next_start:next_end].mean()
+        avg_y = np.nanmean(y[next_start:next_end]) if next_end > next_start else 0.0
+        area = np.abs(
+            (x[prev] - avg_x) * (y[start:end] - y[prev])
+            - (x[prev] - x[start:end]) * (avg_y - y[prev])
+        )
+        area = np.where(np.isnan(area), -1.0, area)
+        prev = start + int(np.argmax(area))
+        selected[b + 1] = prev
+    return selected
+
+
+def downsample_ci_df(
+    ci_df: pd.DataFrame, parameter: str, max_points: Optional[int]
+) -> pd.DataFrame:
+    """
+    Giảm số dòng của bảng CI (output compute_ci_from_pred_df) xuống khoảng
+    max_points theo đường mean của `parameter`, trước khi dựng figure.
+    Giữ các cực trị địa phương (tối đa nửa budget, ưu tiên cực trị nổi bật nhất),
+    phần còn lại chọn bằng LTTB. Các dải CI lấy cùng các dòng với mean.
+    """
+    if not max_points or len(ci_df) <= max_points:
+        return ci_df
+    y = ci_df[parameter].to_numpy(dtype=np.float64)
+
+    extrema = local_extrema(y)
+    keep = max_points // 2
+    if len(extrema) > keep:
+        # độ nổi bật: chênh lệch so với trung bình 2 điểm kề
+        prominence = np.abs(y[extrema] - (y[extrema - 1] + y[extrema + 1]) / 2)
+        extrema = extrema[np.argsort(-prominence, kind="stable")[:keep]]
+
+    indices = np.union1d(lttb_indices(y, max_points - len(extrema)), extrema)
+    return ci_df.iloc[indices].reset_index(drop=True)
@@ -1,29 +1,58 @@
-import requests
+import os
 from typing import Tuple, Dict
 
-import geocoder
-from opencage.geocoder import OpenCageGeocode
+from core.cache import MemoryCache
+from core.http_client import http_client
+
+
+# toạ độ của 1 địa danh gần như không đổi, giữ lâu để khỏi gọi lại Nominatim
+GEOCODE_CACHE_TTL = float(os.getenv("GEOCODE_CACHE_TTL", 7 * 24 * 3600))
+GEOCODE_CACHE_ITEMS = int(os.getenv("GEOCODE_CACHE_ITEMS", 4096))
+
+geocode_cache = MemoryCache(GEOCODE_CACHE_TTL, max_items=GEOCODE_CACHE_ITEMS)
+
+
+async def _geocode_osm(place: str, user_agent: str) -> Tuple[float, float]:
+    # "Ha  Noi" và "ha noi" là cùng 1 truy vấn
+    key = " ".join(place.split()).casefold()
+    coords = geocode_cache.get(key)
+    if coords is not None:
+        return coords
 
-def geocode_osm(place: str, user_agent: str = "climate-app") -> Tuple[float, float]:
     url = f"https://nominatim.openstreetmap.org/search"
     params = {"q": place, "format": "json", "limit": 1}
     headers = {"User-Agent": user_agent}
 
-    r = requests.get(url, params=params, headers=headers, timeout=10)
-    r.raise_for_status()
-    arr = r.json()
+    arr = await http_client.get_json(url, "nominatim", params=params, headers=headers)
 
     if not arr:
         raise ValueError(f"Can not find place {place}")
 
-    return float(arr[0]["lat"]), float(arr[0]["lon"])
+    coords = float(arr[0]["lat"]), float(arr[0]["lon"])
+    geocode_cache.put(key, coords)
+    return coords
+
+
+async def geocode_osm_async(
+    place: str, user_agent: str = "climate-app"
+) -> Tuple[float, float]:
+    return await http_client.run_async(_geocode_osm(place, user_agent))
+
+
+def geocode_osm(place: str, user_agent: str = "climate-app") -> Tuple[float, float]:
+    return http_client.run(_geocode_osm(place, user_agent))
 
 
 def get_current_coordinate() -> Tuple[float, float]:
+    # geocoder/opencage chỉ dùng cho trang chủ, import khi cần
+    import geocoder
+
     return geocoder.ip("me").latlng
 
 
 def get_current_place() -> Dict[str, str]:
+    from opencage.geocoder import OpenCageGeocode
+
     key = "a62ac1641535410e9621cdfadbc9f614"
     geocoder = OpenCageGeocode(key)
     latitude, longitude = get_current_coordinate()
@@ -0,0 +1,157 @@
+import os
+from typing import List, NamedTuple, Sequence, Tuple
+
+import numpy as np
+
+
+# Lưới MERRA-2 mà POWER dùng cho dữ liệu khí tượng: 0.5° vĩ độ x 0.625° kinh độ,
+# tâm ô đầu tiên ở (-90, -180).
+LAT_STEP = 0.5
+LON_STEP = 0.625
+N_LAT = int(180 / LAT_STEP) + 1
+N_LON = int(360 / LON_STEP)
+
+# số ô tối đa cho 1 request forecast vùng
+REGION_MAX_CELLS = int(os.getenv("REGION_MAX_CELLS", 64))
+# số ô tối đa cho 1 request raster theo bounding box
+RASTER_MAX_CELLS = int(os.getenv("RASTER_MAX_CELLS", 400))
+# số tâm ô tối đa trong bounding box của đa giác trước khi ray casting
+REGION_MAX_BBOX_CELLS = int(os.getenv("REGION_MAX_BBOX_CELLS", 100_000))
+
+
+class GridCell(NamedTuple):
+    """1 ô lưới POWER, định danh bằng chỉ số (vĩ độ, kinh độ) trên lưới."""
+
+    lat_index: int
+    lon_index: int
+
+    @property
+    def latitude(self) -> float:
+        return -90.0 + self.lat_index * LAT_STEP
+
+    @property
+    def longitude(self) -> float:
+        return -180.0 + self.lon_index * LON_STEP
+
+    @property
+    def key(self) -> str:
+        return f"{self.lat_index}_{self.lon_index}"
+
+    def to_dict(self):
+        return {
+            "key": self.key,
+            "latitude": self.latitude,
+            "longitude": self.longitude,
+        }
+
+
+def snap_to_grid(latitude: float, longitude: float) -> GridCell:
+    """Trả về ô lưới POWER chứa toạ độ (lat, lon) bất kỳ."""
+    lat_index = int(round((latitude + 90.0) / LAT_STEP))
+    lat_index = min(max(lat_index, 0), N_LAT - 1)
+    lon_index = int(round((longitude + 180.0) / LON_STEP)) % N_LON
+    return GridCell(lat_index, lon_index)
+
+
+def cells_in_polygon(
+    polygon: Sequence[Sequence[float]], max_cells: int = REGION_MAX_CELLS
+) -> List[GridCell]:
+    """
+    Các ô lưới POWER có tâm nằm trong đa giác [[lat, lon], ...] (ray casting,
+    vector hoá trên mọi tâm ô trong bounding box), theo thứ tự (lat, lon) với
+    kinh độ từ tây sang đông. Cạnh dài hơn 180° kinh độ được hiểu là vắt qua
+    kinh tuyến 180, như west > east của cells_in_bbox.
+    Đa giác nhỏ hơn 1 ô (không chứa tâm ô nào) -> ô chứa trọng tâm các đỉnh.
+    Raise ValueError nếu đa giác trải quá 360° kinh độ, bounding box quá
+    REGION_MAX_BBOX_CELLS ô hoặc kết quả nhiều hơn max_cells ô.
+    """
+    vertices = np.array(polygon, dtype=np.float64).reshape(-1, 2)
+    # unwrap kinh độ: mỗi cạnh đi theo chiều ngắn (<= 180°), kinh độ có thể
+    # vượt ra ngoài [-180, 180)
+    steps = (np.diff(vertices[:, 1]) + 180.0) % 360.0 - 180.0
+    vertices[1:, 1] = vertices[0, 1] + np.cumsum(steps)
+
+    lat_lo = snap_to_grid(vertices[:, 0].min(), 0.0).lat_index
+    lat_hi = snap_to_grid(vertices[:, 0].max(), 0.0).lat_index
+    # chỉ số kinh độ chưa lấy modulo, để dải ô liên tục qua kinh tuyến 180
+    lon_lo = int(round((vertices[:, 1].min() + 180.0) / LON_STEP))
+    lon_hi = int(round((vertices[:, 1].max() + 180.0) / LON_STEP))
+    if vertices[:, 1].max() - vertices[:, 1].min() >= 360.0:
+        raise ValueError("Region spans 360° of longitude or more")
+    n_bbox = (lat_hi - lat_lo + 1) * (lon_hi - lon_lo + 1)
+    if n_bbox > REGION_MAX_BBOX_CELLS:
+        raise ValueError(
+            f"Region bounding box covers {n_bbox} POWER cells, "
+            f"at most {REGION_MAX_BBOX_CELLS} allowed"
+        )
+    lat_idx = np.arange(lat_lo, lat_hi + 1)
+    lon_idx = np.arange(lon_lo, lon_hi + 1)
+    grid_lat, grid_lon = np.meshgrid(lat_idx, lon_idx, indexing="ij")
+    lat = -90.0 + grid_lat.ravel() * LAT_STEP
+    lon = -180.0 + grid_lon.ravel() * LON_STEP
+
+    # đếm số cạnh mà tia theo hướng kinh độ tăng từ mỗi tâm ô cắt qua
+    inside = np.zeros(len(lat), dtype=bool)
+    for (lat1, lon1), (lat2, lon2) in zip(vertices, np.roll(vertices, -1, axis=0)):
+        if lat1 == lat2:
+            continue
+        crosses = (lat1 > lat) != (lat2 > lat)
+        lon_cross = lon1 + (lat - lat1) * (lon2 - lon1) / (lat2 - lat1)
+        inside ^= crosses & (lon < lon_cross)
+
+    cells = [
+        GridCell(int(i), int(j) % N_LON)
+        for i, j in zip(grid_lat.ravel()[inside], grid_lon.ravel()[inside])
+    ]
+    if not cells:
+        cells = [snap_to_grid(*vertices.mean(axis=0))]
+    if len(cells) > max_cells:
+        raise ValueError(
+            f"Region covers {len(cells)} POWER cells, at most {max_cells} allowed"
+        )
+    return cells
+
+
+def cell_area_weights(cells: Sequence[GridCell]) -> np.ndarray:
+    """Trọng số diện tích (tổng = 1) của các ô: ô lưới đều theo độ nên ~ cos(lat)."""
+    lat = np.radians([cell.latitude for cell in cells])
+    weights = np.maximum(np.cos(lat), 1e-6)
+    return weights / weights.sum()
+
+
+def cells_in_bbox(
+    south: float,
+    west: float,
+    north: float,
+    east: float,
+    max_cells: int = RASTER_MAX_CELLS,
+) -> Tuple[List[GridCell], Tuple[int, int]]:
+    """
+    Các ô lưới POWER phủ bounding box, theo thứ tự hàng (vĩ độ tăng dần) rồi cột
+    (kinh độ tăng dần), kèm shape (n_lat, n_lon). west > east nghĩa là box vắt qua
+    kinh tuyến 180; east - west >= 360 là trọn vòng kinh độ. Raise ValueError
+    nếu box rỗng hoặc nhiều hơn max_cells ô.
+    """
+    if south > north:
+        raise ValueError(f"Invalid bbox: south {south} > north {north}")
+    lat_lo, lon_lo = snap_to_grid(south, west)
+    lat_hi = snap_to_grid(north, east).lat_index
+    n_lat = lat_hi - lat_lo + 1
+    # chỉ số kinh độ chưa lấy modulo (east sau west), tối đa 1 vòng lưới
+    if east < west:
+        east += 360.0
+    lon_span = int(round((east + 180.0) / LON_STEP)) - int(
+        round((west + 180.0) / LON_STEP)
+    )
+    n_lon = min(lon_span + 1, N_LON)
+    if n_lat * n_lon > max_cells:
+        raise ValueError(
+            f"Bounding box covers {n_lat * n_lon} POWER cells, "
+            f"at most {max_cells} allowed"
+        )
+    cells = [
+        GridCell(lat_lo + i, (lon_lo + j) % N_LON)
+        for i in range(n_lat)
+        for j in range(n_lon)
+    ]
+    return cells, (n_lat, n_lon)
@@ -0,0 +1,129 @@
+import os
+import atexit
+import asyncio
+import threading
+from typing import Any, Coroutine, Dict, Optional
+
+import aiohttp
+
+
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 32))
+HTTP_KEEPALIVE = float(os.getenv("HTTP_KEEPALIVE", 30))
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 60))
+
+# số request đồng thời tối đa tới từng upstream, tính chung cho cả process
+CONCURRENCY_LIMITS = {
+    "power": int(os.getenv("POWER_CONCURRENCY", 8)),
+    "nominatim": int(os.getenv("NOMINATIM_CONCURRENCY", 2)),
+}
+
+
+class HttpClient:
+    """
+    1 aiohttp.ClientSession dùng chung suốt vòng đời process (connection pool,
+    keep-alive), chạy trên 1 event loop riêng ở background thread.
+    Code sync gọi qua `run`, code async (route FastAPI) gọi qua `run_async`,
+    nên không còn phải tạo event loop + session mới cho mỗi request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._limits: Dict[str, asyncio.Semaphore] = {}
+        self._limit_values = dict(CONCURRENCY_LIMITS)
+        self._pid: Optional[int] = None
+
+    def start(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            # sau fork, thread của process cha không còn -> tạo lại loop
+            if self._loop is None or self._pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever, name="http-client", daemon=True
+                )
+                thread.start()
+                self._loop, self._thread, self._pid = loop, thread, os.getpid()
+                self._session = None
+                self._limits = {}
+            return self._loop
+
+    async def session(self) -> aiohttp.ClientSession:
+        """Chỉ gọi từ bên trong loop của client."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=HTTP_POOL_SIZE,
+                keepalive_timeout=HTTP_KEEPALIVE,
+                ttl_dns_cache=300,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT),
+            )
+        return self._session
+
+    def limit(self, name: str) -> asyncio.Semaphore:
+        """Semaphore giới hạn concurrency tới upstream `name`."""
+        if name not in self._limits:
+            self._limits[name] = asyncio.Semaphore(self._limit_values.get(name, 4))
+        return self._limits[name]
+
+    def set_limit(self, name: str, value: int):
+        """
+        Đổi giới hạn concurrency tới upstream `name`, vd trong worker của forecast
+        pool (giới hạn của cả app chia cho số worker). Gọi trước khi có request.
+        """
+        self._limit_values[name] = max(1, value)
+        self._limits.pop(name, None)
+
+    async def get_json(
+        self,
+        url: str,
+        limit: str,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Any:
+        session = await self.session()
+        async with self.limit(limit):
+            async with session.get(url, params=params, headers=headers) as response:
+                response.raise_for_status()
+                return await response.json()
+
+    def run(self, coro: Coroutine) -> Any:
+        """Chạy coroutine trên loop của client và chờ kết quả (gọi từ code sync)."""
+        loop = self.start()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            coro.close()
+            raise RuntimeError("HttpClient.run() called from the client loop")
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    async def run_async(self, coro: Coroutine) -> Any:
+        """Chạy coroutine trên loop của client, await được từ bất kỳ loop nào."""
+        loop = self.start()
+        if asyncio.get_running_loop() is loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    def close(self):
+        with self._lock:
+            loop, thread, session = self._loop, self._thread, self._session
+            self._loop = self._thread = self._session = None
+            self._limits = {}
+        if loop is None:
+            return
+        if session is not None and self._pid == os.getpid():
+            asyncio.run_coroutine_threadsafe(session.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None:
+            thread.join(timeout=5)
+        loop.close()
+
+
+# client dùng chung cho toàn app
+http_client = HttpClient()
+atexit.register(http_client.close)
@@ -1,17 +1,43 @@
-from typing import List
+import os
+import atexit
+import threading
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple
 from datetime import datetime
 
 import numpy as np
 import pandas as pd
-import lightgbm as lgb
-from sklearn.model_selection import train_test_split
-from sklearn.multioutput import MultiOutputRegressor
-from xgboost import XGBRegressor
+
+from core.analysis import _prediction_index, normalize_raw_df
+
+
+# số member mặc định của bootstrap ensemble
+BOOTSTRAP_MEMBERS = int(os.getenv("BOOTSTRAP_MEMBERS", 32))
+# số process train song song, dùng chung cho mọi request
+BOOTSTRAP_WORKERS = int(os.getenv("BOOTSTRAP_WORKERS", os.cpu_count() or 1))
+# thời gian tối đa (giây) cho 1 ensemble; member chưa xong khi hết hạn bị bỏ
+BOOTSTRAP_TIME_BUDGET = float(os.getenv("BOOTSTRAP_TIME_BUDGET", 30))
+# số mẫu residual out-of-bag cộng vào dự báo của mỗi member
+BOOTSTRAP_RESIDUAL_DRAWS = int(os.getenv("BOOTSTRAP_RESIDUAL_DRAWS", 8))
+# ít hơn số member này thì percentile không còn ý nghĩa
+BOOTSTRAP_MIN_MEMBERS = 2
+
+XGB_BOOTSTRAP_PARAMS = {
+    "n_estimators": 100,
+    "tree_method": "hist",
+    "n_jobs": 1,
+}
 
 
 def forecast_lightgbm_multitarget(
     raw_df: pd.DataFrame, parameters: List[str], target_dt: datetime
 ) -> pd.DataFrame:
+    from sklearn.model_selection import train_test_split
+    from sklearn.multioutput import MultiOutputRegressor
+    from xgboost import XGBRegressor
+
     df = raw_df.copy()
     df["sin_hour"] = np.sin(2 * np.pi * df["hour"] / 24)
     df["cos_hour"] = np.cos(2 * np.pi * df["hour"] / 24)
@@ -45,55 +71,321 @@ def forecast_lightgbm_multitarget(
     return pred_df[["datetime"] + parameters]
 
 
+# ---------- Bootstrap ensemble: N model trên N mẫu resample, train song song ----------
+def _bootstrap_features(index: pd.DatetimeIndex, year: Optional[int] = None):
+    """hour + cyclical hour + year + cyclical day-of-year, dạng float32 (n, 6)."""
+    hour = index.hour.to_numpy(dtype=np.float64)
+    doy = index.dayofyear.to_numpy(dtype=np.float64)
+    years = index.year.to_numpy(dtype=np.float64) if year is None else year
+    return np.column_stack(
+        [
+            hour,
+            np.sin(2 * np.pi * hour / 24),
+            np.cos(2 * np.pi * hour / 24),
+            np.broadcast_to(years, hour.shape),
+            np.sin(2 * np.pi * doy / 365.25),
+            np.cos(2 * np.pi * doy / 365.25),
+        ]
+    ).astype(np.float32)
+
+
+class _SharedArray:
+    """ndarray nằm trong 1 block shared memory; worker attach theo tên, không copy."""
+
+    def __init__(self, array: np.ndarray):
+        self._shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, array.dtype, buffer=self._shm.buf)[...] = array
+        self.spec = (self._shm.name, array.shape, array.dtype.str)
+
+    def close(self):
+        self._shm.close()
+        self._shm.unlink()
+
+
+def _residual_draws(
+    residuals: np.ndarray,
+    hours: np.ndarray,
+    pred_hours: np.ndarray,
+    draws: int,
+    rng: np.random.Generator,
+) -> np.ndarray:
+    """
+    (draws, len(pred_hours), n_targets) residual lấy ngẫu nhiên theo cùng giờ
+    trong ngày (sai số thay đổi theo giờ); cả dòng được lấy cùng lúc để giữ
+    tương quan giữa các target.
+    """
+    out = np.zeros((draws, len(pred_hours), residuals.shape[1]), np.float32)
+    if len(residuals) == 0:
+        return out
+    for hour in np.unique(pred_hours):
+        rows = np.flatnonzero(pred_hours == hour)
+        pool = np.flatnonzero(hours == hour)
+        if len(pool) == 0:
+            pool = np.arange(len(residuals))
+        picks = pool[rng.integers(0, len(pool), (draws, len(rows)))]
+        out[:, rows] = residuals[picks]
+    return out
+
+
+def _fit_member_arrays(
+    X: np.ndarray,
+    Y: np.ndarray,
+    X_pred: np.ndarray,
+    seed: int,
+    params: dict,
+    draws: int = BOOTSTRAP_RESIDUAL_DRAWS,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Resample, fit 1 XGBRegressor đa target, predict.
+    Trả về (dự báo trung bình, draws dự báo + residual out-of-bag).
+    """
+    from xgboost import XGBRegressor
+
+    rng = np.random.default_rng(seed)
+    sample = rng.integers(0, len(X), len(X))
+    model = XGBRegressor(random_state=seed, **params)
+    # X[sample] là bản copy riêng của member, dữ liệu gốc chỉ có 1 bản
+    model.fit(X[sample], Y[sample])
+    mean = model.predict(X_pred).reshape(len(X_pred), -1)
+
+    # residual trên các dòng không được resample (out-of-bag): sai số dự báo
+    # thật của member, để percentile là khoảng dự báo chứ không chỉ là độ
+    # bất định của trung bình
+    oob = np.ones(len(X), dtype=bool)
+    oob[sample] = False
+    if not oob.any():
+        oob[:] = True
+    residuals = Y[oob] - model.predict(X[oob]).reshape(int(oob.sum()), -1)
+    noise = _residual_draws(residuals, X[oob, 0], X_pred[:, 0], draws, rng)
+    return mean, mean[None] + noise
+
+
+def _fit_member(
+    x_spec: Tuple,
+    y_spec: Tuple,
+    X_pred: np.ndarray,
+    seed: int,
+    params: dict,
+    draws: int = BOOTSTRAP_RESIDUAL_DRAWS,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Chạy trong process của pool: attach shared memory rồi _fit_member_arrays."""
+    blocks = [shared_memory.SharedMemory(name=spec[0]) for spec in (x_spec, y_spec)]
+    try:
+        X, Y = (
+            np.ndarray(shape, np.dtype(dtype), buffer=shm.buf)
+            for shm, (_, shape, dtype) in zip(blocks, (x_spec, y_spec))
+        )
+        try:
+            return _fit_member_arrays(X, Y, X_pred, seed, params, draws)
+        finally:
+            del X, Y
+    finally:
+        for shm in blocks:
+            shm.close()
+
+
+class BootstrapEnsemble:
+    """
+    Train N member trên process pool dùng chung cho cả app. Dữ liệu train được
+    đặt 1 lần vào shared memory, mỗi member chỉ nhận tên block + seed nên
+    không phải pickle X/y N lần. Pool dùng "spawn" để không fork process đang có
+    thread (http_client, OpenMP) và được tạo lại sau khi process bị fork.
+    processes=False train trên thread (XGBoost nhả GIL), dùng trong worker của
+    forecast pool, nơi đã song song theo process.
+    """
+
+    def __init__(self, workers: int = BOOTSTRAP_WORKERS, processes: bool = True):
+        self.workers = max(1, workers)
+        self.processes = processes
+        self._lock = threading.Lock()
+        self._executor: Optional[Executor] = None
+        self._pid: Optional[int] = None
+
+    def executor(self) -> Executor:
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                if self.processes:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                else:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers, thread_name_prefix="bootstrap"
+                    )
+                self._pid = os.getpid()
+            return self._executor
+
+    def resize(self, workers: int, processes: Optional[bool] = None):
+        """Đổi số worker train (và loại pool); pool cũ được tạo lại ở lần dùng sau."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self.workers = max(1, workers)
+            if processes is not None:
+                self.processes = processes
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit_members(self, executor, X, Y, X_pred, n_members, seed):
+        if not self.processes:
+            # thread dùng chung X/Y, không cần shared memory
+            return {
+                executor.submit(
+                    _fit_member_arrays,
+                    X,
+                    Y,
+                    X_pred,
+                    seed + member,
+                    XGB_BOOTSTRAP_PARAMS,
+                    BOOTSTRAP_RESIDUAL_DRAWS,
+                ): member
+                for member in range(n_members)
+            }, []
+        shared = [_SharedArray(X), _SharedArray(Y)]
+        futures = {
+            executor.submit(
+                _fit_member,
+                shared[0].spec,
+                shared[1].spec,
+                X_pred,
+                seed + member,
+                XGB_BOOTSTRAP_PARAMS,
+                BOOTSTRAP_RESIDUAL_DRAWS,
+            ): member
+            for member in range(n_members)
+        }
+        return futures, shared
+
+    def fit_predict(
+        self,
+        X: np.ndarray,
+        Y: np.ndarray,
+        X_pred: np.ndarray,
+        n_members: int = BOOTSTRAP_MEMBERS,
+        time_budget: float = BOOTSTRAP_TIME_BUDGET,
+        seed: int = 0,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Trả về (means, samples) của các member xong trong time_budget:
+        means shape (n_done, len(X_pred), n_targets) là dự báo trung bình,
+        samples shape (n_done * BOOTSTRAP_RESIDUAL_DRAWS, len(X_pred), n_targets)
+        là dự báo + residual out-of-bag. Theo thứ tự member (seed) để kết quả
+        không phụ thuộc thứ tự chạy xong.
+        """
+        executor = self.executor()
+        futures, shared = self._submit_members(executor, X, Y, X_pred, n_members, seed)
+        try:
+            done, not_done = wait(futures, timeout=time_budget)
+            # member chưa chạy thì huỷ; member đang chạy dở chạy nốt ở worker,
+            # kết quả bị bỏ
+            for future in not_done:
+                future.cancel()
+        finally:
+            for block in shared:
+                block.close()
+
+        preds = [future.result() for future in sorted(done, key=futures.get)]
+        if len(preds) < min(BOOTSTRAP_MIN_MEMBERS, n_members):
+            raise TimeoutError(
+                f"Only {len(preds)}/{n_members} bootstrap members finished "
+                f"within {time_budget}s"
+            )
+        means, samples = zip(*preds)
+        return np.stack(means), np.concatenate(samples)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._pid == os.getpid():
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+# pool bootstrap dùng chung cho toàn process
+bootstrap_ensemble = BootstrapEnsemble()
+atexit.register(bootstrap_ensemble.shutdown)
+
+
+def _bootstrap_predictions(
+    raw_df: pd.DataFrame,
+    parameters: List[str],
+    pred_index: pd.DatetimeIndex,
+    n_members: Optional[int],
+    time_budget: Optional[float],
+) -> Tuple[np.ndarray, np.ndarray]:
+    raw_df = normalize_raw_df(raw_df)
+    Y = raw_df[parameters].to_numpy(dtype=np.float32)
+    # XGBoost không nhận target NaN -> bỏ dòng thiếu
+    rows = ~np.isnan(Y).any(axis=1)
+    X = _bootstrap_features(raw_df.index[rows])
+    X_pred = _bootstrap_features(pred_index, year=pred_index[0].year)
+    return bootstrap_ensemble.fit_predict(
+        X,
+        Y[rows],
+        X_pred,
+        n_members=n_members or BOOTSTRAP_MEMBERS,
+        time_budget=time_budget or BOOTSTRAP_TIME_BUDGET,
+    )
+
+
+def forecast_bootstrap(
+    raw_df: pd.DataFrame,
+    parameters: List[str],
+    target_dt: datetime,
+    quantiles: List[float] = [0.05, 0.2, 0.35, 0.5, 0.65, 0.8, 0.95],
+    end_dt: Optional[datetime] = None,
+    n_members: Optional[int] = None,
+    time_budget: Optional[float] = None,
+) -> pd.DataFrame:
+    """
+    Bootstrap ensemble, output cùng schema với analysis.forecast_lightgbm_multitarget
+    (datetime, {param}_qNN, {param}) nên dùng được với compute_ci_from_pred_df.
+    {param}_qNN là percentile của dự báo member + residual out-of-bag (khoảng dự
+    báo, cùng loại với quantile của LightGBM), {param} là trung bình ensemble.
+    """
+    pred_index = _prediction_index(target_dt, end_dt)
+    stacked, samples = _bootstrap_predictions(
+        raw_df, parameters, pred_index, n_members, time_budget
+    )  # (n_members, n_hours, n_params), (n_members * draws, n_hours, n_params)
+    bands = np.percentile(samples, [q * 100 for q in quantiles], axis=0)
+
+    pred_dict = {"datetime": list(pred_index.to_pydatetime())}
+    for j, p in enumerate(parameters):
+        for i, q in enumerate(quantiles):
+            pred_dict[f"{p}_q{int(q*100):02d}"] = bands[i, :, j]
+        pred_dict[p] = stacked[:, :, j].mean(axis=0)
+    return pd.DataFrame(pred_dict)
+
+
 def forecast_lightgbm_bootstrap(
     raw_df: pd.DataFrame,
     parameters: List[str],
     target_dt: datetime,
     ci_levels: List[float] = [0.3, 0.6, 0.9],
+    n_members: Optional[int] = None,
+    time_budget: Optional[float] = None,
 ) -> pd.DataFrame:
     """
     raw_df: DataFrame with columns params + 'hour' + 'year'
+    n_members / time_budget: mặc định BOOTSTRAP_MEMBERS / BOOTSTRAP_TIME_BUDGET
     returns DataFrame with columns:
       datetime, <param>, <param>_low_30, <param>_high_30, ...
     """
-    df = raw_df.copy().reset_index(drop=True)
-    if df.empty:
+    if raw_df.empty:
         # return empty 24h with NaNs
         rows = [{"datetime": target_dt.replace(hour=h)} for h in range(24)]
         return pd.DataFrame(rows)
 
-    df["sin_hour"] = np.sin(2 * np.pi * df["hour"] / 24)
-    df["cos_hour"] = np.cos(2 * np.pi * df["hour"] / 24)
-
-    X = df[["hour", "sin_hour", "cos_hour", "year"]]
-    y = df[parameters]
-
-    all_preds = {p: [] for p in parameters}
-
-    model = MultiOutputRegressor(estimator=XGBRegressor())
-    model.fit(X, y)
-
-    hours = range(24)
-    X_pred = pd.DataFrame(
-        {
-            "hour": hours,
-            "sin_hour": np.sin(2 * np.pi * np.array(hours) / 24),
-            "cos_hour": np.cos(2 * np.pi * np.array(hours) / 24),
-            "year": target_dt.year,
-        }
-    )
-    y_pred = model.predict(X_pred)  # shape (24, n_params)
-
-    for j, p in enumerate(parameters):
-        all_preds[p].append(y_pred[:, j])
+    pred_index = _prediction_index(target_dt, None)
+    stacked, samples = _bootstrap_predictions(
+        raw_df, parameters, pred_index, n_members, time_budget
+    )  # (n_members, 24, n_params), (n_members * draws, 24, n_params)
 
     pred_df = pd.DataFrame({"datetime": [target_dt.replace(hour=h) for h in range(24)]})
-    for p in parameters:
-        stacked = np.vstack(all_preds[p])  # (n_models, 24)
-        pred_df[p] = stacked.mean(axis=0)
+    for j, p in enumerate(parameters):
+        pred_df[p] = stacked[:, :, j].mean(axis=0)
         for ci in ci_levels:
-            low = np.percentile(stacked, 50 - ci * 50, axis=0)
-            high = np.percentile(stacked, 50 + ci * 50, axis=0)
+            low = np.percentile(samples[:, :, j], 50 - ci * 50, axis=0)
+            high = np.percentile(samples[:, :, j], 50 + ci * 50, axis=0)
             pred_df[f"{p}_low_{int(ci*100)}"] = low
             pred_df[f"{p}_high_{int(ci*100)}"] = high
 
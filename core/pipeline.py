@@ -0,0 +1,370 @@
+import os
+import atexit
+import asyncio
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+
+# số process chạy pipeline fetch -> train -> CI
+FORECAST_WORKERS = int(os.getenv("FORECAST_WORKERS", os.cpu_count() or 1))
+# số request được xếp hàng thêm khi mọi worker đều bận, quá thì trả 429
+FORECAST_QUEUE_SIZE = int(os.getenv("FORECAST_QUEUE_SIZE", 16))
+# thời gian tối đa (giây) 1 request chờ kết quả, quá thì trả 503
+FORECAST_TIMEOUT = float(os.getenv("FORECAST_TIMEOUT", 120))
+# gợi ý Retry-After (giây) cho client khi bị từ chối
+FORECAST_RETRY_AFTER = int(os.getenv("FORECAST_RETRY_AFTER", 5))
+
+
+class PoolBusyError(RuntimeError):
+    """Pool đã đủ số task đang chạy + đang chờ."""
+
+
+# ---------- Chạy trong worker process ----------
+# core.analysis / core.data_fetcher chỉ import trong worker, phía API không cần
+
+
+def _init_worker(core_budget: int, bootstrap_workers: int, power_concurrency: int):
+    # env cho các process con của worker
+    os.environ["TRAIN_CORE_BUDGET"] = str(core_budget)
+    os.environ["BOOTSTRAP_WORKERS"] = str(bootstrap_workers)
+    os.environ["POWER_CONCURRENCY"] = str(power_concurrency)
+    # spawn import lại __main__ trước initializer (vd test.py import main), nên
+    # các singleton có thể đã được tạo với budget của cả máy -> cấu hình lại
+    from core.http_client import http_client
+    from core.model import bootstrap_ensemble
+    from core.scheduler import training_scheduler
+
+    http_client.set_limit("power", power_concurrency)
+    training_scheduler.resize(core_budget)
+    # không lồng process pool trong worker: pool con không được join khi worker
+    # thoát (multiprocessing._exit_function chạy trước atexit) làm treo shutdown;
+    # song song theo process đã do forecast pool lo, bootstrap chạy trên thread
+    bootstrap_ensemble.resize(bootstrap_workers, processes=False)
+
+
+def point_pipeline(
+    cell,
+    start_date: datetime,
+    end_date: Optional[datetime],
+    engine: str,
+    parameters: List[str],
+    quantiles: List[float],
+    num_boost_round: int,
+):
+    """
+    Fetch -> train -> CI cho 1 ô lưới, end_date=None là forecast 1 ngày.
+    Trả về (pred_df, ci_df).
+    """
+    from core.analysis import (
+        compute_ci_from_pred_df,
+        forecast_lightgbm_multitarget,
+        normalize_raw_df,
+    )
+    from core.data_fetcher import fetch_hourly_data, fetch_hourly_range, training_key
+
+    if end_date is None:
+        raw_df = fetch_hourly_data(
+            start_date, cell.latitude, cell.longitude, parameters
+        )
+        key = training_key(cell, start_date)
+    else:
+        # fetch 1 lần phần hợp của mọi window, train 1 lần, predict cả khoảng ngày
+        raw_df = fetch_hourly_range(
+            start_date, end_date, cell.latitude, cell.longitude, parameters
+        )
+        key = training_key(cell, start_date, end_date=end_date)
+    raw_df = normalize_raw_df(raw_df)
+    if raw_df.empty:
+        raise RuntimeError("Không có dữ liệu từ NASA POWER")
+
+    pred_df, _ = forecast_lightgbm_multitarget(
+        raw_df,
+        parameters,
+        start_date,
+        quantiles=quantiles,
+        num_boost_round=num_boost_round,
+        key=key,
+        engine=engine,
+        end_dt=end_date,
+    )
+    ci_df = compute_ci_from_pred_df(pred_df, parameters, ci_levels=[0.3, 0.6, 0.9])
+    return pred_df, ci_df
+
+
+def region_pipeline(
+    cells: Sequence,
+    weights,
+    start_date: datetime,
+    end_date: datetime,
+    engine: str,
+    parameters: List[str],
+    quantiles: List[float],
+    num_boost_round: int,
+):
+    """
+    Fetch đồng thời mọi ô, train gộp 1 lần, CI của cả vùng.
+    Trả về (ci_df của cả vùng, pred_df của từng ô).
+    """
+    from core.analysis import compute_ci_from_pred_df, forecast_region_multitarget
+    from core.data_fetcher import fetch_hourly_cells, region_training_key
+
+    # 1 lần fetch cho mọi ô, chung giới hạn concurrency tới POWER
+    cell_dfs = fetch_hourly_cells(start_date, end_date, cells, parameters)
+    if any(df.empty for df in cell_dfs):
+        raise RuntimeError("Không có dữ liệu từ NASA POWER")
+
+    end_dt = end_date if end_date != start_date else None
+    region_df, cell_preds = forecast_region_multitarget(
+        cell_dfs,
+        weights,
+        parameters,
+        start_date,
+        quantiles=quantiles,
+        num_boost_round=num_boost_round,
+        key=region_training_key(cells, start_date, end_date=end_dt),
+        engine=engine,
+        end_dt=end_dt,
+    )
+    ci_df = compute_ci_from_pred_df(region_df, parameters, ci_levels=[0.3, 0.6, 0.9])
+    return ci_df, cell_preds
+
+
+def raster_pipeline(
+    cells: Sequence,
+    target_date: datetime,
+    parameter: str,
+    engine: str,
+    quantiles: List[float],
+    num_boost_round: int,
+):
+    """1 param cho mọi ô của bounding box: fetch đồng thời, train gộp, predict mọi ô."""
+    from core.analysis import forecast_region_multitarget
+    from core.data_fetcher import fetch_hourly_cells, region_training_key
+    from core.grid import cell_area_weights
+
+    # chỉ fetch param cần vẽ, mọi ô đồng thời
+    cell_dfs = fetch_hourly_cells(target_date, target_date, cells, [parameter])
+    if any(df.empty for df in cell_dfs):
+        raise RuntimeError("Không có dữ liệu từ NASA POWER")
+
+    # train gộp mọi ô, predict mọi ô trong 1 lần
+    _, cell_preds = forecast_region_multitarget(
+        cell_dfs,
+        cell_area_weights(cells),
+        [parameter],
+        target_date,
+        quantiles=quantiles,
+        num_boost_round=num_boost_round,
+        key=region_training_key(cells, target_date),
+        engine=engine,
+    )
+    return cell_preds
+
+
+# ---------- Phía API ----------
+
+
+class ForecastPool:
+    """
+    Process pool riêng cho pipeline forecast, để train LightGBM / groupby pandas
+    không tranh GIL và threadpool với các route khác. Số request đang chờ kết
+    quả bị giới hạn (workers + queue_size): vượt thì submit ném PoolBusyError
+    ngay thay vì xếp hàng vô hạn. Pool dùng "spawn" như model.BootstrapEnsemble
+    và được tạo lại sau fork hoặc khi worker chết.
+
+    Mỗi worker là 1 executor 1 process, request được gửi tới worker theo key
+    (ô lưới / bộ ô): request cùng dữ liệu luôn chạy trên cùng worker, nên
+    SingleFlight fetch/train và LRU của model registry (state trong RAM của
+    từng worker) vẫn gộp được, request đến sau dùng lại model/dữ liệu vừa có.
+    Các giới hạn tính cho cả app được chia đều cho các worker: core budget
+    train (TRAIN_CORE_BUDGET, BOOTSTRAP_WORKERS) và POWER_CONCURRENCY.
+
+    Request hết timeout (hoặc bị huỷ) trả slot ngay. Task của nó bị huỷ nếu
+    còn trong hàng; mỗi executor đã đẩy tối đa 2 task sang call queue (không
+    huỷ được nữa), các task đó chạy nốt và được đếm riêng là "orphaned", nên
+    phần việc bị bỏ rơi bị chặn ở 2 * workers.
+    """
+
+    def __init__(
+        self,
+        workers: int = FORECAST_WORKERS,
+        queue_size: int = FORECAST_QUEUE_SIZE,
+        timeout: float = FORECAST_TIMEOUT,
+    ):
+        self.workers = max(1, workers)
+        self.queue_size = max(0, queue_size)
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._executors: List[Optional[ProcessPoolExecutor]] = [None] * self.workers
+        self._pid: Optional[int] = None
+        # future của các request còn đang chờ kết quả -> worker chạy nó
+        self._holding: Dict[Future, int] = {}
+        self._reserved = 0
+        # task không còn ai chờ nhưng không huỷ được, đang chạy nốt ở worker
+        self._orphaned = 0
+
+    def _initargs(self):
+        cpus = os.cpu_count() or 1
+        core_budget = int(os.getenv("TRAIN_CORE_BUDGET", cpus))
+        bootstrap_workers = int(os.getenv("BOOTSTRAP_WORKERS", cpus))
+        power_concurrency = int(os.getenv("POWER_CONCURRENCY", 8))
+        return (
+            max(1, core_budget // self.workers),
+            max(1, bootstrap_workers // self.workers),
+            max(1, power_concurrency // self.workers),
+        )
+
+    def _check_pid(self):
+        # gọi khi giữ lock; sau fork các executor của process cha không dùng được
+        if self._pid != os.getpid():
+            self._executors = [None] * self.workers
+            self._holding, self._reserved, self._orphaned = {}, 0, 0
+            self._pid = os.getpid()
+
+    def _pick(self, key: Optional[str]) -> int:
+        # gọi khi giữ lock
+        if key is not None:
+            digest = hashlib.sha1(key.encode("utf-8")).digest()
+            return int.from_bytes(digest[:8], "big") % self.workers
+        # không có key: worker đang giữ ít request nhất
+        load = [0] * self.workers
+        for index in self._holding.values():
+            load[index] += 1
+        return min(range(self.workers), key=load.__getitem__)
+
+    def executor(self, index: int = 0) -> ProcessPoolExecutor:
+        with self._lock:
+            self._check_pid()
+            if self._executors[index] is None:
+                self._executors[index] = ProcessPoolExecutor(
+                    max_workers=1,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=self._initargs(),
+                )
+            return self._executors[index]
+
+    def _reset(self, index: int, executor: ProcessPoolExecutor):
+        # worker chết (OOM, segfault...) -> pool hỏng, lần submit sau tạo pool mới
+        with self._lock:
+            if self._executors[index] is executor:
+                self._executors[index] = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _unreserve(self):
+        with self._lock:
+            self._reserved -= 1
+
+    def _release(self, future: Future):
+        with self._lock:
+            self._holding.pop(future, None)
+
+    def _orphan_done(self, _future: Future):
+        with self._lock:
+            self._orphaned = max(0, self._orphaned - 1)
+
+    def _abandon(self, future: Future):
+        """Request không chờ nữa: trả slot, task chưa xong thì đếm là orphaned."""
+        future.cancel()
+        with self._lock:
+            self._holding.pop(future, None)
+            orphaned = not future.done()
+            if orphaned:
+                self._orphaned += 1
+        if orphaned:
+            future.add_done_callback(self._orphan_done)
+
+    def _submit(self, fn: Callable[..., Any], args, key: Optional[str]):
+        with self._lock:
+            self._check_pid()
+            pending = len(self._holding) + self._reserved
+            if pending >= self.workers + self.queue_size:
+                raise PoolBusyError(
+                    f"Forecast queue is full ({pending} requests in progress)"
+                )
+            index = self._pick(key)
+            self._reserved += 1
+        executor = self.executor(index)
+        try:
+            future = executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._reset(index, executor)
+            try:
+                executor = self.executor(index)
+                future = executor.submit(fn, *args)
+            except BaseException:
+                self._unreserve()
+                raise
+        except BaseException:
+            self._unreserve()
+            raise
+        with self._lock:
+            self._reserved -= 1
+            self._holding[future] = index
+        # slot được trả khi task xong, hoặc sớm hơn qua _abandon
+        future.add_done_callback(self._release)
+        return future, index, executor
+
+    def submit(
+        self, fn: Callable[..., Any], *args, key: Optional[str] = None
+    ) -> Future:
+        """Gửi fn(*args) tới worker theo key (None = worker rảnh nhất)."""
+        future, _, _ = self._submit(fn, args, key)
+        return future
+
+    async def run(
+        self,
+        fn: Callable[..., Any],
+        *args,
+        key: Optional[str] = None,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """
+        Chạy fn(*args) trên pool và await kết quả. Hết timeout thì ném
+        TimeoutError và trả slot ngay (xem _abandon).
+        """
+        timeout = timeout or self.timeout
+        future, index, executor = self._submit(fn, args, key)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                raise  # TimeoutError của chính task (vd bootstrap hết time budget)
+            self._abandon(future)
+            raise TimeoutError(f"Forecast did not finish within {timeout:g}s")
+        except asyncio.CancelledError:
+            # client ngắt kết nối / app shutdown
+            self._abandon(future)
+            raise
+        except BrokenProcessPool:
+            self._reset(index, executor)
+            raise
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "queue_size": self.queue_size,
+                "pending": len(self._holding) + self._reserved,
+                "orphaned": self._orphaned,
+            }
+
+    def shutdown(self, wait: bool = False):
+        """Huỷ task còn trong hàng; wait=True chờ task đang chạy xong và join worker."""
+        with self._lock:
+            executors, self._executors = self._executors, [None] * self.workers
+        if self._pid != os.getpid():
+            return
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=wait, cancel_futures=True)
+
+
+# pool dùng chung cho toàn app
+forecast_pool = ForecastPool()
+atexit.register(forecast_pool.shutdown)
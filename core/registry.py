@@ -0,0 +1,111 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Optional
+
+from core.cache import DiskCache
+
+# lightgbm chỉ import khi thật sự đọc/ghi model
+if TYPE_CHECKING:
+    import lightgbm as lgb
+
+
+MODEL_REGISTRY_DIR = os.getenv("MODEL_REGISTRY_DIR", ".cache/models")
+MODEL_REGISTRY_MAX_BYTES = int(
+    os.getenv("MODEL_REGISTRY_MAX_BYTES", 1024 * 1024 * 1024)
+)
+MODEL_REGISTRY_MEMORY_ITEMS = int(os.getenv("MODEL_REGISTRY_MEMORY_ITEMS", 512))
+
+# tăng khi đổi feature / cách train để bỏ qua các model cũ trong registry
+REGISTRY_VERSION = 1
+
+
+class ModelRegistry:
+    """
+    Lưu booster LightGBM đã train theo (dữ liệu train, param, quantile,
+    hyperparameters). Dữ liệu train được định danh bằng data_fetcher.training_key
+    (ô lưới + window ngày + số năm, kèm ngày fetch nếu dữ liệu chưa chốt). Booster lưu dạng text trên đĩa (LRU theo
+    dung lượng) và giữ thêm 1 tầng LRU trong RAM để khỏi parse lại.
+    """
+
+    def __init__(
+        self,
+        store: Optional[DiskCache] = None,
+        memory_items: int = MODEL_REGISTRY_MEMORY_ITEMS,
+        version: int = REGISTRY_VERSION,
+    ):
+        self.store = store or DiskCache(MODEL_REGISTRY_DIR, MODEL_REGISTRY_MAX_BYTES)
+        self.memory_items = memory_items
+        self.version = version
+        self._memory: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def model_key(
+        self,
+        data_key: str,
+        parameter: str,
+        quantile: float,
+        hyperparameters: Dict[str, Any],
+    ) -> str:
+        import lightgbm as lgb
+
+        hp = json.dumps(hyperparameters, sort_keys=True, default=str)
+        hp_hash = hashlib.sha1(hp.encode("utf-8")).hexdigest()[:12]
+        return (
+            f"model:v{self.version}:lgb{lgb.__version__}:{data_key}"
+            f":{parameter}:q{quantile:.4f}:{hp_hash}"
+        )
+
+    def _remember(self, key: str, booster: "lgb.Booster"):
+        with self._lock:
+            self._memory[key] = booster
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def load(
+        self,
+        data_key: str,
+        parameter: str,
+        quantile: float,
+        hyperparameters: Dict[str, Any],
+    ) -> Optional["lgb.Booster"]:
+        key = self.model_key(data_key, parameter, quantile, hyperparameters)
+        with self._lock:
+            booster = self._memory.get(key)
+            if booster is not None:
+                self._memory.move_to_end(key)
+                return booster
+
+        data = self.store.get_bytes(key, ".txt")
+        if data is None:
+            return None
+        import lightgbm as lgb
+
+        booster = lgb.Booster(model_str=data.decode("utf-8"))
+        self._remember(key, booster)
+        return booster
+
+    def save(
+        self,
+        data_key: str,
+        parameter: str,
+        quantile: float,
+        hyperparameters: Dict[str, Any],
+        booster: "lgb.Booster",
+    ):
+        key = self.model_key(data_key, parameter, quantile, hyperparameters)
+        self.store.put_bytes(key, booster.model_to_string().encode("utf-8"), ".txt")
+        self._remember(key, booster)
+
+    def stats(self) -> Dict[str, int]:
+        stats = self.store.stats()
+        with self._lock:
+            stats["memory_items"] = len(self._memory)
+        return stats
+
+
+# registry dùng chung cho toàn app
+model_registry = ModelRegistry()
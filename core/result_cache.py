@@ -0,0 +1,143 @@
+import os
+import json
+import asyncio
+import time
+import hashlib
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional
+
+from core.cache import DiskCache, MemoryCache
+from core.singleflight import AsyncSingleFlight
+
+
+# thời gian sống (giây) của 1 response đã tính
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", 3600))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+# tầng đĩa dùng chung giữa các worker, để trống = chỉ cache trong RAM
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "")
+RESULT_CACHE_DISK_MAX_BYTES = int(
+    os.getenv("RESULT_CACHE_DISK_MAX_BYTES", 1024 * 1024 * 1024)
+)
+
+# tăng khi đổi format output để bỏ qua các response cũ
+RESULT_CACHE_VERSION = 1
+
+
+class CachedResult(NamedTuple):
+    body: bytes
+    media_type: str
+    # strong ETag: hash của body, cùng ETag <=> cùng từng byte
+    etag: str
+    expires: float
+
+    def max_age(self) -> int:
+        return max(0, int(self.expires - time.time()))
+
+
+def result_key(route: str, **parts) -> str:
+    """Key của 1 response: route + mọi thứ quyết định nội dung (ô, ngày, engine...)."""
+    raw = json.dumps(parts, sort_keys=True, default=str)
+    digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+    return f"result:v{RESULT_CACHE_VERSION}:{route}:{digest}"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """So khớp header If-None-Match (so sánh weak, có thể là list hoặc "*")."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
+
+
+class ResultCache:
+    """
+    Cache toàn bộ response (bytes + media type) của các route forecast theo
+    result_key. Tầng RAM LRU giới hạn theo dung lượng, thêm tầng đĩa tuỳ chọn
+    để các worker dùng chung; mỗi entry có hạn TTL. Các request cùng key đồng
+    thời chỉ tính 1 lần.
+    """
+
+    def __init__(
+        self,
+        ttl: float = RESULT_CACHE_TTL,
+        max_bytes: int = RESULT_CACHE_MAX_BYTES,
+        store: Optional[DiskCache] = None,
+    ):
+        self.ttl = ttl
+        self.memory = MemoryCache(
+            ttl, max_bytes=max_bytes, sizeof=lambda entry: len(entry.body)
+        )
+        self.store = store
+        # chỉ dùng từ event loop của app
+        self._async_flight = AsyncSingleFlight()
+
+    def _load(self, key: str) -> Optional[CachedResult]:
+        data = self.store.get_bytes(key, ".bin")
+        if data is None:
+            return None
+        # dòng đầu là header JSON, phần còn lại là body
+        header, _, body = data.partition(b"\n")
+        header = json.loads(header)
+        if header["expires"] <= time.time():
+            return None
+        return CachedResult(
+            body, header["media_type"], header["etag"], header["expires"]
+        )
+
+    def get(self, key: str) -> Optional[CachedResult]:
+        entry = self.memory.get(key)
+        if entry is None and self.store is not None:
+            entry = self._load(key)
+            if entry is not None:
+                self.memory.put(key, entry, ttl=entry.expires - time.time())
+        return entry
+
+    def put(self, key: str, body: bytes, media_type: str) -> CachedResult:
+        etag = '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+        entry = CachedResult(body, media_type, etag, time.time() + self.ttl)
+        self.memory.put(key, entry)
+        if self.store is not None:
+            header = {"media_type": media_type, "etag": etag, "expires": entry.expires}
+            self.store.put_bytes(
+                key, json.dumps(header).encode() + b"\n" + body, ".bin"
+            )
+        return entry
+
+    async def _build_async(self, key: str, build: Callable) -> CachedResult:
+        entry = await asyncio.to_thread(self.get, key)
+        if entry is None:
+            response = await build()
+            entry = await asyncio.to_thread(
+                self.put, key, response.body, response.media_type
+            )
+        return entry
+
+    async def get_or_build_async(
+        self, key: str, build: Callable[[], Awaitable]
+    ) -> CachedResult:
+        """
+        Entry của key, chưa có thì await build() (coroutine function trả về
+        Response: .body, .media_type) rồi cache; exception không được cache.
+        Các request đồng thời cùng key chỉ build 1 lần.
+        """
+        entry = await asyncio.to_thread(self.get, key)
+        if entry is not None:
+            return entry
+        return await self._async_flight.do(key, self._build_async, key, build)
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        stats = {"memory": self.memory.stats()}
+        if self.store is not None:
+            stats["disk"] = self.store.stats()
+        return stats
+
+
+# cache dùng chung cho toàn app
+result_cache = ResultCache(
+    store=(
+        DiskCache(RESULT_CACHE_DIR, RESULT_CACHE_DISK_MAX_BYTES)
+        if RESULT_CACHE_DIR
+        else None
+    )
+)
@@ -0,0 +1,101 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterable, List, Optional, Sequence
+
+
+# tổng số core dành cho train, tính chung cho mọi request đồng thời
+TRAIN_CORE_BUDGET = int(os.getenv("TRAIN_CORE_BUDGET", os.cpu_count() or 1))
+# số thread LightGBM cho mỗi task (param, quantile)
+TRAIN_THREADS_PER_TASK = int(os.getenv("TRAIN_THREADS_PER_TASK", 1))
+
+
+class CoreBudget:
+    """Semaphore đếm theo core: 1 task giữ `n` core trong lúc chạy."""
+
+    def __init__(self, total: int):
+        self.total = max(1, total)
+        self._free = self.total
+        self._cond = threading.Condition()
+
+    def acquire(self, n: int):
+        n = min(n, self.total)
+        with self._cond:
+            self._cond.wait_for(lambda: self._free >= n)
+            self._free -= n
+
+    def release(self, n: int):
+        n = min(n, self.total)
+        with self._cond:
+            self._free += n
+            self._cond.notify_all()
+
+    @property
+    def in_use(self) -> int:
+        with self._cond:
+            return self.total - self._free
+
+
+class TrainingScheduler:
+    """
+    Chạy các task train (vd từng cặp (param, quantile)) song song trên 1 pool
+    thread dùng chung cho cả process. LightGBM nhả GIL khi train nên thread là
+    đủ; mỗi task giữ `threads_per_task` core trong CoreBudget nên tổng số thread
+    LightGBM của mọi request đồng thời không vượt quá budget.
+    Kết quả trả về theo đúng thứ tự task nên không phụ thuộc thứ tự chạy xong.
+    """
+
+    def __init__(
+        self,
+        core_budget: int = TRAIN_CORE_BUDGET,
+        threads_per_task: int = TRAIN_THREADS_PER_TASK,
+    ):
+        self._threads_per_task = threads_per_task
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.resize(core_budget)
+
+    def resize(self, core_budget: int):
+        """
+        Đổi core budget, vd trong worker của forecast pool (budget chia theo số
+        worker). Chỉ gọi khi chưa có task nào đang chạy.
+        """
+        old = self._executor
+        self.budget = CoreBudget(core_budget)
+        self.threads_per_task = max(1, min(self._threads_per_task, self.budget.total))
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.budget.total, thread_name_prefix="train"
+        )
+        if old is not None:
+            old.shutdown(wait=False)
+
+    def _run(self, fn: Callable[..., Any], args: Sequence, num_threads: int) -> Any:
+        self.budget.acquire(num_threads)
+        try:
+            return fn(*args, num_threads=num_threads)
+        finally:
+            self.budget.release(num_threads)
+
+    def map(
+        self,
+        fn: Callable[..., Any],
+        tasks: Iterable[Sequence],
+        threads_per_task: Optional[int] = None,
+    ) -> List[Any]:
+        """Gọi fn(*task, num_threads=...) cho mỗi task, trả về list kết quả theo thứ tự."""
+        num_threads = max(
+            1, min(threads_per_task or self.threads_per_task, self.budget.total)
+        )
+        tasks = list(tasks)
+        if len(tasks) <= 1:
+            return [self._run(fn, args, num_threads) for args in tasks]
+        futures = [
+            self._executor.submit(self._run, fn, args, num_threads) for args in tasks
+        ]
+        return [future.result() for future in futures]
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+# scheduler dùng chung cho toàn process
+training_scheduler = TrainingScheduler()
@@ -0,0 +1,59 @@
+import io
+import json
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+
+TABLE_MEDIA_TYPES = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# key trong schema metadata chứa thông tin request (place, cell, date...)
+METADATA_KEY = b"forecast"
+
+
+def _to_table(df: pd.DataFrame, metadata: Optional[Dict[str, Any]] = None):
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if metadata:
+        schema_metadata = dict(table.schema.metadata or {})
+        schema_metadata[METADATA_KEY] = json.dumps(metadata, default=str).encode()
+        table = table.replace_schema_metadata(schema_metadata)
+    return table
+
+
+def frame_to_arrow(
+    df: pd.DataFrame, metadata: Optional[Dict[str, Any]] = None
+) -> bytes:
+    """DataFrame -> bytes Arrow IPC stream (đọc lại bằng pyarrow.ipc.open_stream)."""
+    import pyarrow as pa
+
+    table = _to_table(df, metadata)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def frame_to_parquet(
+    df: pd.DataFrame, metadata: Optional[Dict[str, Any]] = None
+) -> bytes:
+    """DataFrame -> bytes Parquet (nén zstd)."""
+    import pyarrow.parquet as pq
+
+    buffer = io.BytesIO()
+    pq.write_table(_to_table(df, metadata), buffer, compression="zstd")
+    return buffer.getvalue()
+
+
+def frame_to_bytes(
+    df: pd.DataFrame, format: str, metadata: Optional[Dict[str, Any]] = None
+) -> bytes:
+    if format == "arrow":
+        return frame_to_arrow(df, metadata)
+    if format == "parquet":
+        return frame_to_parquet(df, metadata)
+    raise ValueError(f"Unknown table format {format!r}")
@@ -1,30 +1,64 @@
 import json
-from datetime import datetime, timedelta
-from typing import List
+import asyncio
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import List, Literal, Optional
 
-import numpy as np
 import pandas as pd
-from fastapi import FastAPI, Query, Request
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, ORJSONResponse, Response
 from fastapi.templating import Jinja2Templates
-from fastapi.staticfiles import StaticFiles
 
-from core.geocode import geocode_osm, get_current_place
-from core.data_fetcher import fetch_hourly_data, fetch_monthly_data
+from core.geocode import geocode_osm_async, get_current_place
+from core.http_client import http_client
+from core.grid import (
+    cell_area_weights,
+    cells_in_bbox,
+    cells_in_polygon,
+    snap_to_grid,
+)
 from core.analysis import (
-    compute_ci_multitarget,
     plotly_one_day,
     plotly_many_days,
-    compute_ci_from_pred_df,
-    normalize_raw_df,
-    forecast_lightgbm_multitarget,
-    create_monthly_avg_df,
-    plotly_monthly_overview,
+    grid_array,
+    plotly_monthly,
+    build_figure_skeletons,
+    ci_series,
+    figure_template,
+)
+from core.climatology import monthly_climatology
+from core.downsample import downsample_ci_df
+from core.tabular import TABLE_MEDIA_TYPES, frame_to_bytes
+from core.result_cache import CachedResult, etag_matches, result_cache, result_key
+from core.pipeline import (
+    FORECAST_RETRY_AFTER,
+    PoolBusyError,
+    forecast_pool,
+    point_pipeline,
+    raster_pipeline,
+    region_pipeline,
 )
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 1 connection pool tới POWER/Nominatim cho suốt vòng đời app
+    http_client.start()
+    # phần tĩnh của figure cho mọi param, mỗi request chỉ ghép dữ liệu vào;
+    # dựng ở background (cần import plotly) để worker nhận request ngay
+    threading.Thread(
+        target=build_figure_skeletons, name="figure-skeletons", daemon=True
+    ).start()
+    yield
+    # join worker của forecast pool để process thoát gọn
+    forecast_pool.shutdown(wait=True)
+    http_client.close()
+
+
+app = FastAPI(lifespan=lifespan)
 templates = Jinja2Templates(directory="frontend")
 
 app.add_middleware(
@@ -36,11 +70,114 @@ app.add_middleware(
 )
 
 PARAMETERS = ["T2M", "RH2M", "PRECTOTCORR", "ALLSKY_SFC_SW_DWN", "WS2M"]
+QUANTILES = [0.05, 0.2, 0.35, 0.5, 0.65, 0.8, 0.95]
+NUM_BOOST_ROUND = 20
+# raster chỉ trả median và dải 90%
+RASTER_QUANTILES = [0.05, 0.5, 0.95]
+# cấu hình quyết định kết quả forecast, là 1 phần key của result cache
+FORECAST_SETTINGS = {
+    "parameters": PARAMETERS,
+    "quantiles": QUANTILES,
+    "num_boost_round": NUM_BOOST_ROUND,
+}
+
+# engine chọn theo từng request, xem analysis.FORECAST_ENGINES;
+# "climatology" bỏ qua LightGBM, chỉ lấy percentile của lịch sử (nhanh nhất);
+# "bootstrap" là ensemble XGBoost train song song trên process pool
+Engine = Literal["lightgbm", "multiquantile", "climatology", "bootstrap"]
+# "bootstrap" bỏ các member chưa xong trong BOOTSTRAP_TIME_BUDGET nên cùng
+# request có thể cho kết quả khác nhau -> không qua result cache
+UNCACHED_ENGINES = ("bootstrap",)
+# forecast vùng train gộp mọi ô, xem analysis.REGION_ENGINES
+RegionEngine = Literal["lightgbm", "multiquantile", "climatology"]
+# "figure": figure Plotly đầy đủ (JSON string cho mỗi param) như trước;
+# "data": chỉ mảng CI + đoạn ngưỡng, style lấy 1 lần từ /figure_template;
+# "arrow"/"parquet": bảng `table` dạng cột (Arrow IPC stream / Parquet) cho
+# các job phân tích, thông tin request nằm trong schema metadata "forecast"
+Format = Literal["figure", "data", "arrow", "parquet"]
+TABLE_FORMATS = tuple(TABLE_MEDIA_TYPES)
+# "ci": output compute_ci_from_pred_df; "pred": pred_df với mọi cột {p}_qNN
+Table = Literal["ci", "pred"]
+# số điểm tối đa mỗi trace của figure nhiều ngày, None = giữ mọi giờ
+MaxPoints = Optional[int]
+
+
+def render_figures(
+    ci_df, parameters, plot, format: str, x_column="datetime", max_points=None
+):
+    if format == "data":
+        return {
+            "x": ci_df[x_column].to_numpy(),
+            "series": {p: ci_series(ci_df, p) for p in parameters},
+        }
+    figures = {}
+    for parameter in parameters:
+        # downsample theo đường mean của từng param (chỉ cho figure)
+        fig_dict = plot(downsample_ci_df(ci_df, parameter, max_points), parameter)
+        figures[parameter] = json.dumps(fig_dict, default=str)  # ép thành JSON string
+    return {"figures": figures}
+
+
+def respond(payload, format: str) -> Response:
+    # mảng NumPy encode thẳng bằng orjson, không qua list Python
+    if format == "data":
+        return ORJSONResponse(payload)
+    return JSONResponse(payload)
+
+
+def respond_table(df: pd.DataFrame, format: str, metadata) -> Response:
+    return Response(
+        content=frame_to_bytes(df, format, metadata),
+        media_type=TABLE_MEDIA_TYPES[format],
+    )
+
+
+def cached_response(request: Request, entry: CachedResult) -> Response:
+    """Response từ result cache, trả 304 nếu client đã có đúng bản này."""
+    headers = {"ETag": entry.etag, "Cache-Control": f"max-age={entry.max_age()}"}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type=entry.media_type, headers=headers)
+
+
+async def cached_build(request: Request, key: str, engine: str, build) -> Response:
+    """
+    Response qua result cache (ETag, 304), trừ engine mà kết quả phụ thuộc thời
+    gian chạy: không cache, không ETag.
+    """
+    if engine in UNCACHED_ENGINES:
+        response = await build()
+        response.headers["Cache-Control"] = "no-store"
+        return response
+    entry = await result_cache.get_or_build_async(key, build)
+    return cached_response(request, entry)
+
+
+async def run_pipeline(fn, *args, key: str):
+    """
+    Chạy pipeline trên forecast_pool (worker chọn theo key dữ liệu), đổi lỗi
+    quá tải / quá hạn thành HTTP.
+    """
+    retry = {"Retry-After": str(FORECAST_RETRY_AFTER)}
+    try:
+        return await forecast_pool.run(fn, *args, key=key)
+    except PoolBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry)
+    except (TimeoutError, BrokenProcessPool) as e:
+        raise HTTPException(status_code=503, detail=str(e), headers=retry)
 
 
 @app.get("/forecast_point_one_day")
-def forecast_point_one_day(place: str = Query(...), date: str = Query(...)):
-    latitude, longitude = geocode_osm(place)
+async def forecast_point_one_day(
+    request: Request,
+    place: str = Query(...),
+    date: str = Query(...),
+    engine: Engine = Query("lightgbm"),
+    format: Format = Query("figure"),
+    table: Table = Query("ci"),
+):
+    latitude, longitude = await geocode_osm_async(place)
+    cell = snap_to_grid(latitude, longitude)
 
     # 2. Parse date
     try:
@@ -48,104 +185,211 @@ def forecast_point_one_day(place: str = Query(...), date: str = Query(...)):
     except Exception:
         raise RuntimeError(f"Ngày không hợp lệ: {date}")
 
-    # 3. Lấy dữ liệu NASA POWER
-    raw_df = fetch_hourly_data(target_date, latitude, longitude, PARAMETERS)
-    raw_df = normalize_raw_df(raw_df)
-    if raw_df.empty:
-        raise RuntimeError("Không có dữ liệu từ NASA POWER")
-
-    pred_df, models = forecast_lightgbm_multitarget(
-        raw_df,
-        PARAMETERS,
-        target_date,
-        quantiles=[0.05, 0.2, 0.35, 0.5, 0.65, 0.8, 0.95],
-        num_boost_round=20,
+    # body có place + coords nên key gồm cả 2, ngoài ô lưới và cấu hình forecast
+    key = result_key(
+        "forecast_point_one_day",
+        place=place,
+        coords=(latitude, longitude),
+        cell=cell.key,
+        date=target_date,
+        engine=engine,
+        format=format,
+        table=table,
+        **FORECAST_SETTINGS,
+    )
+    return await cached_build(
+        request,
+        key,
+        engine,
+        lambda: point_one_day_response(
+            place, latitude, longitude, cell, target_date, engine, format, table
+        ),
     )
 
-    # 3) compute CI dataframe
-    ci_df = compute_ci_from_pred_df(pred_df, PARAMETERS, ci_levels=[0.3, 0.6, 0.9])
 
-    # 6. Vẽ biểu đồ cho tất cả param
-    figures = {}
-    for parameter in PARAMETERS:
-        fig_dict = plotly_one_day(ci_df, parameter)
-        figures[parameter] = json.dumps(fig_dict, default=str)  # ép thành JSON string
+async def point_one_day_response(
+    place, latitude, longitude, cell, target_date, engine, format, table
+) -> Response:
+    # fetch NASA POWER -> train -> CI trên process pool
+    pred_df, ci_df = await run_pipeline(
+        point_pipeline,
+        cell,
+        target_date,
+        None,
+        engine,
+        PARAMETERS,
+        QUANTILES,
+        NUM_BOOST_ROUND,
+        key=cell.key,
+    )
 
-    return {
+    payload = {
         "place": place,
         "coords": {"latitude": latitude, "longitude": longitude},
+        "cell": cell.to_dict(),
         "date": target_date.isoformat(),
-        "figures": figures,  # lúc này mỗi cái là JSON string
     }
+    if format in TABLE_FORMATS:
+        frame = ci_df if table == "ci" else pred_df
+        return await asyncio.to_thread(respond_table, frame, format, payload)
+
+    # 6. Vẽ biểu đồ cho tất cả param
+    rendered = await asyncio.to_thread(
+        render_figures, ci_df, PARAMETERS, plotly_one_day, format
+    )
+    payload.update(rendered)
+    return respond(payload, format)
 
 
 @app.get("/monthly_weather")
-async def forecast_monthly(place: str = Query(...)):
-    latitude, longitude = geocode_osm(place)
+async def forecast_monthly(
+    request: Request, place: str = Query(...), format: Format = Query("figure")
+):
+    latitude, longitude = await geocode_osm_async(place)
+    cell = snap_to_grid(latitude, longitude)
 
     target_date = datetime.now()
-    raw_df = fetch_monthly_data(
-        target_date, latitude, longitude, ["PRECTOTCORR", "T2M"]
+    # bảng climatology đổi theo năm, vạch "Current month" đổi theo tháng
+    key = result_key(
+        "monthly_weather",
+        place=place,
+        coords=(latitude, longitude),
+        cell=cell.key,
+        month=target_date.strftime("%Y-%m"),
+        format=format,
     )
-    avg_df = create_monthly_avg_df(raw_df, ["PRECTOTCORR", "T2M"])
-    if raw_df.empty:
-        raise RuntimeError("Không có dữ liệu từ NASA POWER")
+    entry = await result_cache.get_or_build_async(
+        key,
+        lambda: monthly_response(place, latitude, longitude, cell, target_date, format),
+    )
+    return cached_response(request, entry)
 
-    # 3) compute CI dataframe
 
-    figures = {}
-    for parameter in ["PRECTOTCORR", "T2M"]:
-        fig_dict = plotly_monthly_overview(avg_df, parameter).to_dict()
-        figures[parameter] = json.dumps(fig_dict, default=str)  # ép thành JSON string
+async def monthly_response(
+    place, latitude, longitude, cell, target_date, format
+) -> Response:
+    # bảng 12 tháng đã tính sẵn cho ô lưới, chỉ tính lại khi sang năm mới
+    avg_df = await monthly_climatology.get_async(
+        cell, ["PRECTOTCORR", "T2M"], target_date
+    )
+    if avg_df.empty:
+        raise RuntimeError("Không có dữ liệu từ NASA POWER")
 
-    return {
+    payload = {
         "place": place,
         "coords": {"latitude": latitude, "longitude": longitude},
+        "cell": cell.to_dict(),
         "date": target_date.isoformat(),
-        "figures": figures,  # lúc này mỗi cái là JSON string
     }
+    if format in TABLE_FORMATS:
+        return await asyncio.to_thread(respond_table, avg_df, format, payload)
+
+    rendered = await asyncio.to_thread(
+        render_figures,
+        avg_df,
+        ["PRECTOTCORR", "T2M"],
+        plotly_monthly,
+        format,
+        x_column="month",
+    )
+    payload.update(rendered)
+    return respond(payload, format)
 
 
 @app.get("/forecast_point_many_days")
-def forecast_point_many_days(
-    place: str = Query(...), start_date: str = Query(...), end_date: str = Query(...)
+async def forecast_point_many_days(
+    request: Request,
+    place: str = Query(...),
+    start_date: str = Query(...),
+    end_date: str = Query(...),
+    engine: Engine = Query("lightgbm"),
+    format: Format = Query("figure"),
+    table: Table = Query("ci"),
+    max_points: MaxPoints = Query(None, ge=10),
 ):
-    latitude, longitude = geocode_osm(place)
+    latitude, longitude = await geocode_osm_async(place)
+    cell = snap_to_grid(latitude, longitude)
     start_date = datetime.fromisoformat(start_date)
     end_date = datetime.fromisoformat(end_date)
-    ci_list = []
-    target_date = start_date
-    while target_date <= end_date:
-        raw_df = fetch_hourly_data(target_date, latitude, longitude, PARAMETERS)
-        raw_df = normalize_raw_df(raw_df)
-        # 2) dự đoán bằng LightGBM quantile
-        pred_df, models = forecast_lightgbm_multitarget(
-            raw_df,
-            PARAMETERS,
-            target_date,
-            quantiles=[0.05, 0.2, 0.35, 0.5, 0.65, 0.8, 0.95],
-            num_boost_round=20,
-        )
-        target_date += timedelta(1)
-        ci_df = compute_ci_from_pred_df(pred_df, PARAMETERS)
-        ci_list.append(ci_df)
-
-    ci = pd.concat(ci_list, axis=0).reset_index()
-    ci = ci.drop_duplicates(subset=["datetime"], keep="last")
-    ci = ci.drop(ci.columns[0], axis=1)
 
-    # 6. Vẽ biểu đồ cho tất cả param
-    figures = {}
-    for parameter in PARAMETERS:
-        fig_dict = plotly_many_days(ci, parameter)
-        figures[parameter] = json.dumps(fig_dict, default=str)  # ép thành JSON string
+    key = result_key(
+        "forecast_point_many_days",
+        place=place,
+        coords=(latitude, longitude),
+        cell=cell.key,
+        start_date=start_date,
+        end_date=end_date,
+        engine=engine,
+        format=format,
+        table=table,
+        max_points=max_points,
+        **FORECAST_SETTINGS,
+    )
+    return await cached_build(
+        request,
+        key,
+        engine,
+        lambda: point_many_days_response(
+            place,
+            latitude,
+            longitude,
+            cell,
+            start_date,
+            end_date,
+            engine,
+            format,
+            table,
+            max_points,
+        ),
+    )
+
+
+async def point_many_days_response(
+    place,
+    latitude,
+    longitude,
+    cell,
+    start_date,
+    end_date,
+    engine,
+    format,
+    table,
+    max_points,
+) -> Response:
+    # fetch 1 lần cả khoảng ngày, train 1 lần, CI (trên process pool)
+    pred_df, ci = await run_pipeline(
+        point_pipeline,
+        cell,
+        start_date,
+        end_date,
+        engine,
+        PARAMETERS,
+        QUANTILES,
+        NUM_BOOST_ROUND,
+        key=cell.key,
+    )
 
-    return {
+    payload = {
         "place": place,
         "coords": {"latitude": latitude, "longitude": longitude},
-        "date": target_date.isoformat(),
-        "figures": figures,  # lúc này mỗi cái là JSON string
+        "cell": cell.to_dict(),
+        "date": start_date.isoformat(),
     }
+    if format in TABLE_FORMATS:
+        frame = ci if table == "ci" else pred_df
+        return await asyncio.to_thread(respond_table, frame, format, payload)
+
+    # 6. Vẽ biểu đồ cho tất cả param
+    rendered = await asyncio.to_thread(
+        render_figures, ci, PARAMETERS, plotly_many_days, format, "datetime", max_points
+    )
+    payload.update(rendered)
+    return respond(payload, format)
+
+
+def cells_key(cells) -> str:
+    # 1 ô -> cùng worker với forecast điểm của ô đó
+    return ",".join(cell.key for cell in cells)
 
 
 def average_point(coords: list[list[float]]) -> tuple[float, float]:
@@ -155,44 +399,103 @@ def average_point(coords: list[list[float]]) -> tuple[float, float]:
     return (sum_lat / n, sum_lng / n)
 
 
+async def forecast_region(
+    coords: List[List[float]],
+    start_date: datetime,
+    end_date: datetime,
+    engine: str,
+):
+    """
+    Forecast mọi ô lưới POWER trong đa giác: fetch đồng thời, train gộp 1 lần
+    (trên process pool). Trả về (cells, weights, ci_df của cả vùng, pred_df của từng ô).
+    """
+    try:
+        cells = cells_in_polygon(coords)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    weights = cell_area_weights(cells)
+
+    ci_df, cell_preds = await run_pipeline(
+        region_pipeline,
+        cells,
+        weights,
+        start_date,
+        end_date,
+        engine,
+        PARAMETERS,
+        QUANTILES,
+        NUM_BOOST_ROUND,
+        key=cells_key(cells),
+    )
+    return cells, weights, ci_df, cell_preds
+
+
+def region_cells_payload(cells, weights, cell_preds):
+    """Median dự báo của từng ô, kèm trọng số diện tích."""
+    return [
+        {
+            **cell.to_dict(),
+            "weight": float(weight),
+            "values": {p: pred_df[p].tolist() for p in PARAMETERS},
+        }
+        for cell, weight, pred_df in zip(cells, weights, cell_preds)
+    ]
+
+
+def region_pred_frame(cells, weights, cell_preds) -> pd.DataFrame:
+    """pred_df của mọi ô nối dài, thêm toạ độ tâm ô và trọng số diện tích."""
+    return pd.concat(
+        [
+            pred_df.assign(
+                latitude=cell.latitude, longitude=cell.longitude, weight=weight
+            )
+            for cell, weight, pred_df in zip(cells, weights, cell_preds)
+        ],
+        ignore_index=True,
+    )
+
+
 @app.post("/forecast_region")
-def forecast_region_one_day(coords: List[List[float]], target_date: str = Query(...)):
+async def forecast_region_one_day(
+    coords: List[List[float]],
+    target_date: str = Query(...),
+    engine: RegionEngine = Query("lightgbm"),
+    format: Format = Query("figure"),
+    table: Table = Query("ci"),
+):
     latitude, longitude = average_point(coords)
 
     try:
-        target_date = datetime.fromisoformat(date)
+        target_date = datetime.fromisoformat(target_date)
     except Exception:
-        raise RuntimeError(f"Ngày không hợp lệ: {date}")
+        raise RuntimeError(f"Ngày không hợp lệ: {target_date}")
 
-    # 3. Lấy dữ liệu NASA POWER
-    raw_df = fetch_hourly_data(target_date, latitude, longitude, PARAMETERS)
-    raw_df = normalize_raw_df(raw_df)
-    if raw_df.empty:
-        raise RuntimeError("Không có dữ liệu từ NASA POWER")
-
-    pred_df, models = forecast_lightgbm_multitarget(
-        raw_df,
-        PARAMETERS,
-        target_date,
-        quantiles=[0.05, 0.2, 0.35, 0.5, 0.65, 0.8, 0.95],
-        num_boost_round=20,
+    cells, weights, ci_df, cell_preds = await forecast_region(
+        coords, target_date, target_date, engine
     )
 
-    # 3) compute CI dataframe
-    ci_df = compute_ci_from_pred_df(pred_df, PARAMETERS, ci_levels=[0.3, 0.6, 0.9])
+    if format in TABLE_FORMATS:
+        metadata = {
+            "coords": {"latitude": latitude, "longitude": longitude},
+            "date": target_date.isoformat(),
+        }
+        if table == "pred":
+            ci_df = region_pred_frame(cells, weights, cell_preds)
+        return await asyncio.to_thread(respond_table, ci_df, format, metadata)
 
     # 6. Vẽ biểu đồ cho tất cả param
-    figures = {}
-    for parameter in PARAMETERS:
-        fig_dict = plotly_one_day(ci_df, parameter)
-        figures[parameter] = json.dumps(fig_dict, default=str)  # ép thành JSON string
+    rendered = await asyncio.to_thread(
+        render_figures, ci_df, PARAMETERS, plotly_one_day, format
+    )
 
-    return {
-        "place": place,
+    payload = {
         "coords": {"latitude": latitude, "longitude": longitude},
+        "cells": region_cells_payload(cells, weights, cell_preds),
+        "times": [dt.isoformat() for dt in cell_preds[0]["datetime"]],
         "date": target_date.isoformat(),
-        "figures": figures,  # lúc này mỗi cái là JSON string
+        **rendered,
     }
+    return respond(payload, format)
 
 
 @app.get("/", response_class=HTMLResponse)
@@ -204,43 +507,104 @@ def current_place(request: Request):
     )
 
 
-@app.get("/forecast_region_many_days")
-def forecast_region_many_days(
-    coords: List[List[float]], start_date: str = Query(...), end_date: str = Query(...)
+@app.post("/forecast_region_many_days")
+async def forecast_region_many_days(
+    coords: List[List[float]],
+    start_date: str = Query(...),
+    end_date: str = Query(...),
+    engine: RegionEngine = Query("lightgbm"),
+    format: Format = Query("figure"),
+    table: Table = Query("ci"),
+    max_points: MaxPoints = Query(None, ge=10),
 ):
     latitude, longitude = average_point(coords)
     start_date = datetime.fromisoformat(start_date)
     end_date = datetime.fromisoformat(end_date)
-    target_date = start_date
-    ci_list = []
-
-    while target_date <= end_date:
-        raw_df = fetch_hourly_data(target_date, latitude, longitude, PARAMETERS)
-        raw_df = normalize_raw_df(raw_df)
-        target_date += timedelta(1)
-        # 2) dự đoán bằng LightGBM quantile
-        pred_df, models = forecast_lightgbm_multitarget(
-            raw_df,
-            PARAMETERS,
-            target_date,
-            quantiles=[0.05, 0.2, 0.35, 0.5, 0.65, 0.8, 0.95],
-            num_boost_round=20,
-        )
-        ci_df = compute_ci_from_pred_df(pred_df, PARAMETERS)
-        ci_list.append(ci_df)
-
-    ci = pd.concat(ci_list, axis=0).reset_index()
-    ci = ci.drop_duplicates(subset=["datetime"], keep="last")
+    cells, weights, ci, cell_preds = await forecast_region(
+        coords, start_date, end_date, engine
+    )
+
+    if format in TABLE_FORMATS:
+        metadata = {
+            "coords": {"latitude": latitude, "longitude": longitude},
+            "date": start_date.isoformat(),
+        }
+        if table == "pred":
+            ci = region_pred_frame(cells, weights, cell_preds)
+        return await asyncio.to_thread(respond_table, ci, format, metadata)
 
     # 6. Vẽ biểu đồ cho tất cả param
-    figures = {}
-    for parameter in PARAMETERS:
-        fig_dict = plotly_many_days(ci_df, parameter)
-        figures[parameter] = json.dumps(fig_dict, default=str)  # ép thành JSON string
+    rendered = await asyncio.to_thread(
+        render_figures, ci, PARAMETERS, plotly_many_days, format, "datetime", max_points
+    )
 
-    return {
-        "place": place,
+    payload = {
         "coords": {"latitude": latitude, "longitude": longitude},
-        "date": target_date.isoformat(),
-        "figures": figures,  # lúc này mỗi cái là JSON string
+        "cells": region_cells_payload(cells, weights, cell_preds),
+        "times": [dt.isoformat() for dt in cell_preds[0]["datetime"]],
+        "date": start_date.isoformat(),
+        **rendered,
     }
+    return respond(payload, format)
+
+
+@app.get("/forecast_raster")
+async def forecast_raster(
+    south: float = Query(...),
+    west: float = Query(...),
+    north: float = Query(...),
+    east: float = Query(...),
+    date: str = Query(...),
+    parameter: str = Query(...),
+    engine: RegionEngine = Query("climatology"),
+):
+    """
+    Dự báo 1 param cho mọi ô lưới POWER trong bounding box, trả về mảng
+    giờ x vĩ độ x kinh độ (median và dải 90%) để vẽ heatmap.
+    """
+    if parameter not in PARAMETERS:
+        raise HTTPException(status_code=400, detail=f"Unknown parameter {parameter!r}")
+    try:
+        cells, shape = cells_in_bbox(south, west, north, east)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        target_date = datetime.fromisoformat(date)
+    except Exception:
+        raise RuntimeError(f"Ngày không hợp lệ: {date}")
+
+    # chỉ fetch param cần vẽ, train gộp mọi ô (trên process pool)
+    cell_preds = await run_pipeline(
+        raster_pipeline,
+        cells,
+        target_date,
+        parameter,
+        engine,
+        RASTER_QUANTILES,
+        NUM_BOOST_ROUND,
+        key=cells_key(cells),
+    )
+    n_lat, n_lon = shape
+    return ORJSONResponse(
+        {
+            "parameter": parameter,
+            "date": target_date.isoformat(),
+            "shape": [len(cell_preds[0]), n_lat, n_lon],
+            "lat": [cell.latitude for cell in cells[::n_lon]],
+            "lon": [cell.longitude for cell in cells[:n_lon]],
+            "times": [dt.isoformat() for dt in cell_preds[0]["datetime"]],
+            "median": grid_array(cell_preds, parameter, shape).round(3),
+            "low": grid_array(cell_preds, f"{parameter}_q05", shape).round(3),
+            "high": grid_array(cell_preds, f"{parameter}_q95", shape).round(3),
+        }
+    )
+
+
+@app.get("/figure_template")
+def get_figure_template():
+    """Style tĩnh của các figure cho format=data; client cache lâu dài."""
+    return ORJSONResponse(
+        {p: figure_template(p) for p in PARAMETERS},
+        headers={"Cache-Control": "public, max-age=86400"},
+    )
@@ -1,5 +1,25 @@
-from main import forecast_point_one_day
+from fastapi.testclient import TestClient
 
-# Test trực tiếp (bỏ qua HTTP request)
-result = forecast_point_one_day(place="Hanoi", date="2025-10-05")
-print(result)
+from main import app
+
+
+def main():
+    # Test qua HTTP (route async, forecast chạy trên process pool)
+    with TestClient(app) as client:
+        params = {"place": "Hanoi", "date": "2025-10-05", "engine": "lightgbm"}
+        response = client.get("/forecast_point_one_day", params=params)
+        print(response.status_code, response.headers.get("etag"))
+        print(response.json())
+
+        # lần 2 lấy từ result cache, gửi kèm ETag -> 304 không có body
+        revalidated = client.get(
+            "/forecast_point_one_day",
+            params=params,
+            headers={"If-None-Match": response.headers["etag"]},
+        )
+        print(revalidated.status_code)
+
+
+# worker của forecast pool dùng "spawn" và import lại __main__
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.bench_build_aggregates import (
+    PARAMETERS,
+    build_aggregates_legacy,
+    make_raw_df,
+)
+from core.analysis import (
+    _day_of_year,
+    _predict_multiquantile,
+    build_aggregates,
+    classify_values,
+    compile_thresholds,
+    compute_ci_from_pred_df,
+    forecast_climatology,
+    forecast_lightgbm_multitarget,
+    threshold_segments,
+)
+
+QUANTILES = [0.05, 0.2, 0.35, 0.5, 0.65, 0.8, 0.95]
+
+
+def _assert_frames_close(expected: pd.DataFrame, actual: pd.DataFrame):
+    assert list(actual.columns) == list(expected.columns)
+    assert len(actual) == len(expected)
+    for column in expected.columns:
+        np.testing.assert_allclose(
+            actual[column].to_numpy(dtype=float),
+            expected[column].to_numpy(dtype=float),
+            rtol=1e-9,
+            atol=1e-9,
+            err_msg=column,
+        )
+
+
+def test_build_aggregates_matches_groupby():
+    raw_df = make_raw_df(years=4)
+    _assert_frames_close(
+        build_aggregates_legacy(raw_df, PARAMETERS),
+        build_aggregates(raw_df, PARAMETERS),
+    )
+
+
+def test_build_aggregates_sparse_groups():
+    raw_df = make_raw_df(years=3)
+    # 1 nhóm toàn NaN, 1 nhóm chỉ còn 1 giá trị (std NaN) với param đầu
+    first = (raw_df["month"] == 10) & (raw_df["day"] == 1) & (raw_df["hour"] == 0)
+    second = (raw_df["month"] == 10) & (raw_df["day"] == 2) & (raw_df["hour"] == 5)
+    raw_df.loc[first, "T2M"] = np.nan
+    raw_df.loc[second & (raw_df["year"] != 2015), "T2M"] = np.nan
+
+    expected = build_aggregates_legacy(raw_df, PARAMETERS)
+    actual = build_aggregates(raw_df, PARAMETERS)
+    _assert_frames_close(expected, actual)
+    row = actual[(actual["day"] == 2) & (actual["hour"] == 5)].iloc[0]
+    assert row["T2M_hist_count"] == 1
+    assert np.isnan(row["T2M_hist_std"])
+
+
+class _ConstantModel:
+    def __init__(self, values):
+        self.values = np.asarray(values, dtype=float)
+
+    def predict(self, X, num_threads=1):
+        return self.values
+
+
+def _quantile_columns(pred_df, parameter):
+    return pred_df[[f"{parameter}_q{int(q * 100):02d}" for q in QUANTILES]].to_numpy()
+
+
+def test_predict_multiquantile_sorts_crossing_offsets():
+    # offset của q05 lớn hơn của q95 ở điểm thứ 2 -> phải được sắp lại
+    models = {
+        0.5: _ConstantModel([10.0, 10.0]),
+        0.05: _ConstantModel([-2.0, 3.0]),
+        0.95: _ConstantModel([2.0, -1.0]),
+    }
+    preds = _predict_multiquantile(models, np.zeros((2, 1)), [0.95, 0.5, 0.05])
+    np.testing.assert_array_equal(preds[0.05], [8.0, 9.0])
+    np.testing.assert_array_equal(preds[0.5], [10.0, 10.0])
+    np.testing.assert_array_equal(preds[0.95], [12.0, 13.0])
+
+
+def test_multiquantile_forecast_does_not_cross():
+    raw_df = make_raw_df(years=4)
+    pred_df, models = forecast_lightgbm_multitarget(
+        raw_df,
+        ["T2M", "WS2M"],
+        datetime(2025, 10, 4),
+        quantiles=QUANTILES,
+        num_boost_round=10,
+        engine="multiquantile",
+        end_dt=datetime(2025, 10, 5),
+    )
+    assert len(pred_df) == 48
+    for parameter in ("T2M", "WS2M"):
+        assert set(models[parameter]) == set(QUANTILES)
+        values = _quantile_columns(pred_df, parameter)
+        assert np.isfinite(values).all()
+        assert (np.diff(values, axis=1) >= 0).all()
+        np.testing.assert_array_equal(pred_df[parameter], pred_df[f"{parameter}_q50"])
+
+
+def _year_end_raw_df() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    index = pd.DatetimeIndex(
+        np.concatenate(
+            [
+                pd.date_range(f"{year}-12-20", f"{year + 1}-01-12 23:00", freq="h")
+                for year in range(2015, 2019)
+            ]
+        )
+    )
+    raw_df = pd.DataFrame(
+        {"T2M": rng.normal(20, 4, len(index)), "WS2M": rng.gamma(2, 2, len(index))},
+        index=index,
+    )
+    raw_df.iloc[::50, 0] = np.nan
+    raw_df["year"] = raw_df.index.year
+    raw_df["month"] = raw_df.index.month
+    raw_df["day"] = raw_df.index.day
+    raw_df["hour"] = raw_df.index.hour
+    return raw_df
+
+
+def test_climatology_bands_match_window_percentiles():
+    raw_df = _year_end_raw_df()
+    window = 3
+    pred_df = forecast_climatology(
+        raw_df,
+        ["T2M", "WS2M"],
+        datetime(2025, 12, 30),
+        quantiles=QUANTILES,
+        end_dt=datetime(2026, 1, 2),
+        window=window,
+    )
+    assert len(pred_df) == 4 * 24
+
+    # tham chiếu: lọc trực tiếp theo khoảng cách day-of-year vòng theo năm
+    raw_doy = _day_of_year(raw_df["month"].to_numpy(), raw_df["day"].to_numpy())
+    for _, row in pred_df.iloc[::7].iterrows():
+        dt = row["datetime"]
+        distance = np.abs(raw_doy - _day_of_year(np.array(dt.month), np.array(dt.day)))
+        near = (np.minimum(distance, 366 - distance) <= window) & (
+            raw_df["hour"].to_numpy() == dt.hour
+        )
+        for parameter in ("T2M", "WS2M"):
+            history = raw_df.loc[near, parameter].to_numpy()
+            expected = np.nanpercentile(history, [q * 100 for q in QUANTILES])
+            actual = row[[f"{parameter}_q{int(q * 100):02d}" for q in QUANTILES]]
+            np.testing.assert_allclose(actual.to_numpy(dtype=float), expected)
+            assert row[parameter] == np.nanmedian(history)
+
+
+def test_climatology_ci_bands_are_nested():
+    pred_df = forecast_climatology(
+        _year_end_raw_df(), ["T2M"], datetime(2026, 1, 1), quantiles=QUANTILES
+    )
+    ci_df = compute_ci_from_pred_df(pred_df, ["T2M"])
+    lows = ci_df[[f"T2M_low_{level}" for level in (30, 60, 90)]].to_numpy()
+    highs = ci_df[[f"T2M_high_{level}" for level in (30, 60, 90)]].to_numpy()
+    assert (np.diff(lows, axis=1) <= 0).all()
+    assert (np.diff(highs, axis=1) >= 0).all()
+    assert (lows[:, 0] <= ci_df["T2M"]).all()
+    assert (ci_df["T2M"] <= highs[:, 0]).all()
+
+
+THRESHOLDS = [
+    {"lower": 30, "upper": "inf", "label": "hot"},
+    {"lower": "-inf", "upper": 10, "label": "cold"},
+    {"lower": 10, "upper": 20, "label": "mild"},
+    # khoảng trống (20, 25)
+    {"lower": 25, "upper": 30, "label": "warm"},
+]
+
+
+def _classify_sequential(value, thresholds):
+    for i, t in enumerate(thresholds):
+        if float(t["lower"]) <= value <= float(t["upper"]):
+            return i
+    return -1
+
+
+def test_classify_values_matches_sequential_scan():
+    bins = compile_thresholds(THRESHOLDS)
+    values = np.array([-50, 9.9, 10, 15, 20, 22, 25, 30, 31, np.inf, np.nan])
+    expected = [_classify_sequential(v, bins.thresholds) for v in values]
+    # giá trị đúng biên thuộc ngưỡng thấp hơn, dù "hot" đứng trước trong list
+    expected[values.tolist().index(30)] = 3
+    np.testing.assert_array_equal(classify_values(values, bins), expected)
+    assert classify_values([], bins).shape == (0,)
+
+
+def test_compile_thresholds_rejects_overlap():
+    with pytest.raises(ValueError):
+        compile_thresholds([{"lower": 0, "upper": 10}, {"lower": 5, "upper": 20}])
+    with pytest.raises(ValueError):
+        compile_thresholds([{"lower": 10, "upper": 0}])
+
+
+def test_threshold_segments_run_length():
+    bins = compile_thresholds(THRESHOLDS)
+    values = [5, 6, 15, 15, 22, 26, 27, 5]
+    segments = threshold_segments(values, bins)
+    assert [(start, end, t["label"]) for start, end, t in segments] == [
+        (0, 2, "cold"),
+        (2, 4, "mild"),
+        (5, 7, "warm"),
+        (7, 7, "cold"),
+    ]
+    assert threshold_segments([], bins) == []
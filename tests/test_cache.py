@@ -0,0 +1,112 @@
+import multiprocessing
+import os
+
+import pandas as pd
+
+from core.cache import DiskCache, MemoryCache
+
+
+def _disk_usage(directory) -> int:
+    return sum(
+        path.stat().st_size for path in directory.rglob("*.bin") if path.is_file()
+    )
+
+
+def _fill(directory: str, prefix: str):
+    cache = DiskCache(directory, max_bytes=10_000)
+    for i in range(40):
+        cache.put_bytes(f"{prefix}-{i}", b"x" * 1000, ".bin")
+
+
+def test_disk_cache_evicts_least_recently_used(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=3_500)
+    for i, key in enumerate("abc"):
+        path = cache.put_bytes(key, b"x" * 1000, ".bin")
+        # mtime là thứ tự LRU, đặt cách nhau rõ ràng
+        os.utime(path, (1_000_000 + i, 1_000_000 + i))
+
+    # đọc "a" -> thành mới nhất, "b" là cũ nhất
+    assert cache.get_bytes("a", ".bin") == b"x" * 1000
+    cache.put_bytes("d", b"x" * 1000, ".bin")
+
+    assert cache.get_bytes("b", ".bin") is None
+    for key in "acd":
+        assert cache.get_bytes(key, ".bin") is not None
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] == _disk_usage(tmp_path) <= 3_500
+
+
+def test_disk_cache_overwrite_keeps_size_ledger(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=10_000)
+    cache.put_bytes("a", b"x" * 1000, ".bin")
+    cache.put_bytes("a", b"y" * 400, ".bin")
+    assert cache.get_bytes("a", ".bin") == b"y" * 400
+    assert cache.stats()["bytes"] == 400
+
+    # sổ dung lượng dùng chung với instance khác trên cùng thư mục
+    assert DiskCache(str(tmp_path), max_bytes=10_000).stats()["bytes"] == 400
+    cache.clear()
+    stats = cache.stats()
+    assert (stats["entries"], stats["bytes"]) == (0, 0)
+
+
+def test_disk_cache_frame_round_trip(tmp_path):
+    cache = DiskCache(str(tmp_path), max_bytes=1_000_000)
+    df = pd.DataFrame(
+        {"T2M": [1.5, 2.5]}, index=pd.date_range("2020-01-01", periods=2, freq="h")
+    )
+    assert cache.get_frame("k") is None
+    cache.put_frame("k", df)
+    pd.testing.assert_frame_equal(cache.get_frame("k"), df, check_freq=False)
+
+
+def test_disk_budget_shared_between_processes(tmp_path):
+    # mỗi process có DiskCache riêng trên cùng thư mục, như các forecast worker
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_fill, args=(str(tmp_path), prefix)) for prefix in "ab"]
+    for proc in procs:
+        proc.start()
+    for proc in procs:
+        proc.join(timeout=120)
+        assert proc.exitcode == 0
+
+    cache = DiskCache(str(tmp_path), max_bytes=10_000)
+    assert _disk_usage(tmp_path) <= 10_000
+    assert cache.stats()["bytes"] == _disk_usage(tmp_path)
+
+
+def test_memory_cache_evicts_by_items_and_bytes():
+    cache = MemoryCache(ttl=60, max_items=3, max_bytes=10, sizeof=len)
+    for key in "abc":
+        cache.put(key, "xx")
+    assert cache.get("a") == "xx"
+    cache.put("d", "xx")
+    # vượt max_items -> bỏ "b" (ít dùng nhất), "a" vừa đọc được giữ
+    assert cache.get("b") is None
+    assert cache.get("a") == "xx"
+
+    cache.put("e", "xxxxxx")
+    # vượt max_bytes -> bỏ tiếp các entry cũ nhất
+    assert cache.stats()["bytes"] <= 10
+    assert cache.get("e") == "xxxxxx"
+    assert cache.get("c") is None
+
+    # entry lớn hơn max_bytes không được cache
+    cache.put("big", "x" * 11)
+    assert cache.get("big") is None
+    assert cache.stats()["evictions"] == 2
+
+
+def test_memory_cache_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("core.cache.time.time", lambda: now[0])
+    cache = MemoryCache(ttl=10)
+    cache.put("a", 1)
+    cache.put("b", 2, ttl=100)
+    cache.put("c", 3, ttl=0)
+    now[0] += 11
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.get("c") is None
+    assert cache.stats()["entries"] == 1
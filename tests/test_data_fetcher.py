@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from core.data_fetcher import _shift_year, decode_power_hourly, plan_hourly_ranges
+
+KEYS = ["2020022822", "2020022823", "2020022900", "2020123123", "2021010100"]
+
+
+def _legacy_decode(result, parameters) -> pd.DataFrame:
+    # cách cũ: pd.Series mỗi param rồi parse chuỗi key
+    df = pd.DataFrame({p: pd.Series(result[p]) for p in parameters})
+    df.index = pd.to_datetime(df.index, format="%Y%m%d%H")
+    return df
+
+
+def test_decode_power_hourly_matches_string_parsing():
+    result = {
+        "T2M": dict(zip(KEYS, [1.5, 2.25, -3.0, 4.0, 5.125])),
+        "RH2M": dict(zip(KEYS, [50.0, 60.0, 70.0, 80.0, 90.0])),
+    }
+    df = decode_power_hourly(result, ["T2M", "RH2M"])
+    expected = _legacy_decode(result, ["T2M", "RH2M"])
+
+    pd.testing.assert_index_equal(df.index, expected.index, check_names=False)
+    for parameter in ("T2M", "RH2M"):
+        assert df[parameter].dtype == np.float32
+        np.testing.assert_array_equal(
+            df[parameter].to_numpy(), expected[parameter].to_numpy(np.float32)
+        )
+    np.testing.assert_array_equal(df["year"], expected.index.year)
+    np.testing.assert_array_equal(df["month"], expected.index.month)
+    np.testing.assert_array_equal(df["day"], expected.index.day)
+    np.testing.assert_array_equal(df["hour"], expected.index.hour)
+
+
+def test_decode_power_hourly_aligns_params_by_key():
+    # param thứ 2 có key khác thứ tự và thiếu 1 giờ
+    result = {
+        "T2M": dict(zip(KEYS, [1.0, 2.0, 3.0, 4.0, 5.0])),
+        "WS2M": {KEYS[2]: 30.0, KEYS[0]: 10.0, KEYS[4]: 50.0, KEYS[3]: 40.0},
+    }
+    df = decode_power_hourly(result, ["T2M", "WS2M"])
+    np.testing.assert_array_equal(df["T2M"], [1.0, 2.0, 3.0, 4.0, 5.0])
+    np.testing.assert_array_equal(df["WS2M"], [10.0, np.nan, 30.0, 40.0, 50.0])
+
+
+def _covered_days(ranges):
+    days = set()
+    for lo, hi in ranges:
+        day = lo
+        while day <= hi:
+            days.add(day)
+            day += timedelta(days=1)
+    return days
+
+
+def test_plan_single_day_one_range_per_year():
+    ranges = plan_hourly_ranges(datetime(2025, 10, 5, 13), datetime(2025, 10, 5))
+    assert ranges == [
+        (datetime(2025 - i, 9, 30), datetime(2025 - i, 10, 10))
+        for i in range(10, 0, -1)
+    ]
+
+
+def test_plan_covers_every_window_without_overlap():
+    start, end = datetime(2024, 12, 20), datetime(2025, 3, 2)
+    ranges = plan_hourly_ranges(start, end, window=5, years_back=3)
+    covered = _covered_days(ranges)
+
+    day = start
+    while day <= end:
+        for i in range(1, 4):
+            center = _shift_year(day, day.year - i)
+            for offset in range(-5, 6):
+                assert center + timedelta(days=offset) in covered
+        day += timedelta(days=1)
+
+    # đã sắp xếp, không chồng lấn và không nằm sát nhau
+    for (_, hi), (lo, _) in zip(ranges, ranges[1:]):
+        assert lo > hi + timedelta(days=1)
+
+
+def test_plan_long_range_merges_into_one():
+    ranges = plan_hourly_ranges(datetime(2024, 1, 1), datetime(2024, 12, 31))
+    assert ranges == [(datetime(2013, 12, 27), datetime(2024, 1, 5))]
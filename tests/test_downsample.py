@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+from core.downsample import downsample_ci_df, local_extrema, lttb_indices
+
+
+def _lttb_reference(y, n_out):
+    # LTTB từng điểm một, cùng cách chia bucket với lttb_indices
+    n = len(y)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    buckets = [range(edges[b], edges[b + 1]) for b in range(n_out - 2)]
+    buckets.append(range(n - 1, n))
+    selected = [0]
+    for b in range(n_out - 2):
+        nxt = buckets[b + 1]
+        avg_x = np.mean(list(nxt))
+        avg_y = np.mean([y[i] for i in nxt])
+        a = selected[-1]
+        best, best_area = None, -1.0
+        for i in buckets[b]:
+            area = abs((a - avg_x) * (y[i] - y[a]) - (a - i) * (avg_y - y[a]))
+            if area > best_area:
+                best, best_area = i, area
+        selected.append(best)
+    selected.append(n - 1)
+    return selected
+
+
+def test_lttb_matches_reference():
+    y = np.cumsum(np.random.default_rng(0).normal(size=1000))
+    for n_out in (3, 10, 97, 500):
+        indices = lttb_indices(y, n_out)
+        assert len(indices) == n_out
+        assert (np.diff(indices) > 0).all()
+        np.testing.assert_array_equal(indices, _lttb_reference(y, n_out))
+
+
+def test_lttb_keeps_spike_and_short_series():
+    y = np.zeros(500)
+    y[123] = 100.0
+    assert 123 in lttb_indices(y, 20)
+    np.testing.assert_array_equal(lttb_indices(y[:5], 10), np.arange(5))
+
+
+def test_local_extrema():
+    np.testing.assert_array_equal(local_extrema([0, 2, 1, 1, 0, 3]), [1, 4])
+    assert len(local_extrema([1, 2])) == 0
+
+
+def test_downsample_ci_df_keeps_extremes():
+    rng = np.random.default_rng(1)
+    n = 24 * 30
+    mean = np.sin(np.arange(n) / 24 * 2 * np.pi) * 10 + rng.normal(size=n)
+    ci_df = pd.DataFrame(
+        {
+            "datetime": pd.date_range("2025-01-01", periods=n, freq="h"),
+            "T2M": mean,
+            "T2M_low_90": mean - 3,
+            "T2M_high_90": mean + 3,
+        }
+    )
+    out = downsample_ci_df(ci_df, "T2M", 200)
+    assert len(out) <= 200
+    assert out["datetime"].is_monotonic_increasing
+    assert out["T2M"].max() == ci_df["T2M"].max()
+    assert out["T2M"].min() == ci_df["T2M"].min()
+    # các dải CI lấy cùng dòng với mean
+    np.testing.assert_array_equal(out["T2M_low_90"], out["T2M"] - 3)
+    assert downsample_ci_df(ci_df, "T2M", None) is ci_df
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from core.grid import N_LON, cells_in_bbox, cells_in_polygon, snap_to_grid
+
+
+def test_polygon_inside_grid():
+    polygon = [[20, 105], [20, 107], [22, 107], [22, 105]]
+    cells = cells_in_polygon(polygon)
+    assert cells
+    for cell in cells:
+        assert 20 <= cell.latitude <= 22
+        assert 105 <= cell.longitude <= 107
+
+
+def test_polygon_crossing_antimeridian():
+    polygon = [[10, 179], [10, -179], [11, -179], [11, 179]]
+    cells = cells_in_polygon(polygon)
+    assert 0 < len(cells) <= 8
+    assert {cell.lat_index for cell in cells} <= {
+        snap_to_grid(lat, 0).lat_index for lat in (10, 10.5, 11)
+    }
+    # kinh độ tâm ô nằm trong [179, 180] hoặc [-180, -179]
+    for cell in cells:
+        assert abs(cell.longitude) >= 179
+        assert 0 <= cell.lon_index < N_LON
+    # cùng các ô với bounding box tương ứng
+    bbox_cells, _ = cells_in_bbox(10, 179, 11, -179)
+    assert set(cells) <= set(bbox_cells)
+
+
+def test_polygon_does_not_modify_input():
+    polygon = np.array([[10.0, 179.0], [10.0, -179.0], [11.0, -179.0]])
+    cells_in_polygon(polygon)
+    assert polygon[1, 1] == -179.0
+
+
+def test_polygon_too_many_cells():
+    with pytest.raises(ValueError):
+        cells_in_polygon([[0, 0], [0, 20], [20, 20], [20, 0]], max_cells=10)
+
+
+def test_polygon_spanning_more_than_360_degrees():
+    # mỗi cạnh < 180° nhưng cộng dồn quá 1 vòng kinh độ
+    polygon = [[0, 0], [0, 170], [0, -20], [0, 150], [1, 150]]
+    with pytest.raises(ValueError, match="360"):
+        cells_in_polygon(polygon)
+
+
+def test_polygon_bbox_rejected_before_meshgrid():
+    polygon = [[-89, -179], [-89, 0], [-89, 179], [89, 179], [89, 0], [89, -179]]
+    with pytest.raises(ValueError, match="bounding box"):
+        cells_in_polygon(polygon)
+
+
+def test_bbox_full_longitude_circle():
+    cells, shape = cells_in_bbox(0, -180, 1, 180, max_cells=10_000)
+    assert shape == (3, N_LON)
+    assert len(set(cells)) == len(cells) == 3 * N_LON
+
+
+def test_bbox_east_edge_near_antimeridian():
+    # east làm tròn lên đúng ô -180 (chỉ số N_LON), không được thành 1 cột
+    cells, shape = cells_in_bbox(0, -180, 0, 179.9, max_cells=10_000)
+    assert shape == (1, N_LON)
+
+
+def test_bbox_crossing_antimeridian():
+    cells, shape = cells_in_bbox(10, 179, 11, -179)
+    assert shape[1] == 5
+    assert all(abs(cell.longitude) >= 178.5 for cell in cells)
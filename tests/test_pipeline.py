@@ -0,0 +1,181 @@
+import asyncio
+import os
+import threading
+import time
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import main
+from core.pipeline import ForecastPool, PoolBusyError, _init_worker
+
+
+def _worker_budgets():
+    from core.model import bootstrap_ensemble
+    from core.scheduler import training_scheduler
+
+    return (
+        os.environ["TRAIN_CORE_BUDGET"],
+        training_scheduler.budget.total,
+        bootstrap_ensemble.workers,
+        bootstrap_ensemble.processes,
+    )
+
+
+def _worker_pid():
+    return os.getpid()
+
+
+def _power_limit():
+    from core.http_client import http_client
+
+    return http_client._limit_values["power"]
+
+
+def _bootstrap_in_worker():
+    from core.model import bootstrap_ensemble
+
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(200, 6)).astype(np.float32)
+    Y = rng.normal(size=(200, 2)).astype(np.float32)
+    means, samples = bootstrap_ensemble.fit_predict(X, Y, X[:24], n_members=2)
+    return means.shape, samples.shape
+
+
+def test_init_worker_resizes_existing_singletons():
+    from core.model import bootstrap_ensemble
+    from core.scheduler import training_scheduler
+
+    # singleton đã được tạo trước initializer, như khi __main__ import main
+    total, workers = training_scheduler.budget.total, bootstrap_ensemble.workers
+    env = {
+        key: os.environ.get(key)
+        for key in ("TRAIN_CORE_BUDGET", "BOOTSTRAP_WORKERS", "POWER_CONCURRENCY")
+    }
+    try:
+        _init_worker(3, 2, 8)
+        assert training_scheduler.budget.total == 3
+        assert bootstrap_ensemble.workers == 2
+        assert not bootstrap_ensemble.processes
+    finally:
+        training_scheduler.resize(total)
+        bootstrap_ensemble.resize(workers, processes=True)
+        for key, value in env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def test_worker_sees_split_budget(monkeypatch):
+    monkeypatch.setenv("TRAIN_CORE_BUDGET", "8")
+    monkeypatch.setenv("BOOTSTRAP_WORKERS", "6")
+    pool = ForecastPool(workers=2, queue_size=0)
+    try:
+        budgets = pool.submit(_worker_budgets).result(timeout=120)
+    finally:
+        pool.shutdown()
+    assert budgets == ("4", 4, 3, False)
+
+
+def test_same_key_runs_on_same_worker(monkeypatch):
+    monkeypatch.setenv("POWER_CONCURRENCY", "8")
+    pool = ForecastPool(workers=2, queue_size=8)
+    try:
+        pids = {
+            key: {
+                pool.submit(_worker_pid, key=key).result(timeout=120) for _ in range(3)
+            }
+            for key in ("222_457", "223_457", "224_457", "225_457")
+        }
+        limit = pool.submit(_power_limit).result(timeout=120)
+    finally:
+        pool.shutdown(wait=True)
+    # mỗi key luôn về 1 worker, các key được rải trên cả 2 worker
+    assert all(len(found) == 1 for found in pids.values())
+    assert len(set.union(*pids.values())) == 2
+    # POWER_CONCURRENCY của cả app chia cho 2 worker
+    assert limit == 4
+
+
+def test_shutdown_after_bootstrap_does_not_hang():
+    pool = ForecastPool(workers=1, queue_size=0)
+    means, samples = pool.submit(_bootstrap_in_worker).result(timeout=120)
+    assert means == (2, 24, 2)
+    assert samples[1:] == (24, 2)
+    # worker phải thoát được khi join (không còn process pool lồng bên trong)
+    closer = threading.Thread(target=pool.shutdown, kwargs={"wait": True})
+    closer.start()
+    closer.join(timeout=60)
+    assert not closer.is_alive()
+
+
+def _wait_idle(pool: ForecastPool, timeout: float = 60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        stats = pool.stats()
+        if stats["pending"] == 0 and stats["orphaned"] == 0:
+            return
+        time.sleep(0.05)
+    raise AssertionError(f"pool still busy: {pool.stats()}")
+
+
+def test_queue_full_raises_busy():
+    pool = ForecastPool(workers=1, queue_size=1, timeout=60)
+    try:
+        futures = [pool.submit(time.sleep, 0.5) for _ in range(2)]
+        with pytest.raises(PoolBusyError):
+            pool.submit(time.sleep, 0.5)
+        for future in futures:
+            future.result(timeout=60)
+        _wait_idle(pool)
+        # slot đã trả -> nhận request mới
+        assert pool.submit(_worker_pid).result(timeout=60) > 0
+    finally:
+        pool.shutdown(wait=True)
+
+
+def test_timeout_releases_slot():
+    pool = ForecastPool(workers=1, queue_size=0, timeout=60)
+    try:
+        pool.submit(_worker_pid).result(timeout=60)  # khởi động worker trước
+        with pytest.raises(TimeoutError):
+            asyncio.run(pool.run(time.sleep, 1.5, timeout=0.2))
+        # slot trả ngay, task vẫn chạy nốt và được đếm là orphaned
+        assert pool.stats()["pending"] == 0
+        assert pool.stats()["orphaned"] == 1
+        assert pool.submit(_worker_pid).result(timeout=60) > 0
+        _wait_idle(pool)
+    finally:
+        pool.shutdown(wait=True)
+
+
+def test_run_pipeline_maps_busy_and_timeout_to_http(monkeypatch):
+    pool = ForecastPool(workers=1, queue_size=0, timeout=0.2)
+    monkeypatch.setattr(main, "forecast_pool", pool)
+    app = FastAPI()
+
+    @app.get("/sleep")
+    async def sleep(seconds: float):
+        await main.run_pipeline(time.sleep, seconds, key="k")
+        return {}
+
+    try:
+        pool.submit(_worker_pid).result(timeout=60)
+        with TestClient(app) as client:
+            busy = pool.submit(time.sleep, 1)
+            response = client.get("/sleep", params={"seconds": 0})
+            assert response.status_code == 429
+            assert response.headers["retry-after"] == str(main.FORECAST_RETRY_AFTER)
+            busy.result(timeout=60)
+            _wait_idle(pool)
+
+            response = client.get("/sleep", params={"seconds": 1})
+            assert response.status_code == 503
+            assert "retry-after" in response.headers
+            _wait_idle(pool)
+            assert client.get("/sleep", params={"seconds": 0}).status_code == 200
+    finally:
+        pool.shutdown(wait=True)
@@ -0,0 +1,67 @@
+from datetime import datetime, timedelta
+
+import lightgbm as lgb
+import numpy as np
+
+from core.cache import DiskCache
+from core.data_fetcher import region_training_key, training_key
+from core.grid import GridCell
+from core.registry import ModelRegistry
+
+CELL = GridCell(220, 457)
+HYPERPARAMETERS = {"learning_rate": 0.05, "num_leaves": 31}
+
+
+def _booster() -> lgb.Booster:
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(200, 3))
+    y = X[:, 0] + rng.normal(scale=0.1, size=200)
+    return lgb.train({"objective": "regression", "verbose": -1}, lgb.Dataset(X, y), 5)
+
+
+def test_training_key_final_data_is_stable():
+    key = training_key(CELL, datetime(2020, 6, 1))
+    assert key == "220_457:20200601:5:10"
+    assert training_key(CELL, datetime(2020, 6, 1), end_date=datetime(2020, 6, 3)) == (
+        "220_457:20200601-20200603:5:10"
+    )
+
+
+def test_training_key_marks_data_not_final():
+    # window năm trước của ngày này kết thúc sau now - FINAL_DATA_LAG
+    target = datetime.now() + timedelta(days=365)
+    key = training_key(CELL, target)
+    assert f"@{datetime.now():%Y%m%d}" in key
+    assert "@" in region_training_key([CELL], target)
+    assert "@" not in region_training_key([CELL], datetime(2020, 6, 1))
+
+
+def test_model_key_separates_inputs(tmp_path):
+    registry = ModelRegistry(store=DiskCache(str(tmp_path), 1_000_000))
+    base = registry.model_key("a", "T2M", 0.5, HYPERPARAMETERS)
+    assert base == registry.model_key("a", "T2M", 0.5, dict(HYPERPARAMETERS))
+    others = [
+        registry.model_key("b", "T2M", 0.5, HYPERPARAMETERS),
+        registry.model_key("a", "RH2M", 0.5, HYPERPARAMETERS),
+        registry.model_key("a", "T2M", 0.95, HYPERPARAMETERS),
+        registry.model_key("a", "T2M", 0.5, {**HYPERPARAMETERS, "num_leaves": 15}),
+        ModelRegistry(store=registry.store, version=99).model_key(
+            "a", "T2M", 0.5, HYPERPARAMETERS
+        ),
+    ]
+    assert len({base, *others}) == 6
+
+
+def test_registry_round_trip_from_disk(tmp_path):
+    booster = _booster()
+    X = np.random.default_rng(1).normal(size=(10, 3))
+    ModelRegistry(store=DiskCache(str(tmp_path), 1_000_000)).save(
+        "a", "T2M", 0.5, HYPERPARAMETERS, booster
+    )
+
+    # registry mới (RAM trống) đọc lại từ đĩa
+    registry = ModelRegistry(store=DiskCache(str(tmp_path), 1_000_000))
+    assert registry.load("a", "T2M", 0.95, HYPERPARAMETERS) is None
+    loaded = registry.load("a", "T2M", 0.5, HYPERPARAMETERS)
+    np.testing.assert_allclose(loaded.predict(X), booster.predict(X))
+    assert registry.stats()["memory_items"] == 1
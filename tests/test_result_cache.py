@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+import main
+from core.cache import DiskCache
+from core.result_cache import ResultCache, etag_matches, result_key
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(main, "result_cache", ResultCache(ttl=60))
+    builds = []
+
+    async def build():
+        builds.append(1)
+        return JSONResponse({"value": 42})
+
+    app = FastAPI()
+
+    @app.get("/cached")
+    async def cached(request: Request, engine: str = "lightgbm"):
+        return await main.cached_build(request, f"key:{engine}", engine, build)
+
+    with TestClient(app) as client:
+        client.builds = builds
+        yield client
+
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc"', '"abc"')
+    assert etag_matches('"x", "abc"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches(None, '"abc"')
+    assert not etag_matches('"abcd"', '"abc"')
+
+
+def test_result_key_depends_on_every_part():
+    key = result_key("route", cell="1_2", engine="lightgbm")
+    assert key == result_key("route", engine="lightgbm", cell="1_2")
+    assert key != result_key("route", cell="1_2", engine="climatology")
+    assert key != result_key("other", cell="1_2", engine="lightgbm")
+
+
+def test_conditional_get_returns_304(client):
+    first = client.get("/cached")
+    assert first.status_code == 200
+    assert first.json() == {"value": 42}
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"].startswith("max-age=")
+
+    second = client.get("/cached", headers={"If-None-Match": etag})
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["etag"] == etag
+
+    stale = client.get("/cached", headers={"If-None-Match": '"other"'})
+    assert stale.status_code == 200
+    assert stale.headers["etag"] == etag
+    assert len(client.builds) == 1
+
+
+def test_uncached_engine_has_no_etag(client):
+    for _ in range(2):
+        response = client.get("/cached", params={"engine": "bootstrap"})
+        assert response.status_code == 200
+        assert "etag" not in response.headers
+        assert response.headers["cache-control"] == "no-store"
+    assert len(client.builds) == 2
+
+
+def test_concurrent_builds_coalesce_and_disk_tier(tmp_path):
+    cache = ResultCache(ttl=60, store=DiskCache(str(tmp_path), 1_000_000))
+    builds = []
+
+    async def build():
+        builds.append(1)
+        await asyncio.sleep(0.05)
+        return JSONResponse({"value": 1})
+
+    async def run():
+        return await asyncio.gather(
+            *(cache.get_or_build_async("k", build) for _ in range(5))
+        )
+
+    entries = asyncio.run(run())
+    assert len(builds) == 1
+    assert len({entry.etag for entry in entries}) == 1
+
+    # cache mới (RAM trống) đọc entry từ tầng đĩa
+    entry = ResultCache(ttl=60, store=DiskCache(str(tmp_path), 1_000_000)).get("k")
+    assert entry.body == entries[0].body
+    assert entry.etag == entries[0].etag
+    assert entry.media_type == "application/json"
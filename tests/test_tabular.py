@@ -0,0 +1,51 @@
+import io
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from core.tabular import METADATA_KEY, frame_to_bytes
+
+METADATA = {
+    "place": "Hà Nội",
+    "cell": {"key": "220_457"},
+    "date": datetime(2025, 10, 5),
+}
+
+
+def _ci_df() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "datetime": pd.date_range("2025-10-05", periods=25, freq="h"),
+            "T2M": np.linspace(20, 30, 25),
+            "T2M_low_90": np.linspace(18, 28, 25).astype(np.float32),
+            "T2M_high_90": np.linspace(22, 32, 25),
+        }
+    )
+
+
+def _read(data: bytes, format: str) -> pa.Table:
+    if format == "arrow":
+        return pa.ipc.open_stream(data).read_all()
+    return pq.read_table(io.BytesIO(data))
+
+
+@pytest.mark.parametrize("format", ["arrow", "parquet"])
+def test_table_round_trip(format):
+    df = _ci_df()
+    table = _read(frame_to_bytes(df, format, METADATA), format)
+
+    pd.testing.assert_frame_equal(table.to_pandas(), df, check_freq=False)
+    metadata = json.loads(table.schema.metadata[METADATA_KEY])
+    assert metadata == {**METADATA, "date": "2025-10-05 00:00:00"}
+
+
+def test_table_without_metadata_and_unknown_format():
+    table = _read(frame_to_bytes(_ci_df(), "arrow"), "arrow")
+    assert METADATA_KEY not in (table.schema.metadata or {})
+    with pytest.raises(ValueError):
+        frame_to_bytes(_ci_df(), "csv")